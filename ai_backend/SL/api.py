@@ -1,14 +1,28 @@
 # trinetra-ai-backend/api.py
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 import joblib
+import numpy as np
 import pandas as pd
 import os
+import sys
+import time
 import uvicorn
 import traceback
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.live_feed import LiveFeed, MAX_BUFFER
+from common.drift import DriftMonitor
+from common.request_profiler import RequestProfiler
+from common.cpu_budget import cpu_budget
+from explain import RiskExplainer, MAX_EXPLAIN_MS
+from rules import RuleCascade, RULES_PATH
+from vocabulary import (categorical_dtypes, prepare_features, vocabulary_from_pipeline,
+                        window_features, WINDOW_FEATURES)
+
 app = FastAPI(
     title="Trinetra Cyber Range AI Backend",
     description="A simple API to demonstrate AI-powered threat risk scoring."
@@ -30,11 +44,31 @@ app.add_middleware(
 
 # Global variable for model
 model_pipeline = None
+explainer = None
+feature_dtypes = None
+drift_monitor = None
+rule_cascade = None
+activity_windows = None
 model_path = 'random_forest_model.pkl'
+drift_baseline_path = 'drift_baseline.pkl'
+rules_path = RULES_PATH
+
+RULE_DETAILS = {
+    "high_risk": "Known high-risk alert type (rule cascade)",
+    "benign": "Known benign alert type (rule cascade)",
+    "severity": "High-severity alert matching a risk rule (rule cascade)",
+}
+
+# Server-push feed of scored alerts
+risk_feed = LiveFeed("risk")
+
+# Opt-in per-request profiling (TRINETRA_PROFILING / TRINETRA_PROFILE_SAMPLE)
+profiler = RequestProfiler.from_env("sl", model_path)
+profiler.install(app)
 
 def load_model():
     """Loads the trained model from disk."""
-    global model_pipeline
+    global model_pipeline, explainer, feature_dtypes, drift_monitor, rule_cascade, activity_windows
     if not os.path.exists(model_path):
         raise FileNotFoundError(
             f"Model file '{model_path}' not found. Please run train_model.py first"
@@ -42,8 +76,24 @@ def load_model():
     
     print(f"[*] Loading model from '{model_path}'...")
     model_pipeline = joblib.load(model_path)
+    # Older models were saved with n_jobs=-1; workers now come from the CPU budget per request
+    model_pipeline.named_steps["classifier"].n_jobs = None
+    explainer = RiskExplainer(model_pipeline)
+    feature_dtypes = categorical_dtypes(vocabulary_from_pipeline(model_pipeline))
     print("[+] Model loaded successfully")
 
+    if not os.path.exists(rules_path):
+        print(f"[!] Rule table '{rules_path}' not found, the cascade only uses the fixed high-risk rules")
+    rule_cascade = RuleCascade.load(rules_path)
+    # Activity windows start empty and fill with the alerts this worker scores
+    activity_windows = window_features()
+
+    baseline = DriftMonitor.load(drift_baseline_path)
+    if baseline is None:
+        print(f"[!] Drift baseline '{drift_baseline_path}' not found, drift monitoring disabled")
+    else:
+        drift_monitor = baseline.fresh()
+
 # Pydantic model
 class AlertInput(BaseModel):
     alert_type_description: str
@@ -57,6 +107,7 @@ class AlertInput(BaseModel):
     logon_hour: int
     day_of_week: str
     agent_os: str
+    timestamp: Optional[float] = None  # epoch seconds; default: time of arrival
 
     class Config:
         schema_extra = {
@@ -81,45 +132,88 @@ async def startup_event():
     load_model()
 
 @app.post("/predict_risk/")
-async def predict_risk(alerts: List[AlertInput]):
+@profiler.profiled
+async def predict_risk(alerts: List[AlertInput], explain: bool = False, top_k: int = 3,
+                       max_explain_ms: float = MAX_EXPLAIN_MS, cascade: bool = True):
     """
     Batch prediction: Accepts a list of alerts and returns risk scores.
+    Alert types the rules cover (rules.py) are decided without the model
+    unless cascade=false; decided_by says which stage answered each alert.
+    With explain=true, each result also lists the top_k input fields that moved
+    its risk score most (None for alerts left once max_explain_ms is spent);
+    top_k below 1 is a 400. Every alert, rule-decided or not, is counted in
+    the activity windows of its src_ip / username, which the model sees as
+    features.
     """
     if model_pipeline is None:
         raise HTTPException(status_code=500, detail="Model not loaded. Server startup failed.")
+    if top_k < 1:
+        raise HTTPException(status_code=400, detail=f"top_k must be at least 1, got {top_k}")
 
     try:
-        # Convert input to DataFrame
+        start = time.perf_counter()
         input_data = [alert.dict() for alert in alerts]
-        input_df = pd.DataFrame(input_data)
+        window_values = activity_windows.update(input_data, [alert.timestamp for alert in alerts])
+        if cascade:
+            decisions, ambiguous = rule_cascade.split(alerts)
+        else:
+            decisions, ambiguous = [None] * len(alerts), list(range(len(alerts)))
+
+        predictions = np.zeros(len(alerts), dtype=bool)
+        confidence_scores = np.zeros(len(alerts))
+        for i, decision in enumerate(decisions):
+            if decision is not None:
+                predictions[i], confidence_scores[i] = decision[0], decision[1] / 100
+        explanations = [None] * len(alerts)
 
-        # Ensure consistent dtypes
-        categorical_features = [
-            "alert_type_description", "src_ip", "username",
-            "dest_ip", "process", "file_name", "agent_os",
-            "day_of_week", "port"
-        ]
-        numerical_features = ["severity", "logon_hour"]
+        if ambiguous:
+            model_start = time.perf_counter()
+            # Convert the alerts left for the model to a DataFrame
+            input_df = pd.DataFrame([input_data[i] for i in ambiguous])
+            input_df[WINDOW_FEATURES] = window_values[ambiguous]
 
-        for col in categorical_features:
-            input_df[col] = input_df[col].astype(str).fillna("missing")
+            # Same compact dtypes as training: vocabulary categoricals, downcast numerics
+            # (explanations quote the raw values, so values outside the vocabulary stay readable)
+            raw_df = input_df.copy() if explain else None
+            input_df = prepare_features(input_df, feature_dtypes)
 
-        for col in numerical_features:
-            input_df[col] = pd.to_numeric(input_df[col], errors="coerce")
+            # Predict (transform once, shared with the explainer) on this request's share of the CPU budget
+            with cpu_budget().allocate("predict_risk"):
+                X_transformed = model_pipeline.named_steps["preprocessor"].transform(input_df)
+                classifier = model_pipeline.named_steps["classifier"]
+                probabilities = classifier.predict_proba(X_transformed)
+                predictions[ambiguous] = classifier.classes_[probabilities.argmax(axis=1)].astype(bool)
+                confidence_scores[ambiguous] = probabilities[:, 1]
+                rule_cascade.record_model(len(ambiguous), (time.perf_counter() - model_start) * 1e3)
+                if explain:
+                    for i, explanation in zip(ambiguous, explainer.explain(raw_df, X_transformed, top_k, max_explain_ms)):
+                        explanations[i] = explanation
 
-        # Predict
-        predictions = model_pipeline.predict(input_df)
-        confidence_scores = model_pipeline.predict_proba(input_df)[:, 1]
+        if drift_monitor is not None:
+            drift_monitor.update(input_data, confidence_scores * 100, (time.perf_counter() - start) * 1e3)
 
         # Build response
         results = []
         for i, alert in enumerate(alerts):
+            decision = decisions[i]
             results.append({
                 "alert_type_description": alert.alert_type_description,
                 "is_high_risk": bool(predictions[i]),
                 "risk_score": round(confidence_scores[i] * 100, 2),
-                "details": "Prediction made by the AI Risk Scoring Engine"
+                "details": "Prediction made by the AI Risk Scoring Engine" if decision is None else RULE_DETAILS[decision[2]],
+                "decided_by": "model" if decision is None else "rules"
             })
+            if explain:
+                results[-1]["explanation"] = explanations[i] if decision is None else [
+                    {"field": "alert_type_description", "value": alert.alert_type_description, "rule": decision[2]}
+                ]
+
+        if risk_feed.has_subscribers:
+            scored_at = time.time()
+            risk_feed.publish([
+                {**result, "src_ip": alert.src_ip, "username": alert.username, "scored_at": scored_at}
+                for alert, result in zip(alerts, results)
+            ])
 
         return results
 
@@ -128,12 +222,85 @@ async def predict_risk(alerts: List[AlertInput]):
         raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
 
 @app.post("/predict_single/")
-async def predict_single(alert: AlertInput):
+@profiler.profiled
+async def predict_single(alert: AlertInput, explain: bool = False, top_k: int = 3, cascade: bool = True):
     """
     Single prediction: Accepts one alert and returns a risk score.
     """
-    result = await predict_risk([alert])
+    result = await predict_risk([alert], explain=explain, top_k=top_k, cascade=cascade)
     return result[0]
 
+@app.get("/explain/stats/")
+async def explain_stats():
+    """Explanation volume, cache hits and mean added latency."""
+    if explainer is None:
+        raise HTTPException(status_code=500, detail="Model not loaded. Server startup failed.")
+    stats = dict(explainer.stats)
+    calls = stats["explained"] + stats["skipped"]
+    stats["mean_ms_per_alert"] = stats["total_ms"] / calls if calls else 0.0
+    return stats
+
+@app.get("/cascade/stats/")
+async def cascade_stats():
+    """
+    Alerts decided by the rules vs the model, the share short-circuited and the
+    model time saved (estimated from a fit of the model's measured cost per batch).
+    """
+    if rule_cascade is None:
+        raise HTTPException(status_code=500, detail="Model not loaded. Server startup failed.")
+    return rule_cascade.report()
+
+@app.get("/windows/stats/")
+async def windows_stats():
+    """Alerts folded into the activity windows, entities tracked per field and evictions."""
+    if activity_windows is None:
+        raise HTTPException(status_code=500, detail="Model not loaded. Server startup failed.")
+    return activity_windows.report()
+
+@app.get("/cpu/stats/")
+async def cpu_stats():
+    """CPU budget of this worker: cores in use, and allocations and wait times per call."""
+    return cpu_budget().stats()
+
+@app.get("/drift/")
+async def drift(reset: bool = False):
+    """
+    Serving traffic vs the training baseline: heavy hitters and distance per
+    categorical field, PSI and quantiles per numeric field and the risk score.
+    reset=true starts a new comparison window after reporting.
+    """
+    global drift_monitor
+    if drift_monitor is None:
+        raise HTTPException(status_code=404, detail="No drift baseline. Run train_model.py first.")
+    report = drift_monitor.compare()
+    if reset:
+        drift_monitor = drift_monitor.baseline.fresh()
+    return report
+
+@app.get("/stream/risk/")
+async def stream_risk(request: Request, policy: str = "drop_oldest", high_risk_only: bool = False,
+                      max_buffer: int = MAX_BUFFER):
+    """
+    Server-Sent Events stream of alerts as they are scored by /predict_risk/.
+    Overflow policy per client: drop_oldest, drop_newest or coalesce (latest per src_ip).
+    max_buffer (events buffered for this client) is 1 to MAX_BUFFER; anything else is a 400.
+    """
+    try:
+        subscriber = risk_feed.subscribe(
+            policy, max_buffer, key="src_ip",
+            accept=(lambda event: event["is_high_risk"]) if high_risk_only else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        risk_feed.stream(subscriber, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/stream/stats/")
+async def stream_stats():
+    return risk_feed.stats()
+
 if __name__ == "__main__":
     uvicorn.run("api:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
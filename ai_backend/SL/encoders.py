@@ -0,0 +1,65 @@
+"""
+Encoders used inside the SL model pipeline.
+
+CategoryCodeEncoder one-hot encodes pandas categorical codes against the fixed
+vocabulary from vocabulary.py (missing -> 'missing', unknown values -> all
+zeros, like SimpleImputer('missing') + OneHotEncoder(handle_unknown='ignore')).
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.base import BaseEstimator, TransformerMixin
+from vocabulary import MISSING
+
+
+class CategoryCodeEncoder(BaseEstimator, TransformerMixin):
+    """Sparse one-hot encoding built from categorical codes against a fixed vocabulary."""
+
+    def __init__(self, vocabulary=None):
+        self.vocabulary = vocabulary
+
+    def fit(self, X, y=None):
+        X = pd.DataFrame(X)
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        self.n_features_in_ = X.shape[1]
+        self.categories_ = [
+            np.asarray(self.vocabulary[col] if self.vocabulary else sorted(X[col].dropna().astype(str).unique()),
+                       dtype=object)
+            for col in X.columns
+        ]
+        self.offsets_ = np.concatenate([[0], np.cumsum([len(c) for c in self.categories_])])
+        return self
+
+    def _codes(self, column: pd.Series, categories: np.ndarray) -> np.ndarray:
+        if isinstance(column.dtype, pd.CategoricalDtype) and column.cat.categories.equals(pd.Index(categories)):
+            # Already prepared: missing is a category, NaN (code -1) means unknown
+            return column.cat.codes.to_numpy()
+        codes = pd.Categorical(column.astype(str), categories=categories).codes
+        # Missing values take the 'missing' category, as SimpleImputer(constant) did
+        missing = np.flatnonzero(categories == MISSING)
+        if len(missing):
+            codes = np.where(column.isna().to_numpy(), missing[0], codes)
+        return codes
+
+    def transform(self, X):
+        X = pd.DataFrame(X, columns=self.feature_names_in_) if not isinstance(X, pd.DataFrame) else X
+        n, n_columns = len(X), len(self.categories_)
+        # At most one non-zero per input column, so the CSR arrays are built directly
+        indices = np.empty((n, n_columns), dtype=np.int32)
+        for j, (col, categories) in enumerate(zip(self.feature_names_in_, self.categories_)):
+            indices[:, j] = self._codes(X[col], categories)
+        known = indices >= 0
+        indices += self.offsets_[:-1].astype(np.int32)
+        if known.all():
+            indices = indices.ravel()
+            indptr = np.arange(0, n * n_columns + 1, n_columns)
+        else:
+            indices = indices[known]
+            indptr = np.concatenate([[0], np.cumsum(known.sum(axis=1))])
+        data = np.ones(len(indices), dtype=np.float64)
+        return sparse.csr_matrix((data, indices, indptr), shape=(n, int(self.offsets_[-1])))
+
+    def get_feature_names_out(self, input_features=None):
+        return np.asarray([f"{col}_{value}" for col, categories in zip(self.feature_names_in_, self.categories_)
+                           for value in categories], dtype=object)
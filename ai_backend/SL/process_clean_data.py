@@ -1,6 +1,8 @@
 import pandas as pd 
 import os 
 import re 
+from vocabulary import NUMERICAL_FEATURES, downcast_numeric, window_features
+from rules import HIGH_RISK_RULES, SEVERITY_CONDITIONS
 
 def process_clean_data(input_file='security_events_10000.csv', output_file='cleaned_data.csv'):
     
@@ -18,16 +20,9 @@ def process_clean_data(input_file='security_events_10000.csv', output_file='clea
 
     df['is_high_risk'] = 0
 
-    high_risk_rules = [
-        'Malware detected',
-        'User privilege escalation detected',
-        "Multiple failed SSH login attempts",
-        "Multiple failed RDP login attempts",
-        'Suspicious outbound network traffic'
-    ]
-
-    df.loc[df['rule_description'].isin(high_risk_rules), 'is_high_risk'] = 1
-    df.loc[(df['rule_description'].str.contains('Malware', na=False)) & (df['severity'] > 8), 'is_high_risk'] = 1
+    df.loc[df['rule_description'].isin(HIGH_RISK_RULES), 'is_high_risk'] = 1
+    for word, min_severity in SEVERITY_CONDITIONS:
+        df.loc[(df['rule_description'].str.contains(word, na=False)) & (df['severity'] >= min_severity), 'is_high_risk'] = 1
     print(df['is_high_risk'].value_counts(normalize=True))
     
     # Simulate false positives
@@ -61,30 +56,21 @@ def process_clean_data(input_file='security_events_10000.csv', output_file='clea
     df['agent_os'] = 'Unknown'
     df.loc[df['agent_name'].str.contains('WIN', case=False, na=False), 'agent_os'] = 'Windows'
     df.loc[df['agent_name'].str.contains('LINUX', case=False, na=False), 'agent_os'] = 'Linux'
+
+    # --- Activity windows per src_ip / username (over the whole history, in time order) ---
+    print("[*] Computing per-entity activity windows...")
+    windows = window_features()
+    df = df.join(windows.update_frame(df, df['timestamp']))
+    print(f"[+] {len(windows.feature_names)} window features added")
     
     # --- Rename after extraction ---
     df.rename(columns={'rule_description': 'alert_type_description'}, inplace=True)
 
-    # --- Enforce data types (AFTER renaming) ---
-    print("[*] Ensuring all feature columns have the correct data type...")
-
-    new_dtypes = {
-        'alert_type_description': 'string',
-        'src_ip': 'string',
-        'username': 'string',
-        'dest_ip': 'string',
-        'process': 'string',
-        'file_name': 'string',
-        'port': 'string',
-        'day_of_week': 'category',
-        'agent_os': 'category',
-        'severity': 'int64',
-        'logon_hour': 'int64'
-    }
-
-    for col, dtype in new_dtypes.items():
-        if col in df.columns:
-            df[col] = df[col].astype(dtype, errors='ignore')
+    # --- Compact numeric types (the vocabulary comes from the training split, in train_model) ---
+    print("[*] Downcasting numeric columns...")
+    for col in NUMERICAL_FEATURES:
+        df[col] = downcast_numeric(df[col])
+    df['is_high_risk'] = df['is_high_risk'].astype('int8')
 
     # --- Drop unused columns ---
     df = df.drop(columns=['event_data', 'alert_id', 'agent_id', 'agent_name', 'rule_id', 'timestamp'])
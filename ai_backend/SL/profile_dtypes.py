@@ -0,0 +1,152 @@
+"""
+Memory / speed profile of the compact SL dtypes against the legacy object-string path.
+
+Builds a synthetic cleaned dataset (default 10M rows) from the saved vocabulary,
+then for both representations reports the DataFrame footprint, the time of
+the dtype preparation step the API and trainer run, and the preprocessor
+transform time and peak memory.
+
+Usage:
+    python profile_dtypes.py --rows 10000000
+"""
+
+import os
+import time
+import argparse
+import tracemalloc
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import OneHotEncoder
+from vocabulary import (
+    VOCAB_PATH, CATEGORICAL_FEATURES, NUMERICAL_FEATURES, WINDOW_FEATURES, MISSING,
+    categorical_dtypes, load_vocabulary, prepare_features
+)
+from encoders import CategoryCodeEncoder
+
+FIT_ROWS = 100_000
+OUTPUT_FILE = 'dtype_profile.csv'
+
+
+def synthetic_vocabulary() -> dict:
+    sizes = {'src_ip': 5000, 'username': 500, 'dest_ip': 2000, 'file_name': 1000, 'port': 200}
+    return {col: sorted({f"{col}_{i}" for i in range(sizes.get(col, 20))} | {MISSING})
+            for col in CATEGORICAL_FEATURES}
+
+
+def generate_codes(n_rows: int, vocabulary: dict, seed: int = 42) -> dict:
+    """Zipf-like category codes per column plus numeric columns."""
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for col in CATEGORICAL_FEATURES:
+        n_values = len(vocabulary[col])
+        weights = 1.0 / np.arange(1, n_values + 1)
+        columns[col] = rng.choice(n_values, size=n_rows, p=weights / weights.sum()).astype(np.int32)
+    columns['severity'] = rng.integers(1, 11, size=n_rows)
+    columns['logon_hour'] = rng.integers(-1, 24, size=n_rows)
+    for col in WINDOW_FEATURES:
+        columns[col] = rng.poisson(3, size=n_rows)
+    return columns
+
+
+def legacy_frame(codes: dict, vocabulary: dict) -> pd.DataFrame:
+    """What the old CSV round trip produced: object strings and int64."""
+    df = pd.DataFrame({col: np.asarray(vocabulary[col], dtype=object)[codes[col]] for col in CATEGORICAL_FEATURES})
+    for col in NUMERICAL_FEATURES:
+        df[col] = codes[col].astype(np.int64)
+    return df
+
+
+def compact_frame(codes: dict, vocabulary: dict) -> pd.DataFrame:
+    dtypes = categorical_dtypes(vocabulary)
+    df = pd.DataFrame({col: pd.Categorical.from_codes(codes[col], dtype=dtypes[col]) for col in CATEGORICAL_FEATURES})
+    for col in NUMERICAL_FEATURES:
+        df[col] = pd.to_numeric(codes[col], downcast='integer')
+    return df
+
+
+def legacy_preprocessor() -> ColumnTransformer:
+    return ColumnTransformer(transformers=[
+        ('num', Pipeline(steps=[('imputer', SimpleImputer(strategy='median'))]), NUMERICAL_FEATURES),
+        ('cat', Pipeline(steps=[
+            ('imputer', SimpleImputer(strategy='constant', fill_value='missing')),
+            ('onehot', OneHotEncoder(handle_unknown='ignore'))
+        ]), CATEGORICAL_FEATURES)
+    ])
+
+
+def compact_preprocessor(vocabulary: dict) -> ColumnTransformer:
+    return ColumnTransformer(transformers=[
+        ('num', Pipeline(steps=[('imputer', SimpleImputer(strategy='median'))]), NUMERICAL_FEATURES),
+        ('cat', Pipeline(steps=[('onehot', CategoryCodeEncoder(vocabulary))]), CATEGORICAL_FEATURES)
+    ])
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 2**20
+
+
+def profile(n_rows: int, vocab_path: str = VOCAB_PATH) -> pd.DataFrame:
+    if os.path.exists(vocab_path):
+        vocabulary = load_vocabulary(vocab_path)
+        print(f"[*] Using vocabulary from '{vocab_path}'")
+    else:
+        vocabulary = synthetic_vocabulary()
+        print("[*] No vocabulary file found, using a synthetic one")
+
+    print(f"[*] Generating {n_rows:,} rows...")
+    codes = generate_codes(n_rows, vocabulary)
+    dtypes = categorical_dtypes(vocabulary)
+    rows = []
+
+    for name, build_frame, build_preprocessor, prepare in (
+        ("legacy", legacy_frame, lambda: legacy_preprocessor(),
+         lambda df: df.assign(**{col: df[col].astype(str) for col in CATEGORICAL_FEATURES})),
+        ("compact", compact_frame, lambda: compact_preprocessor(vocabulary),
+         lambda df: prepare_features(df, dtypes)),
+    ):
+        print(f"[*] Profiling {name} dtypes...")
+        df = build_frame(codes, vocabulary)
+        footprint = df.memory_usage(deep=True).sum() / 2**20
+        df, prepare_seconds, prepare_peak = measure(lambda: prepare(df))
+
+        preprocessor = build_preprocessor().fit(df.iloc[:FIT_ROWS])
+        X, transform_seconds, transform_peak = measure(lambda: preprocessor.transform(df))
+        rows.append({
+            "dtypes": name,
+            "rows": n_rows,
+            "frame_mib": footprint,
+            "prepare_s": prepare_seconds,
+            "prepare_peak_mib": prepare_peak,
+            "transform_s": transform_seconds,
+            "transform_peak_mib": transform_peak,
+            "nnz": X.nnz if hasattr(X, "nnz") else int(np.count_nonzero(X)),
+        })
+        del df, X
+
+    report = pd.DataFrame(rows).set_index("dtypes")
+    report.loc["reduction_x"] = report.loc["legacy"].div(report.loc["compact"])
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile compact vs legacy SL dtypes")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--vocab", default=VOCAB_PATH)
+    args = parser.parse_args()
+
+    report = profile(args.rows, args.vocab)
+    report.to_csv(OUTPUT_FILE)
+    print("\n=== SL dtype profile ===")
+    with pd.option_context("display.width", 200, "display.max_columns", None,
+                           "display.float_format", "{:.2f}".format):
+        print(report)
+    print(f"[+] Profile saved to '{OUTPUT_FILE}'")
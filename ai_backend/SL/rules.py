@@ -0,0 +1,175 @@
+"""
+Deterministic risk rules and the rule cascade in front of the risk model.
+
+The same rules label the training data (process_clean_data) and short-circuit
+scoring (api.py), so they are defined once here:
+
+    HIGH_RISK_RULES      alert types that are always high risk
+    SEVERITY_CONDITIONS  (substring of the alert type, minimum severity):
+                         matching alerts are high risk at any type
+
+train_model adds the alert types that are (almost) never high risk in the
+training data and saves the compiled table to risk_rules.json; edit that file
+to move types in or out of either list. At scoring time an alert is decided
+by one dict lookup (conditions first) and only alerts the rules do not cover
+go through the preprocessor and the RandomForest. Only the standard library
+is imported here, so cleaning stays as light as before.
+"""
+
+import os
+import json
+import time
+import threading
+
+RULES_PATH = 'risk_rules.json'
+
+HIGH_RISK_RULES = [
+    'Malware detected',
+    'User privilege escalation detected',
+    'Multiple failed SSH login attempts',
+    'Multiple failed RDP login attempts',
+    'Suspicious outbound network traffic'
+]
+SEVERITY_CONDITIONS = [('Malware', 9)]
+
+# A type is known-benign when at most this share of its training alerts
+# (outside the severity conditions) is high risk, over at least MIN_SUPPORT alerts
+BENIGN_MAX_RATE = 0.02
+MIN_SUPPORT = 100
+
+HIGH_RISK = 'high_risk'
+BENIGN = 'benign'
+
+
+def build_rules(alert_types, severities, labels) -> dict:
+    """
+    Rule table from labelled alerts: the fixed high-risk types, the severity
+    conditions and the types observed as benign. Risk scores are the observed
+    high-risk rates (in percent), i.e. what a calibrated model would return.
+    """
+    counts = {}
+    for alert_type, severity, label in zip(alert_types, severities, labels):
+        alert_type = str(alert_type)
+        if any(word in alert_type and severity >= min_severity for word, min_severity in SEVERITY_CONDITIONS):
+            continue
+        n, high = counts.get(alert_type, (0, 0))
+        counts[alert_type] = (n + 1, high + int(label))
+
+    high_risk = {t: round(100.0 * counts[t][1] / counts[t][0], 2) if t in counts else 100.0
+                 for t in HIGH_RISK_RULES}
+    benign = {t: round(100.0 * high / n, 2) for t, (n, high) in sorted(counts.items())
+              if t not in high_risk and n >= MIN_SUPPORT and high / n <= BENIGN_MAX_RATE}
+    return {
+        HIGH_RISK: high_risk,
+        BENIGN: benign,
+        "conditions": [{"contains": word, "min_severity": s, "risk_score": 100.0} for word, s in SEVERITY_CONDITIONS],
+    }
+
+
+def save_rules(rules: dict, path: str = RULES_PATH):
+    with open(path, 'w') as f:
+        json.dump(rules, f, indent=2)
+    print(f"[+] Risk rules saved to '{path}' ({len(rules[HIGH_RISK])} high-risk, {len(rules[BENIGN])} benign types)")
+
+
+def load_rules(path: str = RULES_PATH) -> dict:
+    """Saved rule table, or the fixed high-risk rules alone when there is none."""
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return build_rules([], [], [])
+
+
+class RuleCascade:
+    """
+    Resolves alerts the rules cover; the rest are left for the model.
+    Keeps the share short-circuited and a running linear fit of the model's
+    cost per batch (fixed + per-alert ms) to estimate the latency saved.
+    """
+
+    def __init__(self, rules: dict):
+        self.table = {}
+        for kind in (BENIGN, HIGH_RISK):  # high risk wins if a type is listed twice
+            for alert_type, score in rules.get(kind, {}).items():
+                self.table[alert_type] = (kind == HIGH_RISK, float(score), kind)
+        self.conditions = [(c["contains"], c["min_severity"], float(c.get("risk_score", 100.0)))
+                           for c in rules.get("conditions", [])]
+        self.stats = {"batches": 0, "alerts": 0, HIGH_RISK: 0, BENIGN: 0, "model": 0,
+                      "cascade_ms": 0.0, "model_batches": 0, "model_ms": 0.0, "saved_ms": 0.0}
+        self._fit = [0.0] * 5  # sums of n, n^2, ms, n*ms and the number of model calls
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str = RULES_PATH) -> "RuleCascade":
+        return cls(load_rules(path))
+
+    def decide(self, alert_type: str, severity: int):
+        """(is_high_risk, risk_score, rule) for a covered alert, else None."""
+        for word, min_severity, score in self.conditions:
+            if word in alert_type and severity >= min_severity:
+                return True, score, "severity"
+        return self.table.get(alert_type)
+
+    def split(self, alerts: list) -> tuple:
+        """Rule decisions per alert (None = ambiguous) and the indices left for the model."""
+        start = time.perf_counter()
+        decisions = [self.decide(alert.alert_type_description, alert.severity) for alert in alerts]
+        ambiguous = [i for i, decision in enumerate(decisions) if decision is None]
+        elapsed_ms = (time.perf_counter() - start) * 1e3
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["alerts"] += len(alerts)
+            self.stats["model"] += len(ambiguous)
+            for decision in decisions:
+                if decision is not None:
+                    self.stats[BENIGN if not decision[0] else HIGH_RISK] += 1
+            self.stats["cascade_ms"] += elapsed_ms
+            self.stats["saved_ms"] += self._model_cost(len(alerts)) - self._model_cost(len(ambiguous)) - elapsed_ms
+        return decisions, ambiguous
+
+    def record_model(self, n_alerts: int, elapsed_ms: float):
+        """Time the model took for a batch (its ambiguous alerts, or all of it with the cascade off)."""
+        with self._lock:
+            self.stats["model_batches"] += 1
+            self.stats["model_ms"] += elapsed_ms
+            fit = self._fit
+            fit[0] += n_alerts
+            fit[1] += n_alerts * n_alerts
+            fit[2] += elapsed_ms
+            fit[3] += n_alerts * elapsed_ms
+            fit[4] += 1
+
+    def _coefficients(self) -> tuple:
+        """(fixed ms per call, ms per alert) from the model calls seen so far (caller holds the lock)."""
+        sum_n, sum_nn, sum_ms, sum_n_ms, calls = self._fit
+        if calls == 0:
+            return None
+        denominator = calls * sum_nn - sum_n * sum_n
+        if denominator <= 0:
+            # One batch size seen so far: count it all as fixed cost (a lower bound on the saving)
+            return sum_ms / calls, 0.0
+        per_alert = max((calls * sum_n_ms - sum_n * sum_ms) / denominator, 0.0)
+        fixed = (sum_ms - per_alert * sum_n) / calls
+        if fixed < 0:
+            return 0.0, sum_n_ms / sum_nn
+        return fixed, per_alert
+
+    def _model_cost(self, n_alerts: int) -> float:
+        coefficients = self._coefficients()
+        if coefficients is None or n_alerts == 0:
+            return 0.0
+        fixed, per_alert = coefficients
+        return max(fixed + per_alert * n_alerts, 0.0)
+
+    def report(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            coefficients = self._coefficients()
+        resolved = stats[HIGH_RISK] + stats[BENIGN]
+        stats["short_circuited"] = resolved
+        stats["short_circuit_fraction"] = resolved / stats["alerts"] if stats["alerts"] else 0.0
+        stats["model_fixed_ms"], stats["model_ms_per_alert"] = coefficients if coefficients else (None, None)
+        stats["rules"] = {HIGH_RISK: sum(v[0] for v in self.table.values()),
+                          BENIGN: sum(not v[0] for v in self.table.values()),
+                          "conditions": len(self.conditions)}
+        return stats
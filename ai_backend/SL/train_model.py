@@ -1,42 +1,61 @@
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import OneHotEncoder
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 from sklearn.metrics import accuracy_score, classification_report
 from sklearn.impute import SimpleImputer
 import joblib
 import os
+import sys
+from vocabulary import (
+    VOCAB_PATH, CATEGORICAL_FEATURES, NUMERICAL_FEATURES,
+    build_vocabulary, save_vocabulary, categorical_dtypes, prepare_features, read_cleaned_csv
+)
+from encoders import CategoryCodeEncoder
+from rules import RULES_PATH, build_rules, save_rules
 
-def train_model(data_path='cleaned_data.csv', model_output_path='random_forest_model.pkl'):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.drift import DriftMonitor
+from common.cpu_budget import cpu_budget
+
+# Fields whose serving distribution api.py compares against the training data
+DRIFT_CATEGORICAL = ['src_ip', 'username', 'alert_type_description', 'dest_ip', 'agent_os']
+DRIFT_NUMERIC = ['severity', 'logon_hour']
+
+def train_model(data_path='cleaned_data.csv', model_output_path='random_forest_model.pkl',
+                vocab_path=VOCAB_PATH, drift_baseline_path='drift_baseline.pkl',
+                rules_path=RULES_PATH):
     # --- Load cleaned data ---
     if not os.path.exists(data_path):
         print(f"ERROR: File '{data_path}' does not exist")
         return 
-    
+
     print(f"[*] Loading cleaned data from '{data_path}'...")
-    df = pd.read_csv(data_path)
-    print(f"[*] Data loaded successfully: {len(df)} rows")
+    df = read_cleaned_csv(data_path)
+    print(f"[*] Data loaded successfully: {len(df)} rows "
+          f"({df.memory_usage(deep=True).sum() / 2**20:.1f} MiB in memory)")
 
     # --- Separate features and target ---
     X = df.drop('is_high_risk', axis=1)
     y = df['is_high_risk']
 
-    # --- Identify categorical and numerical features ---
-    categorical_features = [
-        'alert_type_description', 'src_ip', 'username',
-        'dest_ip', 'process', 'file_name', 'agent_os',
-        'day_of_week', 'port'
-    ]
-    numerical_features = ['severity', 'logon_hour']
+    # --- Categorical and numerical features (numeric dtypes already fixed by read_cleaned_csv) ---
+    categorical_features = CATEGORICAL_FEATURES
+    numerical_features = NUMERICAL_FEATURES
 
-    # --- Ensure consistent dtypes BEFORE preprocessing ---
-    for col in categorical_features:
-        X[col] = X[col].astype(str).fillna("missing")  # enforce string
+    # --- Train/test split ---
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42, stratify=y
+    )
+    print(f"[*] Data split into {len(X_train)} training and {len(X_test)} testing samples")
 
-    for col in numerical_features:
-        X[col] = pd.to_numeric(X[col], errors="coerce")  # enforce numeric
+    # --- Vocabulary from the training split only (test-only values stay unknown) ---
+    vocabulary = build_vocabulary(X_train)
+    save_vocabulary(vocabulary, vocab_path)
+    dtypes = categorical_dtypes(vocabulary)
+    X_train = prepare_features(X_train.copy(), dtypes)
+    X_test_features = prepare_features(X_test.copy(), dtypes)
 
     # --- Transformers ---
     numerical_transformer = Pipeline(steps=[
@@ -44,8 +63,7 @@ def train_model(data_path='cleaned_data.csv', model_output_path='random_forest_m
     ])
 
     categorical_transformer = Pipeline(steps=[
-        ('imputer', SimpleImputer(strategy='constant', fill_value='missing')), 
-        ('onehot', OneHotEncoder(handle_unknown='ignore'))
+        ('onehot', CategoryCodeEncoder(vocabulary))  # missing -> 'missing', unknown -> ignored
     ])
 
     preprocessor = ColumnTransformer(
@@ -59,25 +77,20 @@ def train_model(data_path='cleaned_data.csv', model_output_path='random_forest_m
     model_pipeline = Pipeline(steps=[
         ('preprocessor', preprocessor),
         ('classifier', RandomForestClassifier(
-            n_estimators=100, random_state=42, n_jobs=-1
+            n_estimators=100, random_state=42  # workers come from the CPU budget
         ))
     ])
 
     print("[*] Preprocessing and model pipeline created")
 
-    # --- Train/test split ---
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
-    print(f"[*] Data split into {len(X_train)} training and {len(X_test)} testing samples")
-
     # --- Train model ---
     print("[*] Training the model...")
-    model_pipeline.fit(X_train, y_train)
-    print("[+] Model training completed")
+    with cpu_budget().allocate("train_model") as allocation:
+        model_pipeline.fit(X_train, y_train)
+        print(f"[+] Model training completed ({allocation.n_jobs} workers)")
 
-    # --- Evaluate ---
-    y_pred = model_pipeline.predict(X_test)
+        # --- Evaluate ---
+        y_pred = model_pipeline.predict(X_test_features)
     accuracy = accuracy_score(y_test, y_pred)
     print(f"[*] Model accuracy on test data: {accuracy:.2f}")
     print("[*] Classification report:\n")
@@ -87,5 +100,15 @@ def train_model(data_path='cleaned_data.csv', model_output_path='random_forest_m
     joblib.dump(model_pipeline, model_output_path)
     print(f"\n[+] Model saved to '{model_output_path}'")
 
+    # --- Drift baseline (held-out alerts as read, like the API's raw requests, and their risk scores) ---
+    baseline = DriftMonitor(DRIFT_CATEGORICAL, DRIFT_NUMERIC, score='risk_score')
+    baseline.update(X_test, model_pipeline.predict_proba(X_test_features)[:, 1] * 100)
+    baseline.save(drift_baseline_path)
+    print(f"[+] Drift baseline saved to '{drift_baseline_path}'")
+
+    # --- Rule cascade (fixed high-risk rules + types benign in the training split) ---
+    save_rules(build_rules(X_train['alert_type_description'].astype(str),
+                           X_train['severity'], y_train), rules_path)
+
 if __name__ == "__main__":
     train_model()
\ No newline at end of file
@@ -0,0 +1,120 @@
+"""
+Fixed categorical vocabulary and compact dtypes for the SL pipeline.
+
+train_model builds the vocabulary from its training split (the test split's
+values stay unknown to the encoder, as they would be to OneHotEncoder) and
+saves it next to the model. It reads the cleaned CSV straight into pandas
+categoricals and small numeric types, and the API converts incoming alerts
+the same way, so the alert fields are never held as Python object strings. Only pandas is
+imported here, so cleaning does not pay for sklearn; the encoder lives in
+encoders.py.
+
+Besides the alert's own fields the model sees per-entity activity windows
+(common/window_features.py): events and distinct destinations per source IP
+and user over the last 1/5/60 minutes. There is no per-agent window: the
+dashboard's alerts carry no agent name, so live alerts would always count 0
+where every training row counts at least 1. window_features() builds the
+engine that computes them, over the training history in process_clean_data
+and over live traffic in the API.
+"""
+
+import os
+import sys
+import json
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.window_features import WindowFeatures, window_feature_names
+
+VOCAB_PATH = 'vocabulary.json'
+MISSING = 'missing'
+
+CATEGORICAL_FEATURES = [
+    'alert_type_description', 'src_ip', 'username',
+    'dest_ip', 'process', 'file_name', 'agent_os',
+    'day_of_week', 'port'
+]
+WINDOW_ENTITIES = {'src_ip': 'src_ip', 'username': 'username'}
+WINDOW_DESTINATION = 'dest_ip'
+WINDOW_FEATURES = window_feature_names(WINDOW_ENTITIES, WINDOW_ENTITIES)
+NUMERICAL_FEATURES = ['severity', 'logon_hour'] + WINDOW_FEATURES
+
+
+def window_features() -> WindowFeatures:
+    """Fresh engine for the activity-window features (empty history)."""
+    return WindowFeatures(WINDOW_ENTITIES, WINDOW_DESTINATION)
+
+
+def build_vocabulary(df: pd.DataFrame) -> dict:
+    """Sorted distinct values per categorical feature, always including 'missing'."""
+    vocabulary = {}
+    for col in CATEGORICAL_FEATURES:
+        values = set(df[col].dropna().astype(str).unique()) | {MISSING}
+        vocabulary[col] = sorted(values)
+    return vocabulary
+
+
+def save_vocabulary(vocabulary: dict, path: str = VOCAB_PATH):
+    with open(path, 'w') as f:
+        json.dump(vocabulary, f, indent=2)
+    print(f"[+] Vocabulary saved to '{path}' ({sum(len(v) for v in vocabulary.values())} values)")
+
+
+def load_vocabulary(path: str = VOCAB_PATH) -> dict:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def categorical_dtypes(vocabulary: dict) -> dict:
+    return {col: pd.CategoricalDtype(categories=vocabulary[col]) for col in CATEGORICAL_FEATURES}
+
+
+def downcast_numeric(series: pd.Series) -> pd.Series:
+    """Smallest integer type when the column is complete, float32 when it has gaps."""
+    values = pd.to_numeric(series, errors='coerce')
+    if values.isna().any():
+        return values.astype('float32')
+    return pd.to_numeric(values, downcast='integer')
+
+
+def prepare_features(df: pd.DataFrame, dtypes: dict) -> pd.DataFrame:
+    """
+    Cast model inputs to the vocabulary categoricals and small numeric types.
+    Missing values become 'missing'; values outside the vocabulary become NaN.
+    Build dtypes once with categorical_dtypes(): reusing them keeps pandas' lookup tables warm.
+    """
+    for col in CATEGORICAL_FEATURES:
+        if not isinstance(df[col].dtype, pd.CategoricalDtype) or df[col].dtype != dtypes[col]:
+            df[col] = df[col].fillna(MISSING).astype(str).astype(dtypes[col])
+    for col in NUMERICAL_FEATURES:
+        df[col] = downcast_numeric(df[col])
+    return df
+
+
+def read_cleaned_csv(path: str, vocabulary: dict = None) -> pd.DataFrame:
+    """
+    Read cleaned_data.csv directly into the compact dtypes. Without a vocabulary
+    the categoricals take the values found in the file; cast them to the
+    vocabulary with prepare_features() once it is built.
+    """
+    dtypes = categorical_dtypes(vocabulary) if vocabulary else {col: 'category' for col in CATEGORICAL_FEATURES}
+    dtypes.update({col: 'float32' for col in NUMERICAL_FEATURES})
+    df = pd.read_csv(path, dtype=dtypes, keep_default_na=False, na_values=[''])
+    for col in CATEGORICAL_FEATURES:
+        if MISSING not in df[col].cat.categories:
+            df[col] = df[col].cat.add_categories([MISSING])
+        df[col] = df[col].fillna(MISSING)
+    for col in NUMERICAL_FEATURES + ['is_high_risk']:
+        if col in df.columns:
+            df[col] = downcast_numeric(df[col])
+    return df
+
+
+def vocabulary_from_pipeline(model_pipeline) -> dict:
+    """Recover the vocabulary from the categorical encoder of a trained pipeline."""
+    preprocessor = model_pipeline.named_steps['preprocessor']
+    for name, transformer, columns in preprocessor.transformers_:
+        if name == 'cat':
+            encoder = transformer.steps[-1][1] if hasattr(transformer, 'steps') else transformer
+            return {col: [str(v) for v in cats] for col, cats in zip(columns, encoder.categories_)}
+    raise ValueError("Pipeline has no 'cat' transformer")
@@ -1,11 +1,26 @@
 import joblib
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 import pandas as pd
 from sklearn.ensemble import IsolationForest
+import os
+import sys
+import time
+import threading
 import traceback
+from isofor_engine import IsolationForestEngine
+from dbscan_index import DBSCANIndex, load_index
+from anomaly_rollup import AnomalyRollup
+from preprocessor import to_feature_matrix, fitted_window_features, map_logs_for_preprocessor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.live_feed import LiveFeed, MAX_BUFFER
+from common.drift import DriftMonitor
+from common.request_profiler import RequestProfiler
+from common.cpu_budget import cpu_budget
 
 app = FastAPI(title="Trinetra Anomaly Detector")
 
@@ -19,9 +34,70 @@ app.add_middleware(
 
 MODEL_PATH = "isolation_forest.pkl"
 PREPROCESSOR_PATH = "preprocessor.pkl"
+DBSCAN_MODEL_PATH = "dbscan_model.pkl"
+DBSCAN_INDEX_PATH = "dbscan_index.pkl"
+ROLLUP_PATH = "anomaly_rollup.pkl"
+TRAINING_ROLLUP_PATH = "anomaly_rollup_training.pkl"
+DRIFT_BASELINE_PATH = "drift_baseline.pkl"
 
 trained_model: IsolationForest = None
-preprocessor = joblib.load(PREPROCESSOR_PATH)
+scoring_engine: IsolationForestEngine = None
+dbscan_index: DBSCANIndex = None
+# Live rollup: the saved live store plus this worker's batches, which are also
+# kept apart (rollup_delta) and merged into the store on shutdown
+rollup = AnomalyRollup.load(ROLLUP_PATH)
+rollup_delta = AnomalyRollup()
+training_rollup = None
+training_rollup_mtime = None
+anomaly_feed = LiveFeed("anomaly")
+drift_baseline = DriftMonitor.load(DRIFT_BASELINE_PATH)
+drift_monitor = drift_baseline.fresh() if drift_baseline is not None else None
+preprocessor = None
+activity_windows = None
+preprocessor_lock = threading.Lock()
+
+ensemble_scorer = None
+ensemble_lock = threading.Lock()
+
+# Per-agent shards (isofor_shards.py); TRINETRA_SHARD_CACHE engines are kept loaded
+shard_scorer = None
+shard_lock = threading.Lock()
+
+def get_ensemble():
+    """Load every available detector on the first ensemble request."""
+    global ensemble_scorer
+    if ensemble_scorer is None:
+        with ensemble_lock:
+            if ensemble_scorer is None:
+                from ensemble import EnsembleScorer
+                ensemble_scorer = EnsembleScorer()
+    return ensemble_scorer
+
+def get_shards():
+    """Open the shard index on the first sharded request; shards themselves load on demand."""
+    global shard_scorer
+    if shard_scorer is None:
+        with shard_lock:
+            if shard_scorer is None:
+                from isofor_shards import ShardedScorer, SHARD_CACHE_SIZE
+                shard_scorer = ShardedScorer(cache_size=int(os.environ.get("TRINETRA_SHARD_CACHE", SHARD_CACHE_SIZE)))
+    return shard_scorer
+
+# Opt-in per-request profiling (TRINETRA_PROFILING / TRINETRA_PROFILE_SAMPLE)
+profiler = RequestProfiler.from_env("ul", MODEL_PATH)
+profiler.install(app)
+
+def get_preprocessor():
+    """Load the fitted preprocessor on first use, not at import (keeps worker boot fast)."""
+    global preprocessor, activity_windows
+    if preprocessor is None:
+        with preprocessor_lock:
+            if preprocessor is None:
+                loaded = joblib.load(PREPROCESSOR_PATH)
+                # Activity windows (if the preprocessor uses them) start empty and fill with scored logs
+                activity_windows = fitted_window_features(loaded)
+                preprocessor = loaded
+    return preprocessor
 
 # Pydantic input model
 class LogEntry(BaseModel):
@@ -33,54 +109,39 @@ class LogEntry(BaseModel):
     sca_score: float
     sca_total_checks: int
     win_system_eventID: int
+    username: str = "missing"
+    src_ip: str = "missing"
+    timestamp: Optional[float] = None  # epoch seconds; default: time of arrival
 
-# Map frontend keys to preprocessor columns
-def map_logs_for_preprocessor(df: pd.DataFrame) -> pd.DataFrame:
-    mapping = {
-        "agent_name": "agent.name",
-        "agent_ip": "agent.ip",
-        "data_alert_type": "data.alert_type",
-        "hour": "hour",
-        "day_of_week": "day_of_week",
-        "sca_score": "data.sca.score",
-        "sca_total_checks": "data.sca.total_checks",
-        "win_system_eventID": "data.win.system.eventID"
-    }
-
-    for old, new in mapping.items():
-        if old in df.columns:
-            df[new] = df[old]
-
-    required_columns = [
-        'agent.name', 'agent.ip', 'data.alert_type', 'data.win.system.channel',
-        'data.win.system.providerName', 'data.win.eventdata.processName',
-        'data.win.eventdata.user', 'data.win.eventdata.ruleName',
-        'data.win.system.severityValue', 'data.sca.score',
-        'data.sca.total_checks', 'data.vulnerability.cvss.cvss3.base_score',
-        'data.win.system.eventID', 'hour', 'day_of_week'
-    ]
-
-    for col in required_columns:
-        if col not in df.columns:
-            df[col] = 0 if "score" in col or "Value" in col or "ID" in col else "missing"
-
-    return df[required_columns]
+def scoring_windows():
+    """
+    This worker's activity windows (None when the preprocessor has no window
+    features). Only the IsolationForest path of /predict_anomaly/ (plain or
+    sharded) folds logs into them; ensemble=true and /predict_dbscan/ only read
+    them, so a log scored by several detectors is counted once.
+    """
+    get_preprocessor()
+    return activity_windows
 
 @app.post("/train_anomaly/")
 def train_anomaly(logs: List[LogEntry]):
-    global trained_model, preprocessor
+    global trained_model, scoring_engine
     try:
         df = pd.DataFrame([log.dict() for log in logs])
-        df_mapped = map_logs_for_preprocessor(df)
-        X = preprocessor.transform(df_mapped)
-        if hasattr(X, "toarray"):
-            X = X.toarray()
+        # Windows over this training batch alone, not the live ones
+        windows = fitted_window_features(get_preprocessor())
+        df_mapped = map_logs_for_preprocessor(df, windows, [log.timestamp for log in logs])
+        X = to_feature_matrix(get_preprocessor().transform(df_mapped))
         
-        trained_model = IsolationForest(n_estimators=100, contamination=0.05, random_state=42, n_jobs=-1)
-        trained_model.fit(X)
-        joblib.dump(trained_model, MODEL_PATH)
+        # Fit into locals so concurrent requests never see an unfitted global model
+        model = IsolationForest(n_estimators=100, contamination=0.05, random_state=42)
+        with cpu_budget().allocate("train_anomaly"):
+            model.fit(X)
+            joblib.dump(model, MODEL_PATH)
+            engine = IsolationForestEngine(model)
+            trained_model, scoring_engine = model, engine
 
-        labels = trained_model.predict(X)
+            _, labels = engine.score(X)
         n_anomalies = (labels == -1).sum()
         return {"status": "success", "trained": True, "training_anomalies": int(n_anomalies)}
 
@@ -88,27 +149,228 @@ def train_anomaly(logs: List[LogEntry]):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Training failed: {e}")
 
+def score_ensemble(logs: List[LogEntry], detectors: List[str] = None, budget_ms: float = None):
+    """
+    Transform once, score with the selected detectors concurrently and fuse
+    their rank-normalized scores (see ensemble.py). Not folded into the
+    rollup or drift monitor, which follow the IsolationForest alone.
+    """
+    from ensemble import ENSEMBLE_DETECTORS, LATENCY_BUDGET_MS
+    unknown = sorted(set(detectors or []) - set(ENSEMBLE_DETECTORS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown detectors {unknown}, expected {ENSEMBLE_DETECTORS}")
+    try:
+        start = time.perf_counter()
+        df = pd.DataFrame([log.dict() for log in logs])
+        df_mapped = map_logs_for_preprocessor(df, scoring_windows(), [log.timestamp for log in logs], fold=False)
+        X = to_feature_matrix(get_preprocessor().transform(df_mapped))
+        transform_ms = (time.perf_counter() - start) * 1e3
+
+        # The budget covers the whole request, transform included
+        budget_ms = LATENCY_BUDGET_MS if budget_ms is None else budget_ms
+        fused = get_ensemble().score(X, detectors, max(budget_ms - transform_ms, 0.0))
+        results = [
+            {
+                "log_index": i,
+                "anomaly_score": float(fused["scores"][i]),
+                "anomaly_label": int(fused["labels"][i]),
+                "detector_scores": {name: float(scores[i]) for name, scores in fused["detector_scores"].items()},
+            }
+            for i in range(len(df))
+        ]
+        return {
+            "results": results,
+            "fused": fused["fused"],
+            "degraded": fused["degraded"],
+            "detectors": fused["detectors"],
+            "transform_ms": round(transform_ms, 3),
+            "total_ms": round((time.perf_counter() - start) * 1e3, 3),
+        }
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Ensemble prediction failed: {e}")
+
 @app.post("/predict_anomaly/")
-def predict_anomaly(logs: List[LogEntry]):
-    global trained_model, preprocessor
-    if trained_model is None:
+@profiler.profiled
+def predict_anomaly(logs: List[LogEntry], ensemble: bool = False, detectors: List[str] = Query(None),
+                    budget_ms: float = None, sharded: bool = False):
+    """
+    IsolationForest scores per log. With ensemble=true, the selected detectors
+    (default: all trained ones) are fused instead and the response also reports
+    per-detector status and latency; budget_ms caps the request latency.
+    With sharded=true, each log is scored by its agent's own forest (see
+    isofor_shards.py) and the result names the shard. Neither mode is folded
+    into the rollup or drift monitor: their scores are not on the global
+    forest's scale.
+    """
+    global trained_model, scoring_engine
+    if ensemble:
+        return score_ensemble(logs, detectors, budget_ms)
+    if sharded:
+        try:
+            shards = get_shards()
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    elif trained_model is None:
         try:
             trained_model = joblib.load(MODEL_PATH)
         except Exception:
             raise HTTPException(status_code=400, detail="Model not trained yet. Call /train_anomaly/ first.")
+    if not sharded and scoring_engine is None:
+        scoring_engine = IsolationForestEngine(trained_model)
+    try:
+        start = time.perf_counter()
+        records = [log.dict() for log in logs]
+        df = pd.DataFrame(records)
+        timestamps = [log.timestamp for log in logs]
+        df_mapped = map_logs_for_preprocessor(df, scoring_windows(), timestamps)
+        X = to_feature_matrix(get_preprocessor().transform(df_mapped))
+        with cpu_budget().allocate("predict_anomaly"):
+            if sharded:
+                scores, labels, shard_names = shards.score(X, df_mapped["agent.name"])
+            else:
+                scores, labels = scoring_engine.score(X)
+        if not sharded:
+            if drift_monitor is not None:
+                drift_monitor.update(records, scores, (time.perf_counter() - start) * 1e3)
+            rollup.update(df_mapped, scores, labels, timestamps)
+            rollup_delta.update(df_mapped, scores, labels, timestamps)
+        results = [{"log_index": i, "anomaly_score": float(scores[i]), "anomaly_label": int(labels[i])} for i in range(len(df))]
+        if sharded:
+            for result, shard in zip(results, shard_names):
+                result["shard"] = shard
+        if anomaly_feed.has_subscribers:
+            scored_at = time.time()
+            anomaly_feed.publish([
+                {**record, **result, "scored_at": scored_at} for record, result in zip(records, results)
+            ])
+        return results
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
+
+@app.post("/predict_dbscan/")
+@profiler.profiled(model_path=DBSCAN_MODEL_PATH)
+def predict_dbscan(logs: List[LogEntry]):
+    global dbscan_index
+    if dbscan_index is None:
+        try:
+            dbscan_index = load_index(DBSCAN_INDEX_PATH, DBSCAN_MODEL_PATH)
+        except Exception:
+            raise HTTPException(status_code=400, detail="DBSCAN model not trained yet. Run train_dbscan.py first.")
     try:
         df = pd.DataFrame([log.dict() for log in logs])
-        df_mapped = map_logs_for_preprocessor(df)
-        X = preprocessor.transform(df_mapped)
-        if hasattr(X, "toarray"):
-            X = X.toarray()
-        scores = trained_model.decision_function(X)
-        labels = trained_model.predict(X)
-        return [{"log_index": i, "anomaly_score": float(scores[i]), "anomaly_label": int(labels[i])} for i in range(len(df))]
+        df_mapped = map_logs_for_preprocessor(df, scoring_windows(), [log.timestamp for log in logs], fold=False)
+        X = to_feature_matrix(get_preprocessor().transform(df_mapped))
+        clusters, scores = dbscan_index.predict(X)
+        return [
+            {
+                "log_index": i,
+                "cluster": int(clusters[i]),
+                "anomaly_score": float(scores[i]),
+                "anomaly_label": -1 if clusters[i] == -1 else 1
+            }
+            for i in range(len(df))
+        ]
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
 
+def get_training_rollup() -> AnomalyRollup:
+    """The last training run's rollup, reloaded when train_isofor rewrites it."""
+    global training_rollup, training_rollup_mtime
+    if not os.path.exists(TRAINING_ROLLUP_PATH):
+        raise FileNotFoundError("No training rollup. Run train_isofor.py first.")
+    mtime = os.path.getmtime(TRAINING_ROLLUP_PATH)
+    if mtime != training_rollup_mtime:
+        training_rollup, training_rollup_mtime = AnomalyRollup.load(TRAINING_ROLLUP_PATH), mtime
+    return training_rollup
+
+@app.get("/anomaly_rollup/")
+def anomaly_rollup(dimension: str = "agent.ip", k: int = 10, start: float = None, end: float = None,
+                   training: bool = False):
+    """
+    Top-K anomalous keys, hourly counts and score quantiles of the scored
+    traffic (training=true: of the last training run); start/end are epoch
+    seconds of event time. All-time queries read the running totals; a range
+    merges O(log range) pre-merged nodes, so it costs a few milliseconds for
+    a month rather than sub-millisecond (query_ms reports it).
+    """
+    try:
+        query_start = time.perf_counter()
+        result = (get_training_rollup() if training else rollup).query(dimension, k, start, end)
+        result["query_ms"] = (time.perf_counter() - query_start) * 1e3
+        return result
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/shards/stats/")
+def shards_stats():
+    """Shard cache: hit rate, evictions, cold-load latency and rows scored per shard."""
+    try:
+        return get_shards().report()
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/windows/stats/")
+def windows_stats():
+    """Logs folded into (and read from) the activity windows, entities tracked per field and evictions."""
+    windows = scoring_windows()
+    if windows is None:
+        raise HTTPException(status_code=404, detail="The preprocessor has no activity-window features.")
+    return windows.report()
+
+@app.get("/cpu/stats/")
+def cpu_stats():
+    """CPU budget of this worker: cores in use, and allocations and wait times per call."""
+    return cpu_budget().stats()
+
+@app.get("/drift/")
+def drift(reset: bool = False):
+    """
+    Scored logs vs the training baseline: heavy hitters and distance per
+    categorical field, PSI and quantiles per numeric field and the anomaly score.
+    reset=true starts a new comparison window after reporting.
+    """
+    global drift_monitor
+    if drift_monitor is None:
+        raise HTTPException(status_code=404, detail="No drift baseline. Run train_isofor.py first.")
+    report = drift_monitor.compare()
+    if reset:
+        drift_monitor = drift_baseline.fresh()
+    return report
+
+@app.get("/stream/anomalies/")
+async def stream_anomalies(request: Request, policy: str = "drop_oldest", anomalies_only: bool = False,
+                           max_buffer: int = MAX_BUFFER):
+    """
+    Server-Sent Events stream of logs as they are scored by /predict_anomaly/.
+    Overflow policy per client: drop_oldest, drop_newest or coalesce (latest per agent_ip).
+    max_buffer (events buffered for this client) is 1 to MAX_BUFFER; anything else is a 400.
+    """
+    try:
+        subscriber = anomaly_feed.subscribe(
+            policy, max_buffer, key="agent_ip",
+            accept=(lambda event: event["anomaly_label"] == -1) if anomalies_only else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        anomaly_feed.stream(subscriber, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/stream/stats/")
+async def stream_stats():
+    return anomaly_feed.stats()
+
+@app.on_event("shutdown")
+def save_rollup():
+    AnomalyRollup.merge_into(ROLLUP_PATH, rollup_delta)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("api_ul:app", host="0.0.0.0", port=8001, reload=True)
\ No newline at end of file
@@ -0,0 +1,120 @@
+"""
+Cluster-quality metrics whose cost stays bounded as the evaluation set grows.
+
+Modes:
+    sampled : silhouette on stratified samples, with a confidence interval
+    exact   : exact silhouette computed in memory-bounded row/column blocks
+    cheap   : Davies-Bouldin plus per-cluster size / density statistics only
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import silhouette_score, davies_bouldin_score
+from sklearn.metrics.pairwise import euclidean_distances
+
+SAMPLE_SIZE = 2000
+N_REPEATS = 10
+BLOCK_ROWS = 2048
+
+
+def stratified_sample(labels: np.ndarray, sample_size: int, rng: np.random.RandomState) -> np.ndarray:
+    """Indices of a sample with each cluster represented in proportion (at least 2 points)."""
+    clusters, counts = np.unique(labels, return_counts=True)
+    quota = np.maximum(2, np.round(counts / counts.sum() * sample_size).astype(int))
+    quota = np.minimum(quota, counts)
+    return np.concatenate([
+        rng.choice(np.flatnonzero(labels == cluster), size=n, replace=False)
+        for cluster, n in zip(clusters, quota)
+    ])
+
+
+def sampled_silhouette(X, labels, sample_size=SAMPLE_SIZE, n_repeats=N_REPEATS, random_state=42) -> dict:
+    """Mean silhouette over repeated stratified samples with a 95% confidence interval."""
+    rng = np.random.RandomState(random_state)
+    estimates = []
+    for _ in range(n_repeats):
+        idx = stratified_sample(labels, sample_size, rng)
+        estimates.append(silhouette_score(X[idx], labels[idx]))
+    estimates = np.asarray(estimates)
+    half_width = 1.96 * estimates.std(ddof=1) / np.sqrt(n_repeats) if n_repeats > 1 else np.nan
+    return {
+        "silhouette": float(estimates.mean()),
+        "silhouette_ci_low": float(estimates.mean() - half_width),
+        "silhouette_ci_high": float(estimates.mean() + half_width),
+        "silhouette_sample_size": int(len(idx))
+    }
+
+
+def chunked_silhouette(X, labels, block_rows=BLOCK_ROWS) -> dict:
+    """Exact silhouette with at most block_rows x block_rows distances in memory."""
+    clusters, codes, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+    n_clusters = len(clusters)
+
+    silhouettes = np.empty(len(X))
+    for start in range(0, len(X), block_rows):
+        rows = slice(start, start + block_rows)
+        n_rows = len(X[rows])
+        # Sum of distances from each block row to every cluster, accumulated by
+        # cluster code (no n x n_clusters indicator matrix)
+        cluster_sums = np.zeros(n_rows * n_clusters)
+        for col_start in range(0, len(X), block_rows):
+            cols = slice(col_start, col_start + block_rows)
+            flat = (np.arange(n_rows)[:, None] * n_clusters + codes[cols][None, :]).ravel()
+            cluster_sums += np.bincount(flat, weights=euclidean_distances(X[rows], X[cols]).ravel(),
+                                        minlength=n_rows * n_clusters)
+        cluster_sums = cluster_sums.reshape(n_rows, n_clusters)
+
+        own = codes[rows]
+        own_size = sizes[own]
+        a = cluster_sums[np.arange(len(own)), own] / np.maximum(own_size - 1, 1)
+        mean_to_other = cluster_sums / sizes
+        mean_to_other[np.arange(len(own)), own] = np.inf
+        b = mean_to_other.min(axis=1)
+        s = (b - a) / np.maximum(a, b)
+        # Points alone in their cluster have a silhouette of 0 by convention
+        silhouettes[rows] = np.where(own_size > 1, np.nan_to_num(s), 0.0)
+
+    return {"silhouette": float(silhouettes.mean())}
+
+
+def cluster_stats(X, labels) -> pd.DataFrame:
+    """Size, centroid spread and density proxy per cluster, in O(n log n) time (one sort by label)."""
+    order = np.argsort(labels, kind="stable")
+    clusters, starts = np.unique(labels[order], return_index=True)
+    rows = []
+    for cluster, members in zip(clusters, np.split(X[order], starts[1:])):
+        distances = np.linalg.norm(members - members.mean(axis=0), axis=1)
+        mean_distance = distances.mean()
+        rows.append({
+            "cluster": int(cluster),
+            "size": len(members),
+            "mean_distance_to_centroid": float(mean_distance),
+            "max_distance_to_centroid": float(distances.max()),
+            # Points per unit of mean radius, a cheap density proxy
+            "density": float(len(members) / mean_distance) if mean_distance > 0 else float("inf")
+        })
+    return pd.DataFrame(rows)
+
+
+def evaluate_clusters(X, labels, mode="sampled") -> dict:
+    """Quality metrics for the clustered (non-noise) points in the requested mode."""
+    X = np.asarray(X)
+    labels = np.asarray(labels)
+    n_clusters = len(np.unique(labels))
+
+    metrics = {"n_clusters": n_clusters, "n_points": len(labels)}
+    if n_clusters < 2 or len(labels) <= n_clusters:
+        print("[!] Need at least 2 clusters to compute silhouette / Davies-Bouldin.")
+        return metrics
+
+    metrics["davies_bouldin"] = float(davies_bouldin_score(X, labels))
+    if mode == "sampled":
+        if len(labels) <= SAMPLE_SIZE:
+            metrics["silhouette"] = float(silhouette_score(X, labels))
+        else:
+            metrics.update(sampled_silhouette(X, labels))
+    elif mode == "exact":
+        metrics.update(chunked_silhouette(X, labels))
+    elif mode != "cheap":
+        raise ValueError(f"Unknown cluster quality mode: {mode}")
+    return metrics
@@ -0,0 +1,81 @@
+"""
+Out-of-sample prediction for a trained DBSCAN model.
+
+DBSCAN has no predict(); this builds a spatial index (KD-tree / Ball-tree) over
+the trained model's core samples. A new point joins the cluster of the nearest
+core sample if it lies within eps of it, otherwise it is noise. The distance to
+that core sample also gives a continuous anomaly score.
+"""
+
+import os
+import time
+import numpy as np
+import joblib
+from sklearn.cluster import DBSCAN
+from sklearn.neighbors import KDTree, BallTree
+
+# --- Paths ---
+BASE_DIR = os.path.dirname(__file__)
+MODEL_FILE = os.path.join(BASE_DIR, "dbscan_model.pkl")
+INDEX_FILE = os.path.join(BASE_DIR, "dbscan_index.pkl")
+
+
+class DBSCANIndex:
+    """Nearest-core-sample index answering eps queries for new points."""
+
+    def __init__(self, model: DBSCAN, leaf_size: int = 40):
+        self.eps = float(model.eps)
+        self.metric = model.metric
+        self.n_features_in_ = model.n_features_in_
+        core_samples = np.asarray(model.components_, dtype=np.float64)
+        self.core_labels = model.labels_[model.core_sample_indices_]
+        self.n_clusters = len(set(self.core_labels))
+
+        if len(core_samples) == 0:
+            self.tree = None
+        elif self.metric in KDTree.valid_metrics:
+            self.tree = KDTree(core_samples, leaf_size=leaf_size, metric=self.metric)
+        else:
+            self.tree = BallTree(core_samples, leaf_size=leaf_size, metric=self.metric)
+
+    def predict(self, X):
+        """Return (cluster labels, anomaly scores); -1 marks noise.
+
+        Scores follow the IsolationForest convention (higher = more normal):
+        1 - distance / eps, so points beyond eps of every core sample score below 0.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if self.tree is None:
+            # No core samples at all: everything is noise
+            return np.full(len(X), -1), np.full(len(X), -1.0)
+        dist, ind = self.tree.query(X, k=1)
+        dist, ind = dist[:, 0], ind[:, 0]
+        labels = np.where(dist <= self.eps, self.core_labels[ind], -1)
+        scores = 1.0 - dist / self.eps
+        return labels, scores
+
+
+def build_index(model: DBSCAN, index_file: str = INDEX_FILE) -> DBSCANIndex:
+    """Build the core-sample index for a trained model and persist it."""
+    start = time.perf_counter()
+    index = DBSCANIndex(model)
+    joblib.dump(index, index_file)
+    print(
+        f"[+] DBSCAN core index built over {len(index.core_labels)} core samples "
+        f"in {time.perf_counter() - start:.2f}s, saved to '{index_file}'"
+    )
+    return index
+
+
+def load_index(index_file: str = INDEX_FILE, model_file: str = MODEL_FILE) -> DBSCANIndex:
+    """Load the persisted index, building it from the trained model if missing."""
+    if os.path.exists(index_file):
+        return joblib.load(index_file)
+    if not os.path.exists(model_file):
+        raise FileNotFoundError(f"Neither '{index_file}' nor '{model_file}' exist. Run train_dbscan.py first")
+    print(f"[*] Index not found, building it from '{model_file}'...")
+    return build_index(joblib.load(model_file), index_file)
+
+
+if __name__ == "__main__":
+    build_index(joblib.load(MODEL_FILE))
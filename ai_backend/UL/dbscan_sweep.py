@@ -0,0 +1,116 @@
+"""
+DBSCAN eps / min_samples sweep from a single cached neighbor graph.
+
+The radius-neighbors graph is computed once at the largest eps of interest and
+each smaller eps is obtained by dropping longer edges, so every
+(eps, min_samples) pair is clustered without new neighbor searches.
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from scipy import sparse
+from sklearn.cluster import DBSCAN
+from sklearn.neighbors import NearestNeighbors
+from train_dbscan import (
+    load_schema_and_preprocessor, load_data, ensure_schema_columns,
+    deduplicate_rows, radius_neighbors_graph_chunked
+)
+from common.cpu_budget import cpu_budget
+from preprocessor import to_feature_matrix
+
+# --- Paths ---
+BASE_DIR = os.path.dirname(__file__)
+RESULTS_FILE = os.path.join(BASE_DIR, "dbscan_sweep_results.csv")
+ELBOW_PLOT = os.path.join(BASE_DIR, "dbscan_k_distance.png")
+
+DEFAULT_EPS = np.round(np.linspace(0.05, 0.5, 10), 3)
+DEFAULT_MIN_SAMPLES = (3, 4, 6, 8, 10)
+
+
+def restrict_graph(graph: sparse.csr_matrix, eps: float) -> sparse.csr_matrix:
+    """Keep only the edges of a radius graph that are within eps."""
+    keep = graph.data <= eps
+    row_ids = np.repeat(np.arange(graph.shape[0]), np.diff(graph.indptr))
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(row_ids[keep], minlength=graph.shape[0]))])
+    return sparse.csr_matrix((graph.data[keep], graph.indices[keep], indptr), shape=graph.shape)
+
+
+def k_distances(X, k: int) -> np.ndarray:
+    """Sorted distance of every row to its k-th nearest neighbor (itself included)."""
+    nn = NearestNeighbors(n_neighbors=k).fit(X)
+    distances, _ = nn.kneighbors(X)
+    return np.sort(distances[:, -1])
+
+
+def plot_k_distance(distances: np.ndarray, k: int, eps_values, out_file: str = ELBOW_PLOT):
+    plt.figure(figsize=(10, 6))
+    plt.plot(distances)
+    for eps in eps_values:
+        plt.axhline(eps, color="grey", linewidth=0.5, linestyle="--")
+    plt.title(f"{k}-distance graph (choose eps at the elbow)")
+    plt.xlabel("Points sorted by distance")
+    plt.ylabel(f"Distance to {k}-th nearest neighbor")
+    plt.grid(True)
+    plt.savefig(out_file)
+    print(f"[+] Saved k-distance plot as '{out_file}'")
+    plt.close()
+
+
+def sweep(X_processed, eps_values=DEFAULT_EPS, min_samples_values=DEFAULT_MIN_SAMPLES) -> pd.DataFrame:
+    """Cluster counts and noise for every (eps, min_samples) pair from one neighbor graph."""
+    X_unique, counts, inverse = deduplicate_rows(np.asarray(X_processed))
+    print(f"[*] {len(X_unique)} distinct rows out of {len(X_processed)}")
+
+    start = time.perf_counter()
+    graph = radius_neighbors_graph_chunked(X_unique, max(eps_values))
+    print(f"[+] Radius graph at eps={max(eps_values)}: {graph.nnz} neighbor pairs "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    rows = []
+    for eps in sorted(eps_values):
+        eps_graph = restrict_graph(graph, eps)
+        for min_samples in min_samples_values:
+            setting_start = time.perf_counter()
+            model = DBSCAN(eps=eps, min_samples=min_samples, metric="precomputed")
+            labels = model.fit(eps_graph, sample_weight=counts).labels_[inverse]
+            n_noise = int((labels == -1).sum())
+            rows.append({
+                "eps": eps,
+                "min_samples": min_samples,
+                "n_clusters": len(set(labels)) - (1 if n_noise else 0),
+                "n_noise": n_noise,
+                "noise_fraction": n_noise / len(labels),
+                "seconds": time.perf_counter() - setting_start
+            })
+
+    results = pd.DataFrame(rows)
+    print(f"[+] Swept {len(results)} settings in {time.perf_counter() - start:.2f}s")
+    return results
+
+
+def main(eps_values=DEFAULT_EPS, min_samples_values=DEFAULT_MIN_SAMPLES):
+    preprocessor, schema = load_schema_and_preprocessor()
+    df = ensure_schema_columns(load_data(), schema)
+
+    print("[*] Transforming data with preprocessor...")
+    X_processed = to_feature_matrix(preprocessor.transform(df))
+
+    k = max(min_samples_values)
+    with cpu_budget().allocate("dbscan_sweep"):
+        plot_k_distance(k_distances(X_processed, k), k, eps_values)
+        results = sweep(X_processed, eps_values, min_samples_values)
+    results.to_csv(RESULTS_FILE, index=False)
+    print(results.to_string(index=False))
+    print(f"[+] Sweep results saved to '{RESULTS_FILE}'")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep DBSCAN eps / min_samples from one neighbor graph")
+    parser.add_argument("--eps", type=float, nargs="+", default=list(DEFAULT_EPS))
+    parser.add_argument("--min-samples", type=int, nargs="+", default=list(DEFAULT_MIN_SAMPLES))
+    args = parser.parse_args()
+    main(args.eps, args.min_samples)
@@ -0,0 +1,220 @@
+"""
+Concurrent multi-detector anomaly scoring.
+
+The batch is transformed once and every selected detector scores the same
+matrix on its own worker thread. Each detector has a timeout, and the whole
+call a latency budget:
+
+    - detectors that finish in time are fused: each score is turned into a
+      rank against that detector's scores on a sample of the training logs
+      (0 = more anomalous than every sampled row, 1 = more normal) and the
+      ranks are averaged; rows whose fused rank falls below the
+      FUSED_CONTAMINATION quantile of the same fusion over the sample are
+      anomalies
+    - a detector past its timeout is left out of the fusion
+    - a detector still busy with an earlier batch that ran past its timeout
+      is skipped rather than queued behind it; a detector merely busy with
+      another request's batch is queued on its worker, within the same
+      timeout and budget
+    - when the budget runs out before every detector has answered, the
+      response degrades to the first finished detector in preference order
+      (its own labels), flagged degraded=true; if none has finished yet, the
+      first running one is awaited up to its own timeout
+
+The reference scores come from ensemble_reference.npz (python ensemble.py
+builds it from processed_logs.csv). Without it, ranks are taken within the batch
+and labels are a majority vote of the detectors' own labels.
+"""
+
+import os
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+
+from evaluate_all import DETECTORS, load_train_matrix
+
+# --- Paths ---
+BASE_DIR = os.path.dirname(__file__)
+REFERENCE_FILE = os.path.join(BASE_DIR, "ensemble_reference.npz")
+
+# Preference order: the degraded answer comes from the first finished detector
+ENSEMBLE_DETECTORS = ["isolation_forest", "one_class_svm_approx", "one_class_svm", "dbscan"]
+DETECTOR_TIMEOUT_MS = {
+    "isolation_forest": 200.0,
+    "one_class_svm_approx": 200.0,
+    "one_class_svm": 500.0,
+    "dbscan": 300.0,
+}
+LATENCY_BUDGET_MS = 250.0
+FUSED_CONTAMINATION = 0.01
+REFERENCE_ROWS = 20_000
+
+
+class EnsembleScorer:
+    def __init__(self, detectors: list = None, reference_file: str = REFERENCE_FILE):
+        self.models = {}
+        self.unavailable = {}
+        for name in detectors or ENSEMBLE_DETECTORS:
+            try:
+                self.models[name] = DETECTORS[name]["load"]()
+            except Exception as e:
+                self.unavailable[name] = f"{type(e).__name__}: {e}"
+        # Row-aligned reference scores per detector (sorted copies for ranking)
+        self.reference_scores = {}
+        if os.path.exists(reference_file):
+            with np.load(reference_file) as data:
+                self.reference_scores = {name: data[name] for name in data.files}
+        self.reference = {name: np.sort(scores) for name, scores in self.reference_scores.items()}
+        self._thresholds = {}
+        # One worker per detector: a stuck model only ever holds its own thread
+        self.executors = {name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"ensemble-{name}")
+                          for name in self.models}
+        # The last future of each detector that ran past its timeout; the detector
+        # is busy until it finishes. Overlapping requests otherwise queue on its worker.
+        self.timed_out = {}
+        self._lock = threading.Lock()
+
+    def _score(self, name: str, X: np.ndarray):
+        start = time.perf_counter()
+        scores = np.asarray(DETECTORS[name]["score"](self.models[name], X), dtype=np.float64)
+        return scores, (time.perf_counter() - start) * 1e3
+
+    def _abandon(self, future, name: str):
+        with self._lock:
+            self.timed_out[name] = future
+
+    def _rank(self, name: str, scores: np.ndarray) -> np.ndarray:
+        reference = self.reference.get(name)
+        if reference is not None:
+            return np.searchsorted(reference, scores, side="right") / len(reference)
+        # No reference: rank within the batch
+        order = scores.argsort(kind="stable")
+        ranks = np.empty(len(scores))
+        ranks[order] = (np.arange(len(scores)) + 0.5) / len(scores)
+        return ranks
+
+    def fused_threshold(self, names: list) -> float:
+        """FUSED_CONTAMINATION quantile of the fused reference ranks for this detector subset."""
+        key = tuple(names)
+        if key not in self._thresholds:
+            fused = np.mean([self._rank(name, self.reference_scores[name]) for name in names], axis=0)
+            self._thresholds[key] = float(np.quantile(fused, FUSED_CONTAMINATION))
+        return self._thresholds[key]
+
+    def score(self, X: np.ndarray, detectors: list = None, budget_ms: float = LATENCY_BUDGET_MS,
+              timeouts_ms: dict = None) -> dict:
+        """
+        Fused scores for a transformed batch. Returns scores (fused rank), labels
+        (-1 = anomaly), per-detector scores and a status/latency report per detector.
+        """
+        start = time.perf_counter()
+        selected = [name for name in ENSEMBLE_DETECTORS if name in (detectors or ENSEMBLE_DETECTORS)]
+        timeouts = {**DETECTOR_TIMEOUT_MS, **(timeouts_ms or {})}
+        report = {name: {"status": "unavailable", "error": self.unavailable[name]}
+                  for name in selected if name in self.unavailable}
+
+        futures = {}
+        with self._lock:
+            for name in selected:
+                stuck = self.timed_out.get(name)
+                if name not in self.models:
+                    report.setdefault(name, {"status": "unavailable"})
+                elif stuck is not None and not stuck.done():
+                    report[name] = {"status": "busy"}
+                else:
+                    self.timed_out.pop(name, None)
+                    futures[self.executors[name].submit(self._score, name, X)] = name
+
+        budget_deadline = start + budget_ms / 1e3
+        deadlines = {future: start + timeouts.get(name, budget_ms) / 1e3 for future, name in futures.items()}
+        pending = set(futures)
+        finished = {}
+        over_budget = False
+        while pending:
+            next_deadline = min(min(deadlines[f] for f in pending), budget_deadline)
+            done, pending = wait(pending, timeout=max(0.0, next_deadline - time.perf_counter()),
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures[future]
+                try:
+                    finished[name], latency_ms = future.result()
+                    report[name] = {"status": "ok", "latency_ms": round(latency_ms, 3)}
+                except Exception as e:
+                    report[name] = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+            now = time.perf_counter()
+            for future in [f for f in pending if now >= deadlines[f]]:
+                report[futures[future]] = {"status": "timeout", "timeout_ms": timeouts.get(futures[future])}
+                self._abandon(future, futures[future])
+                pending.discard(future)
+            if pending and now >= budget_deadline:
+                over_budget = True
+                if not finished:
+                    # Nothing to degrade to yet: give the preferred running detector its own timeout
+                    primary = min(pending, key=lambda f: selected.index(futures[f]))
+                    wait([primary], timeout=max(0.0, deadlines[primary] - now))
+                    if primary.done() and primary.exception() is None:
+                        finished[futures[primary]], latency_ms = primary.result()
+                        report[futures[primary]] = {"status": "ok", "latency_ms": round(latency_ms, 3)}
+                        pending.discard(primary)
+                for future in pending:
+                    report[futures[future]] = {"status": "over_budget"}
+                    if time.perf_counter() >= deadlines[future]:
+                        self._abandon(future, futures[future])
+                break
+
+        if not finished:
+            raise RuntimeError(f"No detector answered: {report}")
+
+        fused_names = [name for name in selected if name in finished]
+        if over_budget:
+            primary = fused_names[0]
+            scores = self._rank(primary, finished[primary])
+            labels = np.where(finished[primary] < 0, -1, 1)
+            fused_names = [primary]
+        else:
+            scores = np.mean([self._rank(name, finished[name]) for name in fused_names], axis=0)
+            if all(name in self.reference for name in fused_names):
+                labels = np.where(scores < self.fused_threshold(fused_names), -1, 1)
+            else:
+                votes = np.sum([finished[name] < 0 for name in fused_names], axis=0)
+                labels = np.where(2 * votes > len(fused_names), -1, 1)
+
+        return {
+            "scores": scores,
+            "labels": labels,
+            "detector_scores": {name: finished[name] for name in fused_names},
+            "fused": fused_names,
+            "degraded": over_budget,
+            "detectors": report,
+            "elapsed_ms": (time.perf_counter() - start) * 1e3,
+        }
+
+
+def build_reference(detectors: list = None, rows: int = REFERENCE_ROWS, output_file: str = REFERENCE_FILE):
+    """Score a sample of the training logs with each detector and save the scores."""
+    X = load_train_matrix()
+    if len(X) > rows:
+        X = X[np.random.default_rng(42).choice(len(X), rows, replace=False)]
+    reference = {}
+    for name in detectors or ENSEMBLE_DETECTORS:
+        try:
+            model = DETECTORS[name]["load"]()
+        except Exception as e:
+            print(f"[!] Skipping {name}: {type(e).__name__}: {e}")
+            continue
+        start = time.perf_counter()
+        scores = np.asarray(DETECTORS[name]["score"](model, X), dtype=np.float64)
+        reference[name] = scores
+        print(f"[+] {name}: {len(X)} rows scored in {time.perf_counter() - start:.2f}s")
+    np.savez_compressed(output_file, **reference)
+    print(f"[+] Ensemble reference saved to '{output_file}'")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the rank reference for ensemble scoring")
+    parser.add_argument("--detectors", nargs="+", choices=ENSEMBLE_DETECTORS, default=None)
+    parser.add_argument("--rows", type=int, default=REFERENCE_ROWS)
+    args = parser.parse_args()
+    build_reference(args.detectors, args.rows)
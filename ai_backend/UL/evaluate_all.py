@@ -0,0 +1,216 @@
+"""
+Evaluate every registered anomaly detector on the synthetic test set in one run.
+
+The test set (and, with --fit, the training logs) is loaded and transformed
+once; detectors are then fitted/loaded and scored in parallel worker processes,
+and a single comparison table reports quality metrics next to wall time and
+peak memory per detector.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import numpy as np
+import pandas as pd
+import joblib
+from joblib import Parallel, delayed
+from sklearn.metrics import (
+    confusion_matrix,
+    precision_recall_curve,
+    roc_auc_score,
+    average_precision_score,
+    matthews_corrcoef
+)
+from preprocessor import to_feature_matrix
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.cpu_budget import cpu_budget, scoped_cpu_budget
+
+# --- Paths ---
+BASE_DIR = os.path.dirname(__file__)
+PREPROCESSOR_PATH = os.path.join(BASE_DIR, "preprocessor.pkl")
+SCHEMA_PATH = os.path.join(BASE_DIR, "schema.json")
+TEST_FILE = os.path.join(BASE_DIR, "synthetic_testset.csv")
+COMPARISON_FILE = os.path.join(BASE_DIR, "detector_comparison.csv")
+
+
+# --- Detector registry ---
+# Each detector knows how to load its trained artifact, fit a fresh one on a
+# transformed training matrix, and produce scores where higher = more normal.
+
+def _load_isolation_forest():
+    from isofor_engine import IsolationForestEngine
+    return IsolationForestEngine(joblib.load(os.path.join(BASE_DIR, "isolation_forest.pkl")))
+
+def _fit_isolation_forest(X):
+    from train_isofor import train_model
+    from isofor_engine import IsolationForestEngine
+    return IsolationForestEngine(train_model(X))
+
+def _load_one_class_svm():
+    return joblib.load(os.path.join(BASE_DIR, "one_class_svm.pkl"))
+
+def _fit_one_class_svm(X):
+    from train_svm import fit_exact_model
+    return fit_exact_model(X)
+
+def _load_one_class_svm_approx():
+    return joblib.load(os.path.join(BASE_DIR, "one_class_svm_approx.pkl"))
+
+def _load_dbscan():
+    from dbscan_index import load_index
+    return load_index(os.path.join(BASE_DIR, "dbscan_index.pkl"), os.path.join(BASE_DIR, "dbscan_model.pkl"))
+
+def _fit_dbscan(X):
+    from train_dbscan import train_dbscan
+    from dbscan_index import DBSCANIndex
+    return DBSCANIndex(train_dbscan(X))
+
+def _score_decision_function(model, X):
+    return model.decision_function(X)
+
+def _score_dbscan(index, X):
+    _, scores = index.predict(X)
+    return scores
+
+DETECTORS = {
+    "isolation_forest": {
+        "load": _load_isolation_forest, "fit": _fit_isolation_forest, "score": _score_decision_function
+    },
+    "one_class_svm": {
+        "load": _load_one_class_svm, "fit": _fit_one_class_svm, "score": _score_decision_function
+    },
+    "one_class_svm_approx": {
+        "load": _load_one_class_svm_approx, "fit": None, "score": _score_decision_function
+    },
+    "dbscan": {
+        "load": _load_dbscan, "fit": _fit_dbscan, "score": _score_dbscan
+    },
+}
+
+
+# --- Data ---
+def load_test_matrix():
+    """Load the labelled test set and transform it once with the shared preprocessor."""
+    if not os.path.exists(TEST_FILE):
+        raise FileNotFoundError(f"Test file not found: {TEST_FILE}")
+    df = pd.read_csv(TEST_FILE, low_memory=False)
+    print(f"[+] Test set loaded: {df.shape[0]} rows, {df.shape[1]} columns")
+    if "label" not in df.columns:
+        raise ValueError("Test set must contain a 'label' column (1=normal, -1=anomaly)")
+
+    preprocessor = joblib.load(PREPROCESSOR_PATH)
+    with open(SCHEMA_PATH, "r") as f:
+        schema = json.load(f)
+
+    X_raw = df.drop(columns=["label"])
+    for col in schema["categorical"] + schema["numeric"]:
+        if col not in X_raw.columns:
+            X_raw[col] = 0 if col in schema["numeric"] else "missing"
+    for col in schema["numeric"]:
+        X_raw[col] = pd.to_numeric(X_raw[col], errors="coerce").fillna(0)
+    for col in schema["categorical"]:
+        X_raw[col] = X_raw[col].astype(str).fillna("missing")
+
+    print("[*] Transforming test set with preprocessor...")
+    X = to_feature_matrix(preprocessor.transform(X_raw[schema["categorical"] + schema["numeric"]]))
+    return df["label"].values, X
+
+
+def load_train_matrix():
+    from train_isofor import load_and_preprocess
+    _, X = load_and_preprocess()
+    return X
+
+
+# --- Metrics ---
+def compute_metrics(y_true: np.ndarray, scores: np.ndarray) -> dict:
+    """ROC/PR-AUC plus confusion-matrix metrics at the best-F1 threshold (-1 = anomaly)."""
+    is_anomaly = (y_true == -1).astype(int)
+    precision, recall, thresholds = precision_recall_curve(is_anomaly, -scores)
+    f1 = 2 * precision * recall / (precision + recall + 1e-9)
+    best_idx = int(np.argmax(f1[:-1])) if len(thresholds) else 0
+    threshold = -thresholds[best_idx] if len(thresholds) else 0.0
+
+    # precision_recall_curve counts -score >= -threshold, i.e. ties at the threshold, as anomalies
+    y_pred = np.where(scores <= threshold, -1, 1)
+    tn, fp, fn, tp = confusion_matrix(y_true, y_pred, labels=[1, -1]).ravel()
+    return {
+        "roc_auc": roc_auc_score(is_anomaly, -scores),
+        "pr_auc": average_precision_score(is_anomaly, -scores),
+        "best_threshold": threshold,
+        "precision": tp / (tp + fp) if (tp + fp) else 0.0,
+        "recall": tp / (tp + fn) if (tp + fn) else 0.0,
+        "f1": f1[best_idx],
+        "fpr": fp / (fp + tn) if (fp + tn) else 0.0,
+        "mcc": matthews_corrcoef(y_true, y_pred),
+    }
+
+
+# --- Worker ---
+def run_detector(name: str, X_test: np.ndarray, y_true: np.ndarray, X_train: np.ndarray = None,
+                 cores: int = None) -> dict:
+    """Fit or load one detector, score the test matrix and measure its cost (on a budget of cores, if given)."""
+    detector = DETECTORS[name]
+    row = {"detector": name}
+    with scoped_cpu_budget(cores):
+        try:
+            tracemalloc.start()
+            start = time.perf_counter()
+            if X_train is not None and detector["fit"] is not None:
+                model = detector["fit"](X_train)
+                row["fit_mode"] = "fit"
+            else:
+                model = detector["load"]()
+                row["fit_mode"] = "load"
+            row["fit_seconds"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            scores = detector["score"](model, X_test)
+            row["score_seconds"] = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            row["peak_mib"] = peak / 2**20
+            row.update(compute_metrics(y_true, np.asarray(scores, dtype=np.float64)))
+        except Exception as e:
+            row["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            tracemalloc.stop()
+    return row
+
+
+def evaluate_all(detectors=None, fit=False, n_jobs=None) -> pd.DataFrame:
+    detectors = detectors or list(DETECTORS)
+    y_true, X_test = load_test_matrix()
+    X_train = load_train_matrix() if fit else None
+
+    # One worker process per detector, at most n_jobs (default: the CPU budget per call)
+    wanted = len(detectors) if not n_jobs or n_jobs < 0 else min(n_jobs, len(detectors))
+    with cpu_budget().allocate("evaluate_all", cores=wanted) as allocation:
+        # Each worker runs on its share of this budget, passed with the call
+        cores = max(1, cpu_budget().cores // allocation.n_jobs)
+        print(f"[*] Scoring {len(detectors)} detectors in {allocation.n_jobs} parallel workers...")
+        rows = Parallel(n_jobs=allocation.n_jobs)(
+            delayed(run_detector)(name, X_test, y_true, X_train, cores) for name in detectors
+        )
+
+    report = pd.DataFrame(rows).set_index("detector")
+    report.to_csv(COMPARISON_FILE)
+    print("\n=== Detector comparison ===")
+    with pd.option_context("display.width", 200, "display.max_columns", None,
+                           "display.float_format", "{:.4f}".format):
+        print(report)
+    print(f"[+] Comparison saved to {COMPARISON_FILE}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate all anomaly detectors on one transformed test set")
+    parser.add_argument("--detectors", nargs="+", choices=list(DETECTORS), default=None)
+    parser.add_argument("--fit", action="store_true",
+                        help="refit detectors on processed_logs.csv instead of loading saved models")
+    parser.add_argument("--n-jobs", type=int, default=None, help="most worker processes (default: CPU budget)")
+    args = parser.parse_args()
+    evaluate_all(args.detectors, fit=args.fit, n_jobs=args.n_jobs)
@@ -1,10 +1,12 @@
 import pandas as pd
 import joblib
 import os
-from sklearn.cluster import DBSCAN
 from sklearn.metrics import confusion_matrix, classification_report, roc_auc_score, average_precision_score
 import numpy as np
 import json
+from dbscan_index import load_index
+from cluster_quality import evaluate_clusters, cluster_stats
+from preprocessor import to_feature_matrix
 
 # --- Paths ---
 BASE_DIR = os.path.dirname(__file__)
@@ -13,6 +15,10 @@ PREPROCESSOR_PATH = os.path.join(BASE_DIR, "preprocessor.pkl")
 SCHEMA_PATH = os.path.join(BASE_DIR, "schema.json")
 TEST_FILE = os.path.join(BASE_DIR, "synthetic_testset.csv")  # Replace with your labeled test set
 RESULTS_FILE = os.path.join(BASE_DIR, "dbscan_results_evaluation.csv")
+CLUSTER_STATS_FILE = os.path.join(BASE_DIR, "dbscan_cluster_stats.csv")
+
+# "sampled" (stratified silhouette + CI), "exact" (block-wise silhouette) or "cheap"
+CLUSTER_QUALITY_MODE = "sampled"
 
 def load_data(file_path):
     if not os.path.exists(file_path):
@@ -45,13 +51,11 @@ def prepare_features(df, schema):
 
     return df
 
-from sklearn.metrics import silhouette_score
-
-def evaluate_dbscan():
+def evaluate_dbscan(quality_mode=CLUSTER_QUALITY_MODE):
     try:
         # Load artifacts
-        print("[*] Loading model, preprocessor, and schema...")
-        model = joblib.load(MODEL_FILE)
+        print("[*] Loading DBSCAN core index, preprocessor, and schema...")
+        index = load_index(model_file=MODEL_FILE)
         preprocessor = joblib.load(PREPROCESSOR_PATH)
         with open(SCHEMA_PATH, "r") as f:
             schema = json.load(f)
@@ -67,12 +71,10 @@ def evaluate_dbscan():
         X_prepared = prepare_features(X_raw, schema)
 
         print("[*] Transforming data with preprocessor...")
-        X_processed = preprocessor.transform(X_prepared)
-        if hasattr(X_processed, "toarray"):
-            X_processed = X_processed.toarray()
+        X_processed = to_feature_matrix(preprocessor.transform(X_prepared))
 
-        print("[*] Predicting labels with DBSCAN...")
-        y_pred_clusters = model.fit_predict(X_processed)
+        print("[*] Predicting labels with the trained DBSCAN core index...")
+        y_pred_clusters, scores = index.predict(X_processed)
         y_pred = np.where(y_pred_clusters == -1, -1, 1)
 
         print("\n[+] Confusion Matrix:")
@@ -81,19 +83,25 @@ def evaluate_dbscan():
         print("\n[+] Classification Report:")
         print(classification_report(y_true, y_pred, zero_division=0))
 
-        # Anomaly scores (proxy)
-        scores = np.where(y_pred == -1, -1.0, 1.0)
+        # Distance-based anomaly scores (higher = more normal)
         roc_auc = roc_auc_score((y_true == -1).astype(int), -scores)
         pr_auc = average_precision_score((y_true == -1).astype(int), -scores)
 
-        # Silhouette score (only for clustered points)
+        # Cluster quality (only for clustered points), bounded in cost by the mode
         clustered_mask = y_pred_clusters >= 0
         if clustered_mask.sum() > 1:
-            sil_score = silhouette_score(X_processed[clustered_mask], y_pred_clusters[clustered_mask])
-            print(f"[+] Silhouette Score (clusters only): {sil_score:.4f}")
+            print(f"[*] Computing cluster quality ({quality_mode} mode)...")
+            quality = evaluate_clusters(
+                X_processed[clustered_mask], y_pred_clusters[clustered_mask], mode=quality_mode
+            )
+            for name, value in quality.items():
+                print(f"[+] {name}: {value:.4f}" if isinstance(value, float) else f"[+] {name}: {value}")
+            cluster_stats(X_processed[clustered_mask], y_pred_clusters[clustered_mask]).to_csv(
+                CLUSTER_STATS_FILE, index=False
+            )
+            print(f"[+] Per-cluster statistics saved to {CLUSTER_STATS_FILE}")
         else:
-            sil_score = np.nan
-            print("[!] Not enough clustered points to compute silhouette score.")
+            print("[!] Not enough clustered points to compute cluster quality.")
 
         print("=== Evaluation metrics ===")
         print(f"ROC-AUC : {roc_auc:.4f}")
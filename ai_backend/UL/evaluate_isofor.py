@@ -11,6 +11,7 @@ from sklearn.metrics import (
 )
 import numpy as np
 from typing import Tuple
+from preprocessor import to_feature_matrix
 
 # --- Paths ---
 BASE_DIR = os.path.dirname(__file__)
@@ -51,9 +52,7 @@ def evaluate_model(model, preprocessor, df: pd.DataFrame) -> Tuple[np.ndarray, n
     X_raw = ensure_columns(X_raw, expected_cols)
 
     # Transform features using the saved preprocessor
-    X_trans = preprocessor.transform(X_raw)
-    if hasattr(X_trans, "toarray"):
-        X_trans = X_trans.toarray()
+    X_trans = to_feature_matrix(preprocessor.transform(X_raw))
 
     # Get raw anomaly scores
     scores = model.decision_function(X_trans)
@@ -12,7 +12,8 @@ from sklearn.metrics import (
 import numpy as np
 from typing import Tuple
 import matplotlib.pyplot as plt
-import seaborn as sns
+from plotting import plot_score_histogram, decimate
+from preprocessor import to_feature_matrix, window_features
 
 # --- Paths ---
 BASE_DIR = os.path.dirname(__file__)
@@ -52,6 +53,7 @@ def select_and_prepare_features(df: pd.DataFrame) -> pd.DataFrame:
         df['day_of_week'] = df['data.timestamp'].dt.day_name()
         categorical.append('day_of_week')
         numeric.append('hour')
+        numeric.extend(window_features().feature_names)  # when the test set carries them
 
     df_prepared = df[[col for col in categorical + numeric if col in df.columns]].copy()
     
@@ -67,15 +69,12 @@ def select_and_prepare_features(df: pd.DataFrame) -> pd.DataFrame:
 
 def plot_score_distribution(scores: np.ndarray, y_true: np.ndarray, save_path: str = None):
     """Plot the distribution of anomaly scores for normal and anomaly classes."""
-    plt.figure(figsize=(10, 6))
-    sns.histplot(scores[y_true == 1], bins=50, kde=True, color='blue', label='Normal', alpha=0.5)
-    sns.histplot(scores[y_true == -1], bins=50, kde=True, color='red', label='Anomaly', alpha=0.5)
-    plt.title('Distribution of Anomaly Scores')
-    plt.xlabel('Anomaly Score (higher = more normal)')
-    plt.legend()
     if save_path:
-        plt.savefig(save_path, dpi=300, bbox_inches='tight')
-    plt.close()
+        plot_score_histogram(
+            scores, save_path,
+            groups={"Normal": (y_true == 1, "blue"), "Anomaly": (y_true == -1, "red")},
+            xlabel="Anomaly Score (higher = more normal)"
+        )
 
 def plot_precision_recall_curve(y_true: np.ndarray, scores: np.ndarray, save_path: str = None):
     """Plot precision-recall curve and return optimal threshold."""
@@ -84,8 +83,13 @@ def plot_precision_recall_curve(y_true: np.ndarray, scores: np.ndarray, save_pat
     best_idx = np.argmax(f1_scores)
     best_threshold = -thresholds[best_idx]  # Convert back to original scale
     
+    # One curve point per threshold; keep the best point and decimate the rest
+    best_mask = np.zeros(len(precision), dtype=bool)
+    best_mask[best_idx] = True
+    points = decimate(best_mask)
+
     plt.figure(figsize=(10, 6))
-    plt.plot(recall, precision, marker='.')
+    plt.plot(recall[points], precision[points], marker='.')
     plt.scatter(recall[best_idx], precision[best_idx], 
                 marker='o', color='red', 
                 label=f'Best F1 (Threshold: {best_threshold:.2f})')
@@ -100,6 +104,10 @@ def plot_precision_recall_curve(y_true: np.ndarray, scores: np.ndarray, save_pat
     
     return best_threshold
 
+def pr_auc(y_true: np.ndarray, scores: np.ndarray) -> float:
+    """Average precision for the anomaly class (-1), lower scores being more anomalous."""
+    return average_precision_score((y_true == -1).astype(int), -scores)
+
 def evaluate_with_threshold(y_true: np.ndarray, scores: np.ndarray, threshold: float = 0.0):
     """Evaluate model performance with a custom decision threshold."""
     y_pred = np.where(scores >= threshold, 1, -1)
@@ -112,11 +120,11 @@ def evaluate_with_threshold(y_true: np.ndarray, scores: np.ndarray, threshold: f
     
     return y_pred
 
-def run_evaluation():
+def run_evaluation(model_path: str = MODEL_PATH):
     try:
         # Load artifacts
         print("[*] Loading trained model and preprocessor...")
-        model = joblib.load(MODEL_PATH)
+        model = joblib.load(model_path)
         preprocessor = joblib.load(PREPROCESSOR_PATH)
         print("[+] Artifacts loaded successfully.")
 
@@ -134,14 +142,11 @@ def run_evaluation():
 
         # Transform features
         print("[*] Transforming features...")
-        X_trans = preprocessor.transform(X_prepared)
-        
-        # Convert sparse matrix to dense array for OneClassSVM
-        if hasattr(X_trans, 'toarray'):
-            X_trans = X_trans.toarray()
+        X_trans = to_feature_matrix(preprocessor.transform(X_prepared))
             
         # Get raw anomaly scores
         scores = model.decision_function(X_trans)
+        print(f"[+] PR-AUC (anomaly class): {pr_auc(y_true, scores):.4f}")
         
         # Plot score distribution
         plot_score_distribution(scores, y_true, 'svm_score_distribution.png')
@@ -177,4 +182,8 @@ def run_evaluation():
         traceback.print_exc()
 
 if __name__ == "__main__":
-    run_evaluation()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Evaluate a One-Class SVM on the synthetic test set")
+    parser.add_argument("--model", default=MODEL_PATH, help="model file, e.g. one_class_svm_approx.pkl")
+    args = parser.parse_args()
+    run_evaluation(args.model)
\ No newline at end of file
@@ -0,0 +1,241 @@
+"""
+High-volume synthetic log generator for load testing.
+
+Learns a profile of the log schema, either from a sample of real logs
+(marginal frequencies plus per-agent conditional frequencies) or, without any
+production data, from the categories and scaler statistics stored in
+schema.json / preprocessor.pkl. It then emits arbitrarily many rows with
+vectorized NumPy sampling, streamed to CSV in chunks, with structured anomaly
+injection and seeded reproducibility.
+"""
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import joblib
+from scipy.stats import norm
+
+# --- Paths ---
+BASE_DIR = os.path.dirname(__file__)
+RAW_FILE = os.path.join(BASE_DIR, "opensearch_reduced.csv")
+PREPROCESSOR_PATH = os.path.join(BASE_DIR, "preprocessor.pkl")
+SCHEMA_PATH = os.path.join(BASE_DIR, "schema.json")
+PROFILE_FILE = os.path.join(BASE_DIR, "load_profile.json")
+OUTPUT_FILE = os.path.join(BASE_DIR, "load_testset.csv")
+
+PARENT_COLUMN = "agent.name"
+TIMESTAMP_COLUMN = "data.timestamp"
+MAX_CATEGORIES = 200
+N_QUANTILES = 101
+MISSING = None
+
+INTEGER_COLUMNS = {"data.win.system.eventID", "data.sca.total_checks"}
+OFF_HOURS = [0, 1, 2, 3, 4]
+UNUSUAL_EVENT_IDS = [1102, 4720, 4732, 4672, 7045]  # log cleared, user created, group add, special logon, service installed
+ANOMALY_TYPES = ("rare_user", "off_hours", "unusual_event_id")
+
+
+# --- Profile learning ---
+def _frequencies(series: pd.Series, max_categories: int = MAX_CATEGORIES) -> dict:
+    """Top value frequencies of a column, missing values kept as their own value."""
+    counts = series.astype(object).where(series.notna(), MISSING).value_counts(dropna=False)
+    counts = counts.head(max_categories)
+    return {"values": counts.index.tolist(), "probs": (counts / counts.sum()).tolist()}
+
+
+def _column_spec(series: pd.Series, numeric: bool) -> dict:
+    if numeric:
+        values = pd.to_numeric(series, errors="coerce")
+        observed = values.dropna()
+        # Few distinct values (event IDs, check counts) are sampled as categories
+        if observed.nunique() > MAX_CATEGORIES:
+            return {
+                "kind": "continuous",
+                "missing": float(values.isna().mean()),
+                "quantiles": np.quantile(observed, np.linspace(0, 1, N_QUANTILES)).tolist()
+            }
+        return {"kind": "discrete", **_frequencies(values)}
+    return {"kind": "categorical", **_frequencies(series)}
+
+
+def learn_profile_from_sample(df: pd.DataFrame, categorical, numeric, parent: str = PARENT_COLUMN) -> dict:
+    """Marginals for every column plus conditionals on the parent (agent) column."""
+    features = [c for c in categorical + numeric if c in df.columns and c not in (parent, "hour", "day_of_week")]
+    profile = {"source": "sample", "parent": parent, "columns": {}, "conditional": {}}
+
+    profile["parent_spec"] = _frequencies(df[parent].astype(str))
+    for col in features:
+        profile["columns"][col] = _column_spec(df[col], col in numeric)
+    for parent_value, group in df.groupby(df[parent].astype(str)):
+        profile["conditional"][parent_value] = {
+            col: _column_spec(group[col], col in numeric) for col in features
+        }
+
+    if TIMESTAMP_COLUMN in df.columns:
+        hours = pd.to_datetime(df[TIMESTAMP_COLUMN], errors="coerce").dt.hour.dropna().astype(int)
+    else:
+        hours = pd.Series(dtype=int)
+    hour_counts = np.bincount(hours, minlength=24) + 1  # add-one smoothing keeps every hour possible
+    profile["hour_probs"] = (hour_counts / hour_counts.sum()).tolist()
+    return profile
+
+
+def learn_profile_from_artifacts(schema_path: str = SCHEMA_PATH, preprocessor_path: str = PREPROCESSOR_PATH) -> dict:
+    """Uniform categories and normal numerics from the fitted preprocessor, no log data needed."""
+    preprocessor = joblib.load(preprocessor_path)
+    with open(schema_path, "r") as f:
+        schema = json.load(f)
+
+    profile = {"source": "artifacts", "parent": None, "columns": {}, "conditional": {}}
+    encoder = preprocessor.named_transformers_["cat"].named_steps["encoder"]
+    for col, categories in zip(schema["categorical"], encoder.categories_):
+        if col in ("hour", "day_of_week"):
+            continue
+        values = [v for v in categories.tolist() if v != "missing"] or ["missing"]
+        profile["columns"][col] = {"kind": "categorical", "values": values, "probs": [1 / len(values)] * len(values)}
+
+    scaler = preprocessor.named_transformers_["num"].named_steps["scaler"]
+    normal_quantiles = np.clip(np.linspace(0, 1, N_QUANTILES), 1e-3, 1 - 1e-3)
+    for col, mean, scale in zip(schema["numeric"], scaler.mean_, scaler.scale_):
+        quantiles = norm.ppf(normal_quantiles, loc=mean, scale=scale)
+        profile["columns"][col] = {
+            "kind": "continuous", "missing": 0.0, "quantiles": quantiles.tolist(), "integer": col in INTEGER_COLUMNS
+        }
+
+    profile["hour_probs"] = [1 / 24] * 24
+    return profile
+
+
+# --- Sampling ---
+def _sample_spec(spec: dict, n: int, rng: np.random.Generator) -> np.ndarray:
+    if spec["kind"] == "continuous":
+        u = rng.random(n) * (N_QUANTILES - 1)
+        values = np.interp(u, np.arange(N_QUANTILES), spec["quantiles"])
+        if spec.get("integer"):
+            values = np.round(values)
+        values[rng.random(n) < spec["missing"]] = np.nan
+        return values
+    values = np.asarray(spec["values"], dtype=object)
+    return values[rng.choice(len(values), size=n, p=np.asarray(spec["probs"]) / np.sum(spec["probs"]))]
+
+
+def generate_chunk(profile: dict, n: int, rng: np.random.Generator,
+                   start: pd.Timestamp, days: int) -> pd.DataFrame:
+    """Sample n rows: parent first, then each column conditionally on it."""
+    columns = {}
+    parent = profile["parent"]
+    if parent:
+        parent_values = _sample_spec({"kind": "categorical", **profile["parent_spec"]}, n, rng)
+        columns[parent] = parent_values
+        # Rows per parent value, grouped once and shared by every column
+        codes, names = pd.factorize(parent_values, sort=True)
+        order = np.argsort(codes, kind="stable")
+        groups = np.split(order, np.cumsum(np.bincount(codes, minlength=len(names)))[:-1])
+        for col in profile["columns"]:
+            out = np.empty(n, dtype=object)
+            for parent_value, rows in zip(names, groups):
+                spec = profile["conditional"].get(parent_value, {}).get(col, profile["columns"][col])
+                out[rows] = _sample_spec(spec, len(rows), rng)
+            columns[col] = out
+    else:
+        for col, spec in profile["columns"].items():
+            columns[col] = _sample_spec(spec, n, rng)
+
+    # Timestamps: uniform day, learned hour-of-day profile, uniform second within the hour
+    day_offset = rng.integers(0, days, size=n)
+    hour = rng.choice(24, size=n, p=profile["hour_probs"])
+    seconds = rng.integers(0, 3600, size=n)
+    timestamps = start + pd.to_timedelta(day_offset * 86400 + hour * 3600 + seconds, unit="s")
+    columns[TIMESTAMP_COLUMN] = timestamps
+    columns["hour"] = hour
+    columns["day_of_week"] = timestamps.day_name()
+
+    df = pd.DataFrame(columns)
+    for col, spec in profile["columns"].items():
+        if spec["kind"] != "categorical":
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+
+def inject_anomalies(df: pd.DataFrame, frac_anom: float, rng: np.random.Generator, chunk_id: int) -> pd.DataFrame:
+    """Label rows (1 normal, -1 anomaly) and plant structured anomalies of each type."""
+    df["label"] = 1
+    df["anomaly_type"] = ""
+    n_anomalies = rng.binomial(len(df), frac_anom)
+    rows = rng.choice(len(df), size=n_anomalies, replace=False)
+    kinds = rng.choice(len(ANOMALY_TYPES), size=n_anomalies)
+
+    for kind_idx, kind in enumerate(ANOMALY_TYPES):
+        idx = df.index[rows[kinds == kind_idx]]
+        if kind == "rare_user" and "data.win.eventdata.user" in df.columns:
+            df.loc[idx, "data.win.eventdata.user"] = [f"svc_{chunk_id}_{i}" for i in range(len(idx))]
+        elif kind == "off_hours":
+            shift = rng.choice(OFF_HOURS, size=len(idx)) - df.loc[idx, "hour"].to_numpy()
+            df.loc[idx, TIMESTAMP_COLUMN] = df.loc[idx, TIMESTAMP_COLUMN] + pd.to_timedelta(shift, unit="h")
+            df.loc[idx, "hour"] = df.loc[idx, TIMESTAMP_COLUMN].dt.hour
+            df.loc[idx, "day_of_week"] = df.loc[idx, TIMESTAMP_COLUMN].dt.day_name()
+        elif kind == "unusual_event_id" and "data.win.system.eventID" in df.columns:
+            df.loc[idx, "data.win.system.eventID"] = rng.choice(UNUSUAL_EVENT_IDS, size=len(idx))
+        else:
+            continue
+        df.loc[idx, "label"] = -1
+        df.loc[idx, "anomaly_type"] = kind
+    return df
+
+
+def generate(profile: dict, n_rows: int, out_file: str = OUTPUT_FILE, chunk_size: int = 1_000_000,
+             seed: int = 20, frac_anom: float = 0.01, start: str = "2025-01-01", days: int = 30):
+    """Stream n_rows generated rows to out_file, chunk by chunk."""
+    start_ts = pd.Timestamp(start)
+    written = 0
+    t0 = time.perf_counter()
+    for chunk_id, chunk_start in enumerate(range(0, n_rows, chunk_size)):
+        n = min(chunk_size, n_rows - chunk_start)
+        # Per-chunk streams derived from one seed: same arguments, same file
+        rng = np.random.default_rng([seed, chunk_id])
+        df = generate_chunk(profile, n, rng, start_ts, days)
+        df = inject_anomalies(df, frac_anom, rng, chunk_id)
+        df.to_csv(out_file, mode="w" if chunk_id == 0 else "a", header=chunk_id == 0, index=False)
+        written += n
+        rate = written / (time.perf_counter() - t0)
+        print(f"[*] Wrote {written:,}/{n_rows:,} rows ({rate:,.0f} rows/s)")
+    print(f"[+] Saved {written:,} synthetic rows to {out_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate high-volume synthetic logs for load testing")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--source", choices=["sample", "artifacts", "profile"], default="sample",
+                        help="learn from a log sample, from schema.json/preprocessor.pkl, or reuse a saved profile")
+    parser.add_argument("--sample-file", default=RAW_FILE)
+    parser.add_argument("--sample-rows", type=int, default=200_000)
+    parser.add_argument("--profile", default=PROFILE_FILE)
+    parser.add_argument("--out", default=OUTPUT_FILE)
+    parser.add_argument("--chunk-size", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=20)
+    parser.add_argument("--anomaly-frac", type=float, default=0.01)
+    args = parser.parse_args()
+
+    if args.source == "profile":
+        with open(args.profile, "r") as f:
+            profile = json.load(f)
+    else:
+        if args.source == "sample":
+            from preprocessor import load_data, select_features
+            df = load_data(args.sample_file, sample_size=args.sample_rows)
+            _, categorical, numeric = select_features(df.copy())
+            profile = learn_profile_from_sample(df, categorical, numeric)
+        else:
+            profile = learn_profile_from_artifacts()
+        with open(args.profile, "w") as f:
+            json.dump(profile, f, default=str)
+        print(f"[+] Saved generator profile to {args.profile}")
+
+    generate(profile, args.rows, args.out, args.chunk_size, args.seed, args.anomaly_frac)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ Generate a synthetic test dataset with pseudo labels for evaluating anomaly dete
 import pandas as pd
 import numpy as np
 import os
+from preprocessor import window_features
 
 RAW_FILE = os.path.join(os.path.dirname(__file__), "opensearch_reduced.csv")
 OUTPUT_FILE = os.path.join(os.path.dirname(__file__), "synthetic_testset.csv")
@@ -22,11 +23,13 @@ def load_and_sample(n=1000):
     return df
 
 def add_time_features(df):
-    """Ensure hour and day_of_week exist (needed by preprocessor)."""
+    """Ensure hour, day_of_week and the activity windows exist (needed by preprocessor)."""
     if "data.timestamp" in df.columns:
         df["data.timestamp"] = pd.to_datetime(df["data.timestamp"], errors="coerce")
         df["hour"] = df["data.timestamp"].dt.hour.fillna(0).astype(int)
         df["day_of_week"] = df["data.timestamp"].dt.day_name().fillna("Monday")
+        windows = window_features(df.columns)
+        df = df.join(windows.update_frame(df, df["data.timestamp"]).fillna(0))
     else:
         # fallback if no timestamp present
         df["hour"] = np.random.randint(0, 24, size=len(df))
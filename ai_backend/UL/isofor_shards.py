@@ -0,0 +1,214 @@
+"""
+Per-agent Isolation Forest shards.
+
+Instead of one forest over every agent.name, each agent with at least
+MIN_SHARD_ROWS training rows gets a small forest of its own, so a quiet
+workstation is judged against its own baseline rather than a busy server's,
+and its contamination threshold is its own. Every other agent (too few rows,
+or unseen in training) is scored by the default shard, fitted on all rows.
+
+Shards are fitted in parallel and saved one file each under SHARD_DIR, next
+to an index (shards.json) mapping agents to shards. Retraining some agents
+(python train_isofor.py --mode sharded --agents A B) rewrites only their
+shards and their index entries.
+
+ShardedScorer serves them: a batch is routed by agent, and each shard
+present scores its rows. Shards are loaded on first use into an LRU cache of
+cache_size engines, and the cache reports its hit rate, evictions and
+cold-load latency. When the index changes on disk, the next batch picks it up
+and drops only the cached shards that were retrained.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import joblib
+from joblib import Parallel, delayed
+from sklearn.ensemble import IsolationForest
+from isofor_engine import IsolationForestEngine
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.cpu_budget import cpu_budget
+
+# --- Paths ---
+BASE_DIR = os.path.dirname(__file__)
+SHARD_DIR = os.path.join(BASE_DIR, "isofor_shards")
+INDEX_NAME = "shards.json"
+
+DEFAULT_SHARD = "_default"
+MIN_SHARD_ROWS = 1000
+SHARD_CACHE_SIZE = 8
+SHARD_ESTIMATORS = 100
+
+
+def shard_file_name(shard: str) -> str:
+    """File-system safe, collision-free file name for a shard (agent names are free text)."""
+    digest = hashlib.blake2b(shard.encode(), digest_size=4).hexdigest()
+    return f"{re.sub(r'[^A-Za-z0-9._-]', '_', shard)[:64]}-{digest}.pkl"
+
+
+def load_index(shard_dir: str = SHARD_DIR) -> dict:
+    path = os.path.join(shard_dir, INDEX_NAME)
+    if not os.path.exists(path):
+        return {"agents": {}, "shards": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_index(index: dict, shard_dir: str = SHARD_DIR):
+    # Written to a temporary file first: a serving API never reads a half-written index
+    path = os.path.join(shard_dir, INDEX_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def plan_shards(agents, min_rows: int = MIN_SHARD_ROWS) -> dict:
+    """Shard name -> training row indices: one per agent with min_rows rows, plus the default over all."""
+    agents = np.asarray(agents, dtype=str)
+    names, inverse, counts = np.unique(agents, return_inverse=True, return_counts=True)
+    order = np.argsort(inverse, kind="stable")
+    groups = np.split(order, np.cumsum(counts)[:-1])
+    plan = {name: rows for name, rows, n in zip(names.tolist(), groups, counts) if n >= min_rows}
+    plan[DEFAULT_SHARD] = np.arange(len(agents))
+    return plan
+
+
+def _fit_shard(X: np.ndarray, contamination, random_state: int) -> IsolationForest:
+    # One worker per shard: the shards themselves are the parallel jobs
+    model = IsolationForest(n_estimators=SHARD_ESTIMATORS, contamination=contamination,
+                            random_state=random_state, n_jobs=1)
+    return model.fit(X)
+
+
+def train_shards(X: np.ndarray, agents, only=None, contamination=0.01, random_state: int = 20,
+                 min_rows: int = MIN_SHARD_ROWS, shard_dir: str = SHARD_DIR) -> dict:
+    """
+    Fit and save the shards of X (rows labelled by agent) in parallel. With
+    only (agent names), just the shards those agents map to are refitted and
+    the rest of the saved index is kept. Returns the index.
+    """
+    plan = plan_shards(agents, min_rows)
+    targets = list(plan) if only is None else sorted({agent if agent in plan else DEFAULT_SHARD for agent in only})
+    os.makedirs(shard_dir, exist_ok=True)
+
+    print(f"[*] Training {len(targets)} shards ({len(plan) - 1} agents with >= {min_rows} rows + default)...")
+    start = time.perf_counter()
+    with cpu_budget().allocate("train_shards") as allocation:
+        models = Parallel(prefer="threads")(
+            delayed(_fit_shard)(X[plan[shard]], contamination, random_state) for shard in targets
+        )
+    print(f"[+] Shards trained in {time.perf_counter() - start:.2f}s ({allocation.n_jobs} workers)")
+
+    index = load_index(shard_dir) if only is not None else {"agents": {}, "shards": {}}
+    for shard, model in zip(targets, models):
+        file_name = shard_file_name(shard)
+        joblib.dump(model, os.path.join(shard_dir, file_name))
+        index["shards"][shard] = {"file": file_name, "rows": int(len(plan[shard])), "trained_at": time.time()}
+    # Agents now below min_rows fall back to the default shard
+    index["agents"] = {agent: agent for agent in plan if agent != DEFAULT_SHARD and agent in index["shards"]}
+    index["min_rows"] = min_rows
+    save_index(index, shard_dir)
+    print(f"[+] Shards saved to '{shard_dir}' ({len(index['shards'])} in the index)")
+    return index
+
+
+class ShardedScorer:
+    def __init__(self, shard_dir: str = SHARD_DIR, cache_size: int = SHARD_CACHE_SIZE):
+        self.shard_dir = shard_dir
+        self.index_path = os.path.join(shard_dir, INDEX_NAME)
+        if not os.path.exists(self.index_path):
+            raise FileNotFoundError(f"No sharded models in '{shard_dir}'. Run train_isofor.py --mode sharded first.")
+        self.index_mtime = os.path.getmtime(self.index_path)
+        self.index = load_index(shard_dir)
+        self.cache_size = max(1, cache_size)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.stats = {"batches": 0, "lookups": 0, "hits": 0, "misses": 0, "evictions": 0,
+                      "cold_load_ms_total": 0.0, "cold_load_ms_max": 0.0, "index_reloads": 0}
+        self.rows_per_shard = {}
+
+    def refresh(self):
+        """Reload the index if it changed on disk, dropping the cached shards retrained since."""
+        mtime = os.path.getmtime(self.index_path)
+        if mtime == self.index_mtime:
+            return
+        index = load_index(self.shard_dir)
+        with self._lock:
+            for shard in list(self._cache):
+                if index["shards"].get(shard) != self.index["shards"].get(shard):
+                    del self._cache[shard]
+            self.index, self.index_mtime = index, mtime
+            self.stats["index_reloads"] += 1
+
+    def shard_for(self, agent: str) -> str:
+        return self.index["agents"].get(agent, DEFAULT_SHARD)
+
+    def engine(self, shard: str) -> IsolationForestEngine:
+        """The shard's engine, loaded on a miss; concurrent misses on one shard load it once."""
+        with self._lock:
+            self.stats["lookups"] += 1
+            engine = self._cache.get(shard)
+            if engine is not None:
+                self._cache.move_to_end(shard)
+                self.stats["hits"] += 1
+                return engine
+            load_lock = self._load_locks.setdefault(shard, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                engine = self._cache.get(shard)
+            if engine is not None:  # loaded by a concurrent request meanwhile
+                with self._lock:
+                    self.stats["hits"] += 1
+                return engine
+            start = time.perf_counter()
+            engine = IsolationForestEngine(joblib.load(os.path.join(self.shard_dir, self.index["shards"][shard]["file"])))
+            load_ms = (time.perf_counter() - start) * 1e3
+            with self._lock:
+                self._cache[shard] = engine
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+                    self.stats["evictions"] += 1
+                self.stats["misses"] += 1
+                self.stats["cold_load_ms_total"] += load_ms
+                self.stats["cold_load_ms_max"] = max(self.stats["cold_load_ms_max"], load_ms)
+        return engine
+
+    def score(self, X: np.ndarray, agents) -> tuple:
+        """Scores, labels (-1 = anomaly) and the shard of every row, each row scored by its agent's shard."""
+        self.refresh()
+        shards = np.asarray([self.shard_for(str(agent)) for agent in agents], dtype=object)
+        scores = np.empty(len(X))
+        labels = np.empty(len(X), dtype=int)
+        # Cached shards first: the ones loaded last stay cached for the next batch
+        with self._lock:
+            order = sorted(dict.fromkeys(shards.tolist()), key=lambda shard: shard not in self._cache)
+        for shard in order:
+            rows = np.flatnonzero(shards == shard)
+            scores[rows], labels[rows] = self.engine(shard).score(X[rows])
+            with self._lock:
+                self.rows_per_shard[shard] = self.rows_per_shard.get(shard, 0) + len(rows)
+        with self._lock:
+            self.stats["batches"] += 1
+        return scores, labels, shards
+
+    def report(self) -> dict:
+        """Cache hit rate, evictions and cold-load latency, plus rows scored per shard."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["rows_per_shard"] = dict(self.rows_per_shard)
+            stats["cached"] = list(self._cache)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["cold_load_ms_mean"] = stats["cold_load_ms_total"] / stats["misses"] if stats["misses"] else 0.0
+        stats["cache_size"] = self.cache_size
+        stats["shards"] = len(self.index["shards"])
+        stats["agents_with_own_shard"] = len(self.index["agents"])
+        return stats
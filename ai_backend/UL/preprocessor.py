@@ -1,6 +1,11 @@
 """
 Preprocessing pipeline for log data.
 Handles feature selection, cleaning, and transformation.
+
+When the logs carry data.timestamp, per-entity activity windows
+(common/window_features.py) are added as numeric features: events per source
+IP, user and agent, and distinct agents reached per source IP and user, over
+the last 1/5/60 minutes.
 """
 
 import pandas as pd
@@ -8,11 +13,15 @@ import numpy as np
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer
-from sklearn.preprocessing import OrdinalEncoder, StandardScaler
+from sklearn.preprocessing import OrdinalEncoder, StandardScaler, FunctionTransformer
 import joblib
 import os
+import sys
 from typing import Tuple, List, Union
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.window_features import WindowFeatures, window_feature_names
+
 # --- Paths ---
 BASE_DIR = os.path.dirname(__file__)
 RAW_FILE = os.path.join(BASE_DIR, "opensearch_reduced.csv")
@@ -20,14 +29,23 @@ PROCESSED_FILE = os.path.join(BASE_DIR, "processed_logs.csv")
 PREPROCESSOR_PATH = os.path.join(BASE_DIR, "preprocessor.pkl")
 SCHEMA_PATH = os.path.join(BASE_DIR, "schema.json")
 
+# Every UL detector works on float32 (IsolationForest casts to it internally)
+FEATURE_DTYPE = np.float32
+
+# Activity windows: feature prefix -> log field, and the field counted as destination
+WINDOW_ENTITIES = {'src_ip': 'data.srcip', 'username': 'data.win.eventdata.user', 'agent': 'agent.name'}
+WINDOW_DESTINATION = 'agent.name'
+WINDOW_DISTINCT = ['src_ip', 'username']
+
 def load_data(file_path: str, sample_size: int = None, random_state: int = 42) -> pd.DataFrame:
-    """Load and optionally sample data from CSV file."""
+    """Load and optionally sample data from CSV file (a sample keeps the rows' positions in the file as index)."""
     print(f"[*] Loading data from {file_path}...")
     if sample_size:
         n_rows = sum(1 for _ in open(file_path)) - 1  # Count rows
         if n_rows > sample_size:
             skip = sorted(np.random.RandomState(random_state).randint(1, n_rows, n_rows - sample_size))
             df = pd.read_csv(file_path, skiprows=skip, low_memory=False)
+            df.index = np.setdiff1d(np.arange(1, n_rows + 1), skip) - 1
             print(f"[*] Sampled {sample_size} rows from {n_rows}")
         else:
             df = pd.read_csv(file_path, low_memory=False)
@@ -37,8 +55,13 @@ def load_data(file_path: str, sample_size: int = None, random_state: int = 42) -
     print(f"[+] Data loaded successfully: {df.shape[0]} rows, {df.shape[1]} cols")
     return df
 
-def select_features(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str], List[str]]:
-    """Select and prepare features for modeling."""
+def select_features(df: pd.DataFrame, window_source: pd.DataFrame = None) -> Tuple[pd.DataFrame, List[str], List[str]]:
+    """
+    Select and prepare features for modeling. When df is a sample, pass the
+    full log's timestamp and entity columns as window_source (indexed by row
+    position, as load_data indexes samples): the activity windows are counted
+    over the full log, then picked for the sampled rows.
+    """
     categorical = [
         'agent.name', 'agent.ip', 'data.alert_type',
         'data.win.system.channel', 'data.win.system.providerName',
@@ -62,6 +85,16 @@ def select_features(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str], List[str
         except Exception as e:
             print(f"[!] Warning: Could not process timestamp: {e}")
 
+    # Activity windows over the full log: counted over a sample they would be
+    # about one event per entity, far below what live traffic produces
+    if 'data.timestamp' in df.columns:
+        source = df if window_source is None else window_source
+        windows = window_features(source.columns)
+        if windows.entities:
+            timestamps = pd.to_datetime(source['data.timestamp'], errors='coerce')
+            df = df.join(windows.update_frame(source, timestamps).loc[df.index])
+            numeric.extend(windows.feature_names)
+
     # Select only columns that exist in the dataframe
     selected_cat = [col for col in categorical if col in df.columns]
     selected_num = [col for col in numeric if col in df.columns]
@@ -79,18 +112,82 @@ def select_features(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str], List[str
     print(f"[*] Selected {len(selected_cat)} categorical and {len(selected_num)} numeric features")
     return df_selected, selected_cat, selected_num
 
-def build_preprocessor(categorical: List[str], numeric: List[str]) -> ColumnTransformer:
-    """Build a preprocessing pipeline for the data."""
-    # Preprocessing for numerical data
-    numeric_transformer = Pipeline(steps=[
+def window_features(columns=None) -> WindowFeatures:
+    """Fresh window engine for the entity fields among columns (default: all of them)."""
+    entities = {prefix: col for prefix, col in WINDOW_ENTITIES.items() if columns is None or col in columns}
+    return WindowFeatures(entities, WINDOW_DESTINATION, [prefix for prefix in WINDOW_DISTINCT if prefix in entities])
+
+
+def fitted_window_features(preprocessor) -> Union[WindowFeatures, None]:
+    """Fresh window engine for the window features a fitted preprocessor expects (None: it has none)."""
+    fitted = set(getattr(preprocessor, 'feature_names_in_', ()))
+    entities = [col for prefix, col in WINDOW_ENTITIES.items() if window_feature_names([prefix])[0] in fitted]
+    return window_features(entities) if entities else None
+
+
+def map_logs_for_preprocessor(df: pd.DataFrame, windows=None, timestamps=None, fold: bool = True) -> pd.DataFrame:
+    """
+    Preprocessor columns for a batch of logs sent with the dashboard's keys
+    (api_ul's LogEntry). With windows (a WindowFeatures engine), the batch is
+    folded into it (only read with fold=False) and its activity-window columns added.
+    """
+    mapping = {
+        "agent_name": "agent.name",
+        "agent_ip": "agent.ip",
+        "data_alert_type": "data.alert_type",
+        "hour": "hour",
+        "day_of_week": "day_of_week",
+        "sca_score": "data.sca.score",
+        "sca_total_checks": "data.sca.total_checks",
+        "win_system_eventID": "data.win.system.eventID",
+        "username": "data.win.eventdata.user",
+        "src_ip": "data.srcip"
+    }
+
+    for old, new in mapping.items():
+        if old in df.columns:
+            df[new] = df[old]
+
+    required_columns = [
+        'agent.name', 'agent.ip', 'data.alert_type', 'data.win.system.channel',
+        'data.win.system.providerName', 'data.win.eventdata.processName',
+        'data.win.eventdata.user', 'data.win.eventdata.ruleName',
+        'data.win.system.severityValue', 'data.sca.score',
+        'data.sca.total_checks', 'data.vulnerability.cvss.cvss3.base_score',
+        'data.win.system.eventID', 'hour', 'day_of_week'
+    ]
+
+    for col in required_columns:
+        if col not in df.columns:
+            df[col] = 0 if "score" in col or "Value" in col or "ID" in col else "missing"
+
+    if windows is not None:
+        df = df.join(windows.update_frame(df, timestamps, fold))
+        required_columns += windows.feature_names
+
+    return df[required_columns]
+
+
+def build_preprocessor(categorical: List[str], numeric: List[str], dtype=FEATURE_DTYPE) -> ColumnTransformer:
+    """
+    Build a preprocessing pipeline for the data. Both blocks produce dtype, so
+    the transformed matrix is allocated once, dense and C-contiguous, in dtype.
+    """
+    # Preprocessing for numerical data (cast first: imputer and scaler keep float32)
+    numeric_steps = [
         ('imputer', SimpleImputer(strategy='median')),
         ('scaler', StandardScaler())
-    ])
+    ]
+    if dtype != np.float64:
+        numeric_steps.insert(0, ('cast', FunctionTransformer(
+            np.asarray, kw_args={'dtype': dtype, 'order': 'C'}, feature_names_out='one-to-one'
+        )))
+    numeric_transformer = Pipeline(steps=numeric_steps)
     
     # Preprocessing for categorical data
     categorical_transformer = Pipeline(steps=[
         ('imputer', SimpleImputer(strategy='constant', fill_value='missing')),
-        ('encoder', OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1))
+        ('encoder', OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1, dtype=dtype))
     ])
     
     # Combine preprocessing steps
@@ -98,15 +195,35 @@ def build_preprocessor(categorical: List[str], numeric: List[str]) -> ColumnTran
         transformers=[
             ('num', numeric_transformer, numeric),
             ('cat', categorical_transformer, categorical)
-        ])
+        ],
+        sparse_threshold=0)
     
     return preprocessor
 
+def to_feature_matrix(X) -> np.ndarray:
+    """
+    Dense C-contiguous FEATURE_DTYPE matrix from a preprocessor output. A no-op
+    for build_preprocessor's output; older float64 preprocessors pay one cast here
+    instead of one per detector.
+    """
+    if hasattr(X, "toarray"):
+        X = X.toarray()
+    return np.ascontiguousarray(X, dtype=FEATURE_DTYPE)
+
+def load_window_source(file_path: str) -> Union[pd.DataFrame, None]:
+    """Timestamp and entity columns of every row of the log (None when it has no data.timestamp)."""
+    columns = {'data.timestamp', WINDOW_DESTINATION, *WINDOW_ENTITIES.values()}
+    header = pd.read_csv(file_path, nrows=0).columns
+    if 'data.timestamp' not in header:
+        return None
+    print(f"[*] Reading {file_path} in full for the activity windows...")
+    return pd.read_csv(file_path, usecols=[col for col in header if col in columns], dtype=str)
+
 def process_logs(sample_size: int = 100, random_state: int = 42) -> None:
     """Main function to process logs and save preprocessed data."""
     # Load and prepare data
     df = load_data(RAW_FILE, sample_size=sample_size, random_state=random_state)
-    df_processed, categorical, numeric = select_features(df)
+    df_processed, categorical, numeric = select_features(df, load_window_source(RAW_FILE) if sample_size else None)
     
     # Build and fit preprocessor
     preprocessor = build_preprocessor(categorical, numeric)
@@ -0,0 +1,127 @@
+"""
+Memory / speed profile of the float32 UL feature path against the legacy float64 one.
+
+Builds a synthetic log frame (default 5M rows) with the schema's columns, then
+for both preprocessor dtypes reports the transform and IsolationForest scoring
+time (best of --repeat runs) and the peak memory allocated by transform +
+score, i.e. what api_ul and the trainers do per batch. The legacy path is the
+old build_preprocessor output (float64, F-ordered numeric block) scored as
+before, with the engine's own float32 copy.
+
+Usage:
+    python profile_float32.py --rows 5000000
+"""
+
+import os
+import time
+import argparse
+import tracemalloc
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+from preprocessor import build_preprocessor, to_feature_matrix
+from isofor_engine import IsolationForestEngine
+
+# --- Paths ---
+BASE_DIR = os.path.dirname(__file__)
+OUTPUT_FILE = os.path.join(BASE_DIR, "float32_profile.csv")
+
+FIT_ROWS = 100_000
+REPEAT = 3
+CATEGORICAL = {
+    'agent.name': 200, 'agent.ip': 200, 'data.alert_type': 30,
+    'data.win.system.channel': 10, 'data.win.system.providerName': 40,
+    'data.win.eventdata.processName': 300, 'data.win.eventdata.user': 500,
+    'data.win.eventdata.ruleName': 60, 'data.win.system.severityValue': 5,
+    'hour': 24, 'day_of_week': 7
+}
+NUMERIC = ['data.sca.score', 'data.sca.total_checks',
+           'data.vulnerability.cvss.cvss3.base_score', 'data.win.system.eventID']
+
+
+def generate_logs(n_rows: int, seed: int = 42) -> pd.DataFrame:
+    """Zipf-like categorical values and numeric columns with some gaps."""
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for col, n_values in CATEGORICAL.items():
+        weights = 1.0 / np.arange(1, n_values + 1)
+        codes = rng.choice(n_values, size=n_rows, p=weights / weights.sum())
+        columns[col] = np.asarray([f"{col}_{i}" for i in range(n_values)], dtype=object)[codes]
+    for col in NUMERIC:
+        values = rng.gamma(2.0, 20.0, size=n_rows)
+        values[rng.random(n_rows) < 0.05] = np.nan
+        columns[col] = values
+    return pd.DataFrame(columns)
+
+
+def measure(func, repeat: int = REPEAT):
+    """
+    Result, best time of repeat runs and the peak traced memory (MiB) of one
+    more run; tracing slows allocation-heavy code, so timed runs are untraced.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak / 2**20
+
+
+def profile(n_rows: int, repeat: int = REPEAT) -> pd.DataFrame:
+    print(f"[*] Generating {n_rows:,} rows...")
+    df = generate_logs(n_rows)
+    fit_df = df.iloc[:FIT_ROWS]
+    rows = []
+
+    for name, dtype, as_matrix in (
+        ("float64", np.float64, lambda X: X),
+        ("float32", np.float32, to_feature_matrix),
+    ):
+        print(f"[*] Profiling {name} features...")
+        preprocessor = build_preprocessor(list(CATEGORICAL), NUMERIC, dtype=dtype).fit(fit_df)
+        model = IsolationForest(n_estimators=100, contamination=0.01, random_state=20)
+        model.fit(as_matrix(preprocessor.transform(fit_df)))
+        engine = IsolationForestEngine(model)
+
+        X, transform_seconds, transform_peak = measure(lambda: as_matrix(preprocessor.transform(df)), repeat)
+        _, score_seconds, score_peak = measure(lambda: engine.score_samples(X), repeat)
+        matrix_mib = X.nbytes / 2**20
+        del X
+
+        def transform_and_score():
+            return engine.score_samples(as_matrix(preprocessor.transform(df)))
+        _, total_seconds, total_peak = measure(transform_and_score, repeat)
+        rows.append({
+            "features": name,
+            "rows": n_rows,
+            "matrix_mib": matrix_mib,
+            "transform_s": transform_seconds,
+            "transform_peak_mib": transform_peak,
+            "score_s": score_seconds,
+            "score_peak_mib": score_peak,
+            "total_s": total_seconds,
+            "total_peak_mib": total_peak,
+        })
+
+    report = pd.DataFrame(rows).set_index("features")
+    report.loc["reduction_x"] = report.loc["float64"].div(report.loc["float32"])
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile float32 vs float64 UL feature matrices")
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs per measurement (best time is kept)")
+    args = parser.parse_args()
+
+    report = profile(args.rows, args.repeat)
+    report.to_csv(OUTPUT_FILE)
+    print("\n=== UL float32 profile ===")
+    with pd.option_context("display.width", 200, "display.max_columns", None,
+                           "display.float_format", "{:.2f}".format):
+        print(report)
+    print(f"[+] Profile saved to '{OUTPUT_FILE}'")
@@ -5,9 +5,20 @@ Train DBSCAN on processed logs using schema and preprocessor
 import pandas as pd
 import joblib
 import os
+import time
+import tracemalloc
+import argparse
+from scipy import sparse
 from sklearn.cluster import DBSCAN
+from sklearn.neighbors import NearestNeighbors
 import json
 import numpy as np
+import sys
+from dbscan_index import build_index
+from preprocessor import to_feature_matrix
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.cpu_budget import cpu_budget
 
 # --- Paths ---
 BASE_DIR = os.path.dirname(__file__)
@@ -16,6 +27,9 @@ PREPROCESSOR_PATH = os.path.join(BASE_DIR, "preprocessor.pkl")
 SCHEMA_PATH = os.path.join(BASE_DIR, "schema.json")
 MODEL_FILE = os.path.join(BASE_DIR, "dbscan_model.pkl")
 
+# Query rows per radius-neighbors block in scalable mode
+CHUNK_ROWS = 10000
+
 # --- Functions ---
 def load_schema_and_preprocessor():
     print("[*] Loading preprocessor and schema...")
@@ -46,7 +60,7 @@ def ensure_schema_columns(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
 
 def train_dbscan(X_processed, eps=0.1, min_samples=6):
     print("[*] Training DBSCAN model...")
-    model = DBSCAN(eps=eps, min_samples=min_samples, n_jobs=-1)
+    model = DBSCAN(eps=eps, min_samples=min_samples)  # workers come from the CPU budget
     model.fit(X_processed)
     
     n_clusters = len(set(model.labels_)) - (1 if -1 in model.labels_ else 0)
@@ -55,7 +69,79 @@ def train_dbscan(X_processed, eps=0.1, min_samples=6):
     
     return model
 
-def main():
+def deduplicate_rows(X):
+    """Collapse identical rows, keeping first-occurrence order.
+
+    Returns the unique rows, their multiplicities and, for every input row, the
+    position of its unique row.
+    """
+    _, first_idx, inverse, counts = np.unique(
+        X, axis=0, return_index=True, return_inverse=True, return_counts=True
+    )
+    order = np.argsort(first_idx)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return X[first_idx[order]], counts[order], rank[inverse.ravel()]
+
+def radius_neighbors_graph_chunked(X, eps, chunk_rows=CHUNK_ROWS, n_jobs=None):
+    """Sparse eps-neighborhood graph built block by block to bound working memory."""
+    nn = NearestNeighbors(radius=eps, n_jobs=n_jobs).fit(X)
+    blocks = [
+        nn.radius_neighbors_graph(X[start:start + chunk_rows], mode="distance")
+        for start in range(0, X.shape[0], chunk_rows)
+    ]
+    return sparse.vstack(blocks, format="csr")
+
+def train_dbscan_scalable(X_processed, eps=0.1, min_samples=6, chunk_rows=CHUNK_ROWS):
+    """DBSCAN over deduplicated rows and a chunked sparse neighbor graph.
+
+    Ordinal-encoded logs contain many identical rows. Clustering the unique rows
+    with their counts as sample weights and a precomputed radius graph gives the
+    same labels as exact DBSCAN on the full matrix, with memory proportional to
+    the neighbor pairs between distinct rows.
+    """
+    print("[*] Training DBSCAN model (scalable mode)...")
+    X_unique, counts, inverse = deduplicate_rows(np.asarray(X_processed))
+    print(f"[*] {len(X_unique)} distinct rows out of {len(X_processed)}")
+
+    graph = radius_neighbors_graph_chunked(X_unique, eps, chunk_rows=chunk_rows)
+    print(f"[*] Radius graph: {graph.nnz} neighbor pairs")
+    unique_model = DBSCAN(eps=eps, min_samples=min_samples, metric="precomputed")
+    unique_model.fit(graph, sample_weight=counts)
+
+    # Expand back to one label per input row, as a regular DBSCAN fit would report
+    is_core_unique = np.zeros(len(X_unique), dtype=bool)
+    is_core_unique[unique_model.core_sample_indices_] = True
+    model = DBSCAN(eps=eps, min_samples=min_samples)
+    model.labels_ = unique_model.labels_[inverse]
+    model.core_sample_indices_ = np.where(is_core_unique[inverse])[0]
+    model.components_ = np.asarray(X_processed)[model.core_sample_indices_]
+    model.n_features_in_ = X_unique.shape[1]
+
+    n_clusters = len(set(model.labels_)) - (1 if -1 in model.labels_ else 0)
+    n_noise = int((model.labels_ == -1).sum())
+    print(f"[+] DBSCAN trained: {n_clusters} clusters, {n_noise} noise points")
+
+    return model
+
+def benchmark_scaling(X_processed, sizes=(10_000, 50_000, 100_000), eps=0.1, min_samples=6):
+    """Report wall time and peak traced memory of exact vs scalable DBSCAN as data grows."""
+    rng = np.random.RandomState(42)
+    for n_rows in sizes:
+        X = X_processed[rng.randint(0, len(X_processed), n_rows)]
+        results = {}
+        for mode, fit in (("exact", train_dbscan), ("scalable", train_dbscan_scalable)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            results[mode] = fit(X, eps=eps, min_samples=min_samples).labels_
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"[+] {n_rows:>9} rows | {mode:<8} | {elapsed:8.2f}s | peak {peak / 2**20:10.1f} MiB")
+        same = np.array_equal(results["exact"], results["scalable"])
+        print(f"[+] {n_rows:>9} rows | labels identical: {same}")
+
+def main(mode="exact", benchmark=False):
     try:
         # Load artifacts
         preprocessor, schema = load_schema_and_preprocessor()
@@ -66,22 +152,36 @@ def main():
 
         # Transform features
         print("[*] Transforming data with preprocessor...")
-        X_processed = preprocessor.transform(df)
-        if hasattr(X_processed, "toarray"):
-            X_processed = X_processed.toarray()
+        X_processed = to_feature_matrix(preprocessor.transform(df))
         print(f"[+] Preprocessed data shape: {X_processed.shape}")
 
-        # Train DBSCAN
-        model = train_dbscan(X_processed)
+        with cpu_budget().allocate("train_dbscan"):
+            if benchmark:
+                benchmark_scaling(X_processed)
+                return
+
+            # Train DBSCAN
+            if mode == "scalable":
+                model = train_dbscan_scalable(X_processed)
+            else:
+                model = train_dbscan(X_processed)
 
         # Save trained model
         joblib.dump(model, MODEL_FILE)
         print(f"[+] DBSCAN model saved to '{MODEL_FILE}'")
 
+        # Core-sample index used to score new logs out of sample
+        build_index(model)
+
     except Exception as e:
         print(f"[!] An unexpected error occurred: {e}")
         import traceback
         traceback.print_exc()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train DBSCAN on processed logs")
+    parser.add_argument("--mode", choices=["exact", "scalable"], default="exact")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="compare exact and scalable modes on growing samples")
+    args = parser.parse_args()
+    main(mode=args.mode, benchmark=args.benchmark)
\ No newline at end of file
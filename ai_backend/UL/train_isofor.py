@@ -1,13 +1,35 @@
 """
 Train anomaly detection model (Isolation Forest) on processed logs
+
+--mode streaming trains without holding the logs in memory: one pass over
+the CSV in chunks fills, per tree, a reservoir sample of max_samples rows
+(plus one larger uniform sample that sets the contamination threshold), the
+trees are then fitted on their samples in parallel and assembled into a
+regular IsolationForest. A second chunked pass scores the logs for the
+anomaly export, rollup and drift baseline.
+
+--mode sharded trains one small forest per agent.name instead (see
+isofor_shards.py); --agents retrains only the shards of those agents.
 """
 
 import pandas as pd
+import numpy as np
 import joblib
-import matplotlib.pyplot as plt
+import argparse
 from sklearn.ensemble import IsolationForest
 import os
+import sys
 import json
+from joblib import Parallel, delayed
+from isofor_engine import IsolationForestEngine
+from isofor_shards import train_shards, MIN_SHARD_ROWS
+from anomaly_rollup import AnomalyRollup, TRAINING_ROLLUP_FILE
+from preprocessor import to_feature_matrix
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.drift import DriftMonitor
+from common.cpu_budget import cpu_budget
+from common.sketches import Reservoir
 
 # --- Paths ---
 BASE_DIR = os.path.dirname(__file__)
@@ -15,28 +37,58 @@ INPUT_FILE = os.path.join(BASE_DIR, "processed_logs.csv")
 MODEL_FILE = os.path.join(BASE_DIR, "isolation_forest.pkl")
 PREPROCESSOR_PATH = os.path.join(BASE_DIR, "preprocessor.pkl")
 SCHEMA_PATH = os.path.join(BASE_DIR, "schema.json")
+SCORES_FILE = os.path.join(BASE_DIR, "isofor_scores.npz")
+DRIFT_BASELINE_FILE = os.path.join(BASE_DIR, "drift_baseline.pkl")
+ANOMALIES_FILE = os.path.join(BASE_DIR, "anomalies.csv")
+TIMESTAMP_COLUMN = "data.timestamp"  # read along when present: the rollup buckets by event time
 
+N_ESTIMATORS = 100
+CONTAMINATION = 0.01
+RANDOM_STATE = 20
 
-def load_and_preprocess():
-    print(f"[*] Loading raw data from {INPUT_FILE}...")
-    df = pd.read_csv(INPUT_FILE, low_memory=False)
-    print(f"[+] Loaded {df.shape[0]} rows, {df.shape[1]} columns")
+# Streaming mode: rows per CSV chunk, rows per tree and the threshold sample
+STREAM_CHUNK_ROWS = 100_000
+MAX_SAMPLES = 256
+CALIBRATION_ROWS = 100_000
 
-    # Load preprocessor + schema
+# Fields api_ul compares against the training data: LogEntry name -> processed column
+DRIFT_CATEGORICAL = {"agent_name": "agent.name", "agent_ip": "agent.ip", "data_alert_type": "data.alert_type",
+                     "day_of_week": "day_of_week"}
+DRIFT_NUMERIC = {"hour": "hour", "sca_score": "data.sca.score", "win_system_eventID": "data.win.system.eventID"}
+
+
+def load_preprocessor_and_schema():
     print("[*] Loading preprocessor and schema...")
     preprocessor = joblib.load(PREPROCESSOR_PATH)
     with open(SCHEMA_PATH, "r") as f:
         schema = json.load(f)
+    return preprocessor, schema
+
 
-    # Ensure we keep only schema-defined features
-    features = schema["categorical"] + schema["numeric"]
-    df = df[[col for col in features if col in df.columns]].copy()
+def read_processed_logs(schema: dict, **kwargs):
+    """
+    The schema's features of processed_logs.csv, plus data.timestamp when
+    present (a DataFrame, or an iterator of them with chunksize=...).
+    Categoricals are read as strings, as the preprocessor was fitted on them,
+    so every chunk gets the same dtypes.
+    """
+    header = pd.read_csv(INPUT_FILE, nrows=0).columns
+    features = [col for col in schema["categorical"] + schema["numeric"] + [TIMESTAMP_COLUMN] if col in header]
+    return pd.read_csv(INPUT_FILE, usecols=features, dtype={col: str for col in schema["categorical"]},
+                       low_memory=False, **kwargs)
+
+
+def load_and_preprocess():
+    preprocessor, schema = load_preprocessor_and_schema()
+
+    # Keep only schema-defined features
+    print(f"[*] Loading raw data from {INPUT_FILE}...")
+    df = read_processed_logs(schema)
+    print(f"[+] Loaded {df.shape[0]} rows, {df.shape[1]} columns")
 
     # Apply preprocessing
     print("[*] Applying preprocessing...")
-    X = preprocessor.transform(df)
-    if hasattr(X, "toarray"):  # handle sparse matrices
-        X = X.toarray()
+    X = to_feature_matrix(preprocessor.transform(df))
     print(f"[+] Preprocessed data shape: {X.shape}")
 
     return df, X
@@ -45,30 +97,91 @@ def load_and_preprocess():
 def train_model(X):
     print("[*] Training Isolation Forest...")
     model = IsolationForest(
-        n_estimators=100,
-        contamination=0.01,  
-        random_state=20,
-        n_jobs=-1
+        n_estimators=N_ESTIMATORS,
+        contamination=CONTAMINATION,
+        random_state=RANDOM_STATE  # workers come from the CPU budget
     )
-    model.fit(X)
-    print("[+] Model training completed")
+    with cpu_budget().allocate("train_isofor") as allocation:
+        model.fit(X)
+    print(f"[+] Model training completed ({allocation.n_jobs} workers)")
+    return model
+
+
+def iter_preprocessed_chunks(preprocessor, schema: dict, chunk_rows: int = STREAM_CHUNK_ROWS):
+    """(rows, feature matrix) per chunk of processed_logs.csv."""
+    for df in read_processed_logs(schema, chunksize=chunk_rows):
+        yield df, to_feature_matrix(preprocessor.transform(df))
+
+
+def _fit_tree(X_sample: np.ndarray, seed: int) -> IsolationForest:
+    return IsolationForest(n_estimators=1, max_samples=len(X_sample), random_state=seed).fit(X_sample)
+
+
+def assemble_forest(trees: list, n_seen: int, contamination=CONTAMINATION,
+                    calibration: np.ndarray = None) -> IsolationForest:
+    """
+    One IsolationForest from single-tree forests fitted on equal-size samples.
+    Its offset_ is set as fit() would, from the scores of a uniform sample
+    (calibration) instead of every training row.
+    """
+    first = trees[0]
+    model = IsolationForest(n_estimators=len(trees), max_samples=first.max_samples_,
+                            contamination=contamination, random_state=RANDOM_STATE)
+    model.__dict__.update({key: value for key, value in vars(first).items() if key.endswith("_") or key.startswith("_")})
+    model.estimators_ = [tree.estimators_[0] for tree in trees]
+    model.estimators_features_ = [tree.estimators_features_[0] for tree in trees]
+    model._seeds = np.concatenate([tree._seeds for tree in trees])
+    model._decision_path_lengths = tuple(tree._decision_path_lengths[0] for tree in trees)
+    model._average_path_length_per_tree = tuple(tree._average_path_length_per_tree[0] for tree in trees)
+    model._n_samples = n_seen
+
+    if contamination == "auto":
+        model.offset_ = -0.5
+    else:
+        scores = IsolationForestEngine(model).score_samples(calibration)
+        model.offset_ = float(np.percentile(scores, 100.0 * contamination))
     return model
 
 
+def train_model_streaming(chunk_rows: int = STREAM_CHUNK_ROWS, n_estimators: int = N_ESTIMATORS,
+                          max_samples: int = MAX_SAMPLES, calibration_rows: int = CALIBRATION_ROWS):
+    """IsolationForest from one chunked pass: memory is the chunk plus the samples, not the logs."""
+    preprocessor, schema = load_preprocessor_and_schema()
+    rng = np.random.default_rng(RANDOM_STATE)
+    reservoirs, calibration = None, None
+
+    print(f"[*] Sampling {n_estimators} x {max_samples} rows from {INPUT_FILE} in chunks of {chunk_rows}...")
+    for _, X_chunk in iter_preprocessed_chunks(preprocessor, schema, chunk_rows):
+        if reservoirs is None:
+            seeds = rng.integers(np.iinfo(np.int32).max, size=n_estimators + 1)
+            reservoirs = [Reservoir(max_samples, X_chunk.shape[1], seed=seed) for seed in seeds[:-1]]
+            calibration = Reservoir(calibration_rows, X_chunk.shape[1], seed=seeds[-1])
+        for reservoir in reservoirs:
+            reservoir.add(X_chunk)
+        calibration.add(X_chunk)
+    if reservoirs is None:
+        raise ValueError(f"No rows in {INPUT_FILE}")
+    print(f"[+] Sampled from {calibration.seen} rows")
+
+    print(f"[*] Training {n_estimators} isolation trees...")
+    tree_seeds = rng.integers(np.iinfo(np.int32).max, size=n_estimators)
+    with cpu_budget().allocate("train_isofor") as allocation:
+        trees = Parallel(prefer="threads")(
+            delayed(_fit_tree)(reservoir.sample(), int(seed)) for reservoir, seed in zip(reservoirs, tree_seeds)
+        )
+        model = assemble_forest(trees, calibration.seen, CONTAMINATION, calibration.sample())
+    print(f"[+] Model training completed ({allocation.n_jobs} workers)")
+    return model, calibration.sample()
+
+
 def save_model(model):
     joblib.dump(model, MODEL_FILE)
     print(f"[+] Model saved to {MODEL_FILE}")
 
 
 def plot_scores(scores):
-    plt.hist(scores, bins=50, color="skyblue", edgecolor="black")
-    plt.title("Distribution of Anomaly Scores")
-    plt.xlabel("Anomaly Score")
-    plt.ylabel("Frequency")
-    out_file = os.path.join(BASE_DIR, "anomaly_score_distribution.png")
-    plt.savefig(out_file)
-    print(f"[+] Histogram saved to '{out_file}'")
-    plt.close()
+    from plotting import plot_score_histogram
+    plot_score_histogram(scores, os.path.join(BASE_DIR, "anomaly_score_distribution.png"))
 
 
 def save_anomalies(df, predictions, scores):
@@ -76,43 +189,119 @@ def save_anomalies(df, predictions, scores):
     anomalies["anomaly_score"] = scores
     anomalies["anomaly_label"] = predictions
     anomalies_only = anomalies[anomalies["anomaly_label"] == -1]
-    out_csv = os.path.join(BASE_DIR, "anomalies.csv")
-    anomalies_only.to_csv(out_csv, index=False)
-    print(f"[+] Anomalies saved to '{out_csv}' ({len(anomalies_only)} rows)")
+    anomalies_only.to_csv(ANOMALIES_FILE, index=False)
+    print(f"[+] Anomalies saved to '{ANOMALIES_FILE}' ({len(anomalies_only)} rows)")
+
+    # Rebuilt on every run: the training rollup only ever holds this model's scores
+    rollup = AnomalyRollup()
+    rollup.update(df, scores, predictions, df.get(TIMESTAMP_COLUMN))
+    rollup.save(TRAINING_ROLLUP_FILE)
+    print(f"[+] Anomaly rollup saved to '{TRAINING_ROLLUP_FILE}'")
+
+
+def drift_fields(df):
+    """The drift-tracked columns of processed rows, under their LogEntry names."""
+    fields = {**DRIFT_CATEGORICAL, **DRIFT_NUMERIC}
+    return df[[col for col in fields.values() if col in df.columns]].rename(
+        columns={col: name for name, col in fields.items()})
+
+
+def save_drift_baseline(df, scores):
+    baseline = DriftMonitor(list(DRIFT_CATEGORICAL), list(DRIFT_NUMERIC), score="anomaly_score")
+    baseline.update(drift_fields(df), scores)
+    baseline.save(DRIFT_BASELINE_FILE)
+    print(f"[+] Drift baseline saved to '{DRIFT_BASELINE_FILE}'")
 
 
 def plot_scatter(scores, predictions):
-    plt.figure(figsize=(12, 6))
-    plt.scatter(
-        range(len(scores)), scores,
-        c=["red" if p == -1 else "blue" for p in predictions],
-        alpha=0.6
-    )
-    plt.title("Anomaly Scores Scatter Plot")
-    plt.xlabel("Log Index")
-    plt.ylabel("Anomaly Score")
-    plt.grid(True)
-    out_file = os.path.join(BASE_DIR, "scatter_anomaly_scores.png")
-    plt.savefig(out_file)
-    print(f"[+] Saved scatter plot as '{out_file}'")
-    plt.close()
+    from plotting import plot_score_density
+    plot_score_density(scores, predictions, os.path.join(BASE_DIR, "scatter_anomaly_scores.png"))
+
+
+def save_scores(scores, predictions):
+    np.savez_compressed(SCORES_FILE, scores=scores, predictions=predictions)
+    print(f"[+] Scores saved to '{SCORES_FILE}' (plot later with plotting.py)")
+
+
+def score_streaming(model, chunk_rows: int = STREAM_CHUNK_ROWS):
+    """Chunked scoring pass: anomaly export, rollup and drift baseline without loading the logs."""
+    preprocessor, schema = load_preprocessor_and_schema()
+    engine = IsolationForestEngine(model)
+    rollup = AnomalyRollup()
+    baseline = DriftMonitor(list(DRIFT_CATEGORICAL), list(DRIFT_NUMERIC), score="anomaly_score")
+    n_rows, n_anomalies = 0, 0
+    with cpu_budget().allocate("score_isofor"):
+        for df, X_chunk in iter_preprocessed_chunks(preprocessor, schema, chunk_rows):
+            scores, predictions = engine.score(X_chunk)
+            anomalies = df[predictions == -1].assign(anomaly_score=scores[predictions == -1], anomaly_label=-1)
+            anomalies.to_csv(ANOMALIES_FILE, mode="w" if n_rows == 0 else "a", header=n_rows == 0, index=False)
+            rollup.update(df, scores, predictions, df.get(TIMESTAMP_COLUMN))
+            baseline.update(drift_fields(df), scores)
+            n_rows += len(df)
+            n_anomalies += len(anomalies)
+    print(f"{n_anomalies}/{n_rows} anomalies detected")
+    print(f"[+] Anomalies saved to '{ANOMALIES_FILE}' ({n_anomalies} rows)")
+    rollup.save(TRAINING_ROLLUP_FILE)
+    print(f"[+] Anomaly rollup saved to '{TRAINING_ROLLUP_FILE}'")
+    baseline.save(DRIFT_BASELINE_FILE)
+    print(f"[+] Drift baseline saved to '{DRIFT_BASELINE_FILE}'")
+
+
+def main_streaming(plots=True, chunk_rows: int = STREAM_CHUNK_ROWS):
+    model, sample = train_model_streaming(chunk_rows)
+    save_model(model)
+
+    print("[*] Scoring anomalies...")
+    score_streaming(model, chunk_rows)
+
+    # Score file and plots cover the uniform threshold sample, not every row
+    sample_scores, sample_predictions = IsolationForestEngine(model).score(sample)
+    save_scores(sample_scores, sample_predictions)
+    if plots:
+        plot_scores(sample_scores)
+        plot_scatter(sample_scores, sample_predictions)
+
+
+def main_sharded(agents=None, min_rows: int = MIN_SHARD_ROWS):
+    df, X = load_and_preprocess()
+    index = train_shards(X, df["agent.name"].to_numpy(), only=agents, contamination=CONTAMINATION,
+                         random_state=RANDOM_STATE, min_rows=min_rows)
+    for shard, entry in sorted(index["shards"].items()):
+        print(f"    {shard}: {entry['rows']} rows")
 
 
-def main():
+def main(plots=True):
     df, X = load_and_preprocess()
     model = train_model(X)
     save_model(model)
 
     print("[*] Scoring anomalies...")
-    anomaly_scores = model.decision_function(X)
-    predictions = model.predict(X)
+    with cpu_budget().allocate("score_isofor"):
+        anomaly_scores, predictions = IsolationForestEngine(model).score(X)
     print("[+] Anomaly scores computed")
     print(f"{(predictions == -1).sum()}/{len(predictions)} anomalies detected")
 
     save_anomalies(df, predictions, anomaly_scores)
-    plot_scores(anomaly_scores)
-    plot_scatter(anomaly_scores, predictions)
+    save_scores(anomaly_scores, predictions)
+    save_drift_baseline(df, anomaly_scores)
+    if plots:
+        plot_scores(anomaly_scores)
+        plot_scatter(anomaly_scores, predictions)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the Isolation Forest on processed logs")
+    parser.add_argument("--no-plots", action="store_true", help="skip plotting (see plotting.py)")
+    parser.add_argument("--mode", choices=["memory", "streaming", "sharded"], default="memory",
+                        help="streaming: out-of-core training from CSV chunks; sharded: one model per agent")
+    parser.add_argument("--chunk-rows", type=int, default=STREAM_CHUNK_ROWS)
+    parser.add_argument("--agents", nargs="+", default=None, help="sharded: retrain only these agents' shards")
+    parser.add_argument("--min-rows", type=int, default=MIN_SHARD_ROWS,
+                        help="sharded: fewer training rows and an agent uses the default shard")
+    args = parser.parse_args()
+    if args.mode == "sharded":
+        main_sharded(args.agents, args.min_rows)
+    elif args.mode == "streaming":
+        main_streaming(plots=not args.no_plots, chunk_rows=args.chunk_rows)
+    else:
+        main(plots=not args.no_plots)
\ No newline at end of file
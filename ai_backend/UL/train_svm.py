@@ -1,14 +1,32 @@
 import pandas as pd
 import joblib
 import os
+import sys
+import time
+import argparse
 from sklearn.svm import OneClassSVM
+from sklearn.kernel_approximation import Nystroem
+from sklearn.linear_model import SGDOneClassSVM
+from sklearn.pipeline import Pipeline
 import numpy as np
+from preprocessor import to_feature_matrix
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.cpu_budget import cpu_budget
 
 # --- Paths ---
 BASE_DIR = os.path.dirname(__file__)
 RAW_FILE = os.path.join(BASE_DIR, "opensearch_reduced.csv")
 PREPROCESSOR_PATH = os.path.join(BASE_DIR, "preprocessor.pkl")
 MODEL_FILE = os.path.join(BASE_DIR, "one_class_svm.pkl")
+APPROX_MODEL_FILE = os.path.join(BASE_DIR, "one_class_svm_approx.pkl")
+COMPARISON_FILE = os.path.join(BASE_DIR, "svm_comparison.csv")
+
+# Approximate mode settings
+NYSTROEM_COMPONENTS = 300
+CHUNK_SIZE = 50_000
+N_EPOCHS = 3
+NU = 0.05
 
 # --- Functions ---
 def load_data(file_path):
@@ -21,8 +39,103 @@ def load_data(file_path):
     return df
 
 
+def prepare_features(df, preprocessor):
+    """Reindex raw rows to the preprocessor input and transform them."""
+    expected_features = list(preprocessor.feature_names_in_)
+    df_prepared = df.reindex(columns=expected_features, fill_value=np.nan)
+    X_processed = to_feature_matrix(preprocessor.transform(df_prepared))
+    return X_processed
+
+
+def train_approx_model(file_path=RAW_FILE, chunk_size=CHUNK_SIZE, n_epochs=N_EPOCHS,
+                       n_components=NYSTROEM_COMPONENTS):
+    """Nystroem RBF feature map + SGD one-class SVM, fitted over CSV chunks.
+
+    Training is linear in the number of rows and scoring costs one
+    n_components-dimensional dot product per row, whatever the data volume.
+    The kernel map is BLAS-bound, so its cores go to BLAS threads.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+    preprocessor = joblib.load(PREPROCESSOR_PATH)
+    n_features = len(preprocessor.get_feature_names_out())
+
+    feature_map = None
+    ocsvm = SGDOneClassSVM(nu=NU, random_state=42)
+    n_rows = 0
+    with cpu_budget().allocate("train_svm_approx", blas=True) as allocation:
+        for epoch in range(n_epochs):
+            print(f"[*] Approximate OCSVM epoch {epoch + 1}/{n_epochs}...")
+            for chunk in pd.read_csv(file_path, chunksize=chunk_size, low_memory=False):
+                X_chunk = prepare_features(chunk, preprocessor)
+                if feature_map is None:
+                    # gamma="auto" in the exact model is 1 / n_features
+                    feature_map = Nystroem(
+                        kernel="rbf", gamma=1.0 / n_features,
+                        n_components=min(n_components, len(X_chunk)), random_state=42
+                    )
+                    feature_map.fit(X_chunk)
+                ocsvm.partial_fit(feature_map.transform(X_chunk))
+                if epoch == 0:
+                    n_rows += len(X_chunk)
+    print(f"[+] Approximate OCSVM trained on {n_rows} rows ({allocation.blas_threads} BLAS threads)")
+
+    return Pipeline(steps=[("feature_map", feature_map), ("ocsvm", ocsvm)])
+
+
+def compare_models():
+    """Fit exact and approximate models, then compare runtime and PR-AUC on the test set."""
+    from evaluate_svm import TEST_FILE, load_data as load_test, select_and_prepare_features, pr_auc
+
+    preprocessor = joblib.load(PREPROCESSOR_PATH)
+    test_df = load_test(TEST_FILE)
+    y_true = test_df["label"].values
+    X_test = to_feature_matrix(
+        preprocessor.transform(select_and_prepare_features(test_df.drop(columns=["label"])))
+    )
+
+    rows = []
+    for mode, model_file in (("exact", MODEL_FILE), ("approximate", APPROX_MODEL_FILE)):
+        start = time.perf_counter()
+        if mode == "exact":
+            if not train_model():
+                print(f"[!] Exact model training failed, not comparing a stale {MODEL_FILE}")
+                return
+        else:
+            joblib.dump(train_approx_model(), APPROX_MODEL_FILE)
+        fit_seconds = time.perf_counter() - start
+
+        model = joblib.load(model_file)
+        start = time.perf_counter()
+        scores = model.decision_function(X_test)
+        score_seconds = time.perf_counter() - start
+        rows.append({
+            "mode": mode,
+            "fit_seconds": round(fit_seconds, 3),
+            "score_us_per_row": round(1e6 * score_seconds / len(X_test), 3),
+            "pr_auc": round(pr_auc(y_true, scores), 4)
+        })
+
+    report = pd.DataFrame(rows)
+    report.to_csv(COMPARISON_FILE, index=False)
+    print("\n=== Exact vs approximate One-Class SVM ===")
+    print(report.to_string(index=False))
+    print(f"[+] Comparison saved to {COMPARISON_FILE}")
+
+
+def fit_exact_model(X_processed):
+    """Fits the exact RBF One-Class SVM on an already transformed matrix."""
+    model = OneClassSVM(
+        kernel="rbf",   # Radial basis function kernel
+        gamma="auto",   # Scale automatically
+        nu=NU           # Expected proportion of anomalies (tunable!)
+    )
+    model.fit(X_processed)
+    return model
+
+
 def train_model():
-    """Trains a One-Class SVM model on preprocessed data."""
+    """Trains a One-Class SVM model on preprocessed data (True once it is saved)."""
     try:
         # Load cleaned data
         df = load_data(RAW_FILE)
@@ -41,25 +154,17 @@ def train_model():
 
         # Transform data
         print("[*] Transforming data with preprocessor...")
-        X_processed = preprocessor.transform(df_prepared)
-
-        # Convert sparse to dense if needed
-        if hasattr(X_processed, "toarray"):
-            X_processed = X_processed.toarray()
+        X_processed = to_feature_matrix(preprocessor.transform(df_prepared))
 
         # Train One-Class SVM
         print("[*] Training One-Class SVM...")
-        model = OneClassSVM(
-            kernel="rbf",   # Radial basis function kernel
-            gamma="auto",   # Scale automatically
-            nu=0.05          # Expected proportion of anomalies (tunable!)
-        )
-        model.fit(X_processed)
+        model = fit_exact_model(X_processed)
         print("[+] Model training completed.")
 
         # Save model
         joblib.dump(model, MODEL_FILE)
         print(f"[+] Model saved to {MODEL_FILE}")
+        return True
 
     except FileNotFoundError as e:
         print(f"[!] Error: {e}")
@@ -68,7 +173,19 @@ def train_model():
         print(f"[!] An unexpected error occurred: {e}")
         import traceback
         traceback.print_exc()
+    return False
 
 
 if __name__ == "__main__":
-    train_model()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train a One-Class SVM on raw logs")
+    parser.add_argument("--mode", choices=["exact", "approximate", "compare"], default="exact")
+    args = parser.parse_args()
+
+    if args.mode == "approximate":
+        model = train_approx_model()
+        joblib.dump(model, APPROX_MODEL_FILE)
+        print(f"[+] Model saved to {APPROX_MODEL_FILE}")
+    elif args.mode == "compare":
+        compare_models()
+    else:
+        train_model()
\ No newline at end of file
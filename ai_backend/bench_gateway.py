@@ -0,0 +1,162 @@
+"""
+Benchmark: combined scoring gateway vs the two-call path.
+
+Starts the SL (8000), UL (8001) and gateway (8002) services, then for each
+batch size scores the same unified events on the gateway and on the two-call
+path, one after the other so they see the same load:
+
+    two-call sequential   /predict_risk/ then /predict_anomaly/
+    two-call parallel     both requests at once (what a dashboard can do)
+    gateway               one /score_events/ call
+
+Every batch goes to the gateway and to one two-call variant (alternating),
+so each service folds every event into its activity windows exactly once,
+and events carry their generation time as timestamp: both paths see the same
+window state. The responses are compared per event; mismatches are reported.
+
+What each path does besides scoring is not the same. /predict_risk/ and
+/predict_anomaly/ also update their drift monitors and the anomaly rollup
+(and publish to live feeds that have no subscribers here), which the gateway
+leaves to the per-model services; that work is part of the two-call latency.
+
+It reports the client-side latency per way (p50 / p95), the events per second
+and the resident memory of the two services against the gateway. Every
+service must already have its trained models (run the SL and UL training
+first).
+
+    python bench_gateway.py
+    python bench_gateway.py --batch-sizes 1 10 100 500 --requests 100
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from loadtest import SERVICES, make_event, split_event, start_service, stop_service, process_tree_rss, BASE_DIR
+
+RESULTS_FILE = os.path.join(BASE_DIR, "bench_gateway_results.csv")
+TIMEOUT = 60.0
+
+
+def post(url: str, payload) -> tuple:
+    """Status and decoded JSON body (None on errors) of a POST."""
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def two_call(alerts: list, logs: list, pool: ThreadPoolExecutor = None) -> tuple:
+    """Status, latency and (risk, anomaly) responses of the two-call path; with pool, both requests are in flight together."""
+    risk_url = f"http://127.0.0.1:{SERVICES['sl']['port']}{SERVICES['sl']['endpoints']['predict_risk']}"
+    anomaly_url = f"http://127.0.0.1:{SERVICES['ul']['port']}{SERVICES['ul']['endpoints']['predict_anomaly']}"
+    start = time.perf_counter()
+    if pool is None:
+        responses = [post(risk_url, alerts), post(anomaly_url, logs)]
+    else:
+        futures = [pool.submit(post, risk_url, alerts), pool.submit(post, anomaly_url, logs)]
+        responses = [future.result() for future in futures]
+    latency_s = time.perf_counter() - start
+    return max(status for status, _ in responses), latency_s, [body for _, body in responses]
+
+
+def gateway(events: list) -> tuple:
+    url = f"http://127.0.0.1:{SERVICES['gateway']['port']}{SERVICES['gateway']['endpoints']['score_events']}"
+    start = time.perf_counter()
+    status, body = post(url, events)
+    return status, time.perf_counter() - start, body
+
+
+def mismatches(combined: list, risk: list, anomaly: list) -> int:
+    """Events whose gateway scores differ from the two services' answers."""
+    return sum(
+        g["risk_score"] != r["risk_score"] or g["decided_by"] != r["decided_by"]
+        or g["anomaly_label"] != a["anomaly_label"] or not np.isclose(g["anomaly_score"], a["anomaly_score"])
+        for g, r, a in zip(combined, risk, anomaly)
+    )
+
+
+def run_batch_size(batch_size: int, n_requests: int, rng: random.Random, pool: ThreadPoolExecutor) -> list:
+    records = []
+    for i in range(n_requests):
+        now = time.time()
+        events = [{**make_event(rng), "timestamp": now} for _ in range(batch_size)]
+        alerts, logs = map(list, zip(*(split_event(event) for event in events)))
+        path = "two-call sequential" if i % 2 == 0 else "two-call parallel"
+        status, latency_s, (risk, anomaly) = two_call(alerts, logs, None if i % 2 == 0 else pool)
+        records.append({"batch_size": batch_size, "path": path, "status": status, "latency_s": latency_s})
+        gateway_status, latency_s, combined = gateway(events)
+        records.append({"batch_size": batch_size, "path": "gateway", "status": gateway_status, "latency_s": latency_s,
+                        "mismatches": mismatches(combined, risk, anomaly)
+                        if status == gateway_status == 200 else None})
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scoring gateway against the two-call path.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--requests", type=int, default=50,
+                        help="batches per batch size (each to the gateway and, alternately, one two-call variant)")
+    parser.add_argument("--warmup", type=int, default=6, help="batches discarded before measuring")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    procs = {}
+    try:
+        for service in ("sl", "ul", "gateway"):
+            procs[service] = start_service(service, 1, SERVICES[service]["port"])
+        rng = random.Random(args.seed)
+        records = []
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            run_batch_size(10, args.warmup, rng, pool)
+            for batch_size in args.batch_sizes:
+                print(f"[*] Batch size {batch_size}: {args.requests} batches...")
+                records.extend(run_batch_size(batch_size, args.requests, rng, pool))
+        rss = {service: process_tree_rss(proc.pid) for service, proc in procs.items()}
+    finally:
+        for proc in procs.values():
+            stop_service(proc)
+
+    records = pd.DataFrame(records)
+    errors = records[records["status"] != 200]
+    if not errors.empty:
+        print(f"[!] {len(errors)} requests failed: {errors.groupby('path')['status'].value_counts().to_dict()}")
+
+    rows = []
+    for (batch_size, path), group in records[records["status"] == 200].groupby(["batch_size", "path"], sort=False):
+        latency_ms = group["latency_s"] * 1000
+        rows.append({
+            "batch_size": batch_size, "path": path, "requests": len(group),
+            "p50_ms": latency_ms.quantile(0.50), "p95_ms": latency_ms.quantile(0.95),
+            "events_per_s": batch_size * len(group) / group["latency_s"].sum(),
+            "mismatched_events": int(group["mismatches"].sum()) if path == "gateway" else None,
+        })
+    report = pd.DataFrame(rows)
+    for batch_size, group in report.groupby("batch_size"):
+        baseline = group.loc[group["path"] == "two-call sequential", "p50_ms"]
+        if not baseline.empty:
+            report.loc[group.index, "p50_vs_sequential"] = group["p50_ms"] / baseline.iloc[0]
+    report.to_csv(args.out, index=False)
+
+    print("\n=== Gateway vs two-call path (two-call latency includes drift and rollup updates) ===")
+    with pd.option_context("display.width", 200, "display.max_columns", None,
+                           "display.float_format", "{:.2f}".format):
+        print(report.to_string(index=False))
+    two_services = rss["sl"] + rss["ul"]
+    print(f"\n[+] RSS: SL + UL {two_services / 2**20:.0f} MiB, gateway {rss['gateway'] / 2**20:.0f} MiB "
+          f"({rss['gateway'] / two_services:.0%})")
+    print(f"[+] Results saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Helpers shared by the SL and UL services."""
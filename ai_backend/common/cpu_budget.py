@@ -0,0 +1,223 @@
+"""
+Process-wide CPU budget for training and scoring calls.
+
+Estimators no longer ask for every core with n_jobs=-1; each fit or scoring
+call takes an allocation from the budget of its process instead:
+
+    with cpu_budget().allocate("predict_risk") as allocation:
+        classifier.predict_proba(X)
+
+Inside the block joblib, and so every sklearn estimator left at n_jobs=None,
+runs allocation.n_jobs workers (joblib's config is per thread, so concurrent
+requests each see their own). A call gets the cores it asks for, capped by the
+per-call limit and by what other calls hold right now (shared fairly with
+calls already waiting). When no core is free it waits, at most max_wait_ms,
+after which it runs on one core and is counted as overcommitted. Nested
+allocations on the same thread reuse the outer one.
+
+Parallel workers must not each start a full BLAS pool: a call gets either
+n_jobs workers with single-threaded BLAS, or (blas=True, for BLAS-bound work
+like kernel maps) one worker with that many BLAS threads. BLAS pools are
+global to the process, so they are limited to the smallest allotment among
+the running calls; OpenMP is limited per calling thread.
+
+Limits come from the environment of the process:
+
+    TRINETRA_CPU_CORES=4        cores this process may use (default: the CPUs
+                                it may run on / WEB_CONCURRENCY, the number of
+                                uvicorn workers sharing them)
+    TRINETRA_CPU_PER_CALL=2     most cores a single call gets (default: all)
+    TRINETRA_CPU_WAIT_MS=2000   longest wait for a free core
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from joblib import parallel_config
+
+MAX_WAIT_MS = 2000.0
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (affinity / cgroup cpusets included where the OS reports them)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class Allocation:
+    def __init__(self, name: str, cores: int, blas: bool, wait_ms: float, overcommitted: bool):
+        self.name = name
+        self.cores = cores
+        self.n_jobs = 1 if blas else cores
+        self.blas_threads = cores if blas else 1
+        self.wait_ms = wait_ms
+        self.overcommitted = overcommitted
+
+
+class CPUBudget:
+    def __init__(self, cores: int, per_call: int = None, max_wait_ms: float = MAX_WAIT_MS):
+        self.cores = max(1, int(cores))
+        self.per_call = max(1, min(int(per_call or self.cores), self.cores))
+        self.max_wait_ms = max_wait_ms
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.waiting = 0
+        self.calls = {}
+        self._active = {}
+        self._blas_limit = None
+        self._blas_limiter = None
+        self._controller = None
+        self._local = threading.local()
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_env(cls, cores: int = None) -> "CPUBudget":
+        """Budget from the environment; cores, when given, overrides TRINETRA_CPU_CORES."""
+        workers = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+        cores = cores or os.environ.get("TRINETRA_CPU_CORES")
+        return cls(
+            int(cores) if cores else max(1, available_cpus() // workers),
+            per_call=int(os.environ.get("TRINETRA_CPU_PER_CALL", "0")) or None,
+            max_wait_ms=float(os.environ.get("TRINETRA_CPU_WAIT_MS", MAX_WAIT_MS)),
+        )
+
+    # --- Allocation ---
+    @contextmanager
+    def allocate(self, name: str, cores: int = None, blas: bool = False):
+        """
+        Hold cores (default: the per-call limit) for the duration of the block;
+        blas=True gives them to BLAS threads instead of joblib workers.
+        """
+        outer = getattr(self._local, "allocation", None)
+        if outer is not None:
+            yield outer
+            return
+
+        want = max(1, min(cores or self.per_call, self.per_call))
+        start = time.perf_counter()
+        with self._cond:
+            self.waiting += 1
+            deadline = start + self.max_wait_ms / 1e3
+            while self.in_use >= self.cores and time.perf_counter() < deadline:
+                self._cond.wait(deadline - time.perf_counter())
+            self.waiting -= 1
+            free = self.cores - self.in_use
+            granted = 1 if free <= 0 else min(want, -(-free // (self.waiting + 1)))
+            allocation = Allocation(name, granted, blas, (time.perf_counter() - start) * 1e3, free <= 0)
+            self.in_use += granted
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self._active[id(allocation)] = allocation.blas_threads
+            self._limit_blas()
+
+        held_from = time.perf_counter()
+        self._local.allocation = allocation
+        openmp = self._openmp_limiter(granted)
+        try:
+            with parallel_config(n_jobs=allocation.n_jobs):
+                yield allocation
+        finally:
+            if openmp is not None:
+                openmp.restore_original_limits()
+            self._local.allocation = None
+            with self._cond:
+                self.in_use -= granted
+                del self._active[id(allocation)]
+                self._limit_blas()
+                self._record(allocation, (time.perf_counter() - held_from) * 1e3)
+                self._cond.notify_all()
+
+    # --- Thread pools ---
+    def _pools(self):
+        if self._controller is None:
+            from threadpoolctl import ThreadpoolController
+            self._controller = ThreadpoolController()
+        return self._controller
+
+    def _limit_blas(self):
+        """BLAS threads = smallest allotment among running calls (caller holds the lock)."""
+        limit = min(self._active.values()) if self._active else None
+        if limit == self._blas_limit:
+            return
+        if self._blas_limiter is not None:
+            self._blas_limiter.restore_original_limits()
+            self._blas_limiter = None
+        blas = self._pools().select(user_api="blas")
+        if limit is not None and blas.lib_controllers:
+            self._blas_limiter = blas.limit(limits=limit)
+        self._blas_limit = limit
+
+    def _openmp_limiter(self, threads: int):
+        openmp = self._pools().select(user_api="openmp")
+        return openmp.limit(limits=threads) if openmp.lib_controllers else None
+
+    # --- Metrics ---
+    def _record(self, allocation: Allocation, held_ms: float):
+        stats = self.calls.setdefault(allocation.name, {
+            "calls": 0, "cores_total": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0,
+            "held_ms_total": 0.0, "overcommitted": 0,
+        })
+        stats["calls"] += 1
+        stats["cores_total"] += allocation.cores
+        stats["wait_ms_total"] += allocation.wait_ms
+        stats["wait_ms_max"] = max(stats["wait_ms_max"], allocation.wait_ms)
+        stats["held_ms_total"] += held_ms
+        stats["overcommitted"] += allocation.overcommitted
+
+    def stats(self) -> dict:
+        """Budget, current load and per-call allocations and wait times."""
+        with self._cond:
+            calls = {name: dict(s) for name, s in self.calls.items()}
+            report = {
+                "cores": self.cores,
+                "per_call": self.per_call,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "waiting": self.waiting,
+                "blas_threads": self._blas_limit,
+            }
+        for s in calls.values():
+            s["cores_mean"] = round(s.pop("cores_total") / s["calls"], 3)
+            s["wait_ms_mean"] = round(s["wait_ms_total"] / s["calls"], 4)
+            s["held_ms_mean"] = round(s["held_ms_total"] / s["calls"], 4)
+            for key in ("wait_ms_total", "wait_ms_max", "held_ms_total"):
+                s[key] = round(s[key], 3)
+        report["calls"] = calls
+        return report
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def cpu_budget() -> CPUBudget:
+    """The budget of this process, configured from the environment on first use."""
+    global _budget
+    if _budget is None:
+        with _budget_lock:
+            if _budget is None:
+                _budget = CPUBudget.from_env()
+    return _budget
+
+
+@contextmanager
+def scoped_cpu_budget(cores: int = None):
+    """
+    Make cpu_budget() a budget of `cores` for the block, then restore the
+    previous one (a worker process running its share of the parent's
+    budget; reused workers get the share of each call). None keeps the
+    current budget.
+    """
+    global _budget
+    if cores is None:
+        yield cpu_budget()
+        return
+    with _budget_lock:
+        previous, _budget = _budget, CPUBudget.from_env(cores)
+    try:
+        yield _budget
+    finally:
+        with _budget_lock:
+            _budget = previous
@@ -0,0 +1,236 @@
+"""
+Training-vs-serving feature drift from streaming sketches.
+
+A DriftMonitor keeps, per tracked field, a HeavyHitters sketch (categorical
+fields) or a QuantileSketch (numeric fields and the model's output score).
+Training scripts fill one over their data and save it as the baseline; the
+scoring APIs fold every batch into a live monitor and compare the two on
+request:
+
+    categorical : total variation distance between the two value
+                  distributions (top values estimated from the count-min
+                  sketches, the rest folded into one "other" bucket) and the
+                  share of live rows whose value never occurred in training
+    numeric     : population stability index over the baseline deciles,
+                  plus baseline vs live quantiles
+
+Memory is fixed by the sketch sizes, not by traffic. To keep the per-request
+cost to a list append, update() only buffers the scored frame; buffered
+frames are folded into the sketches together once FLUSH_ROWS rows are pending
+(or when a report is requested or the monitor saved).
+"""
+
+import os
+import time
+import threading
+from operator import itemgetter
+import numpy as np
+import pandas as pd
+import joblib
+
+from common.sketches import HeavyHitters, QuantileSketch, TOP_K, hash_values
+
+PSI_ALERT = 0.2
+DISTANCE_ALERT = 0.2
+NOVEL_ALERT = 0.1
+QUANTILES = (0.05, 0.5, 0.95)
+REPORT_TOP = 10
+MIN_SHARE = 1e-4
+FLUSH_ROWS = 4096
+
+
+def population_stability(baseline: QuantileSketch, current: QuantileSketch) -> float:
+    """PSI of current against baseline over the baseline deciles."""
+    if baseline.count == 0 or current.count == 0:
+        return float("nan")
+    edges = np.unique(baseline.quantiles(np.linspace(0.1, 0.9, 9)))
+    expected = np.diff(np.concatenate([[0.0], baseline.cdf(edges), [1.0]]))
+    actual = np.diff(np.concatenate([[0.0], current.cdf(edges), [1.0]]))
+    expected = np.maximum(expected, MIN_SHARE)
+    actual = np.maximum(actual, MIN_SHARE)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def _as_float(values: list) -> np.ndarray:
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+
+
+def _finite(value: float):
+    return None if value is None or not np.isfinite(value) else round(float(value), 6)
+
+
+class DriftMonitor:
+    """Sketches of the tracked fields of a scored stream; safe to update from API threads."""
+
+    def __init__(self, categorical: list, numeric: list, score: str = "score", top_k: int = TOP_K):
+        self.categorical = {col: HeavyHitters(top_k) for col in categorical}
+        self.numeric = {col: QuantileSketch() for col in list(numeric) + [score]}
+        self.score = score
+        self.top_k = top_k
+        self.novel = {col: 0 for col in categorical}
+        self.rows = 0
+        self.batches = 0
+        self.update_ms = 0.0
+        self.scoring_ms = 0.0
+        self.created_at = time.time()
+        self.baseline = None
+        self._pending = []
+        self._pending_rows = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["baseline"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def fresh(self) -> "DriftMonitor":
+        """Empty monitor tracking the same fields, compared against this one."""
+        monitor = DriftMonitor(list(self.categorical), [c for c in self.numeric if c != self.score],
+                               self.score, self.top_k)
+        monitor.baseline = self
+        return monitor
+
+    # --- Updates ---
+    def update(self, rows, scores=None, scoring_ms: float = 0.0):
+        """
+        Add one batch: a DataFrame or a list of dicts (the API request records,
+        cheapest to buffer). rows must not be modified afterwards, as it is read
+        at the next flush; fields missing from it are skipped. scoring_ms is the
+        time the caller spent scoring the batch (for the overhead figure).
+        """
+        start = time.perf_counter()
+        scores = None if scores is None else np.asarray(scores, dtype=np.float64)
+        with self._lock:
+            self._pending.append((rows, scores))
+            self._pending_rows += len(rows)
+            if self._pending_rows >= FLUSH_ROWS:
+                self._flush()
+            self.rows += len(rows)
+            self.batches += 1
+            self.scoring_ms += scoring_ms
+            self.update_ms += (time.perf_counter() - start) * 1e3
+
+    def _flush(self):
+        """Fold the buffered batches into the sketches (caller holds the lock)."""
+        pending, self._pending, self._pending_rows = self._pending, [], 0
+        if not pending:
+            return
+        columns = self._columns([rows for rows, _ in pending])
+        for col, sketch in self.categorical.items():
+            if col in columns:
+                distinct, counts = sketch.add(columns[col])
+                if self.baseline is not None:
+                    unseen = self.baseline.categorical[col].estimate_hashes(distinct) == 0
+                    self.novel[col] += int(counts[unseen].sum())
+        for col, sketch in self.numeric.items():
+            if col == self.score:
+                scores = [s for _, s in pending if s is not None]
+                if scores:
+                    sketch.add(np.concatenate(scores))
+            elif col in columns:
+                sketch.add(_as_float(columns[col]))
+
+    def _columns(self, batches: list) -> dict:
+        """Tracked field -> list of its values across the buffered batches."""
+        columns = {}
+        tracked = [col for col in list(self.categorical) + list(self.numeric) if col != self.score]
+        for rows in batches:
+            if isinstance(rows, pd.DataFrame):
+                fields = [col for col in tracked if col in rows.columns]
+                values = [rows[col].tolist() for col in fields]
+            elif rows:
+                fields = [col for col in tracked if col in rows[0]]
+                # One pass over the records, then transpose
+                values = list(zip(*map(itemgetter(*fields), rows))) if len(fields) > 1 else \
+                    [[row[fields[0]] for row in rows]] if fields else []
+            else:
+                continue
+            for col, column in zip(fields, values):
+                columns.setdefault(col, []).extend(column)
+        return columns
+
+    # --- Comparison ---
+    def _categorical_report(self, col: str, baseline: "DriftMonitor") -> dict:
+        current = self.categorical[col]
+        report = {"rows": current.count, "distance": None, "novel_share": None}
+        top = current.top(REPORT_TOP)
+        if baseline is None or current.count == 0 or baseline.categorical[col].count == 0:
+            report["top"] = [{"value": v, "share": _finite(n / current.count)} for v, n in top] if current.count else []
+            return report
+
+        reference = baseline.categorical[col]
+        hashes = np.union1d(np.fromiter(current.candidates, dtype=np.uint64, count=len(current.candidates)),
+                            np.fromiter(reference.candidates, dtype=np.uint64, count=len(reference.candidates)))
+        live = np.minimum(current.estimate_hashes(hashes) / current.count, 1.0)
+        base = np.minimum(reference.estimate_hashes(hashes) / reference.count, 1.0)
+        other_live = max(0.0, 1.0 - live.sum())
+        other_base = max(0.0, 1.0 - base.sum())
+        report["distance"] = _finite(0.5 * (np.abs(live - base).sum() + abs(other_live - other_base)))
+        report["novel_share"] = _finite(self.novel[col] / current.count) if baseline is self.baseline else None
+        baseline_share = reference.estimate_hashes(hash_values([v for v, _ in top])) / reference.count
+        report["top"] = [
+            {"value": v, "share": _finite(n / current.count), "baseline_share": _finite(b)}
+            for (v, n), b in zip(top, baseline_share)
+        ]
+        return report
+
+    def _numeric_report(self, col: str, baseline: "DriftMonitor") -> dict:
+        current = self.numeric[col]
+        reference = baseline.numeric.get(col) if baseline is not None else None
+        live_q = current.quantiles(QUANTILES)
+        base_q = reference.quantiles(QUANTILES) if reference is not None else [None] * len(QUANTILES)
+        return {
+            "rows": current.count,
+            "psi": _finite(population_stability(reference, current)) if reference is not None else None,
+            "mean": _finite(current.mean()),
+            "baseline_mean": _finite(reference.mean()) if reference is not None else None,
+            "quantiles": {str(q): {"live": _finite(l), "baseline": _finite(b)}
+                          for q, l, b in zip(QUANTILES, live_q, base_q)},
+        }
+
+    def compare(self, baseline: "DriftMonitor" = None) -> dict:
+        """Drift report of this monitor against baseline (default: the one it was created from)."""
+        baseline = baseline if baseline is not None else self.baseline
+        with self._lock:
+            start = time.perf_counter()
+            self._flush()
+            self.update_ms += (time.perf_counter() - start) * 1e3
+            categorical = {col: self._categorical_report(col, baseline) for col in self.categorical}
+            numeric = {col: self._numeric_report(col, baseline) for col in self.numeric}
+            stats = {
+                "batches": self.batches,
+                "update_ms_total": round(self.update_ms, 3),
+                "update_ms_per_batch": round(self.update_ms / self.batches, 4) if self.batches else 0.0,
+                "overhead_pct": round(100 * self.update_ms / self.scoring_ms, 3) if self.scoring_ms else None,
+            }
+
+        drifted = [col for col, r in categorical.items()
+                   if (r["distance"] or 0) > DISTANCE_ALERT or (r["novel_share"] or 0) > NOVEL_ALERT]
+        drifted += [col for col, r in numeric.items() if (r["psi"] or 0) > PSI_ALERT]
+        return {
+            "since": self.created_at,
+            "rows": self.rows,
+            "baseline_rows": baseline.rows if baseline is not None else None,
+            "drifted": drifted,
+            "categorical": categorical,
+            "numeric": numeric,
+            "monitor": stats,
+        }
+
+    # --- Persistence ---
+    def save(self, path: str):
+        with self._lock:
+            self._flush()
+            joblib.dump(self, path)
+
+    @classmethod
+    def load(cls, path: str) -> "DriftMonitor":
+        return joblib.load(path) if os.path.exists(path) else None
@@ -0,0 +1,155 @@
+"""
+Server-push feed of scored events over Server-Sent Events.
+
+Scoring handlers call LiveFeed.publish() with the events they just produced;
+every subscribed client receives them on a text/event-stream response.
+Each subscriber owns a bounded buffer with one of three overflow policies, so
+a slow browser only ever loses its own events and never blocks scoring:
+
+    drop_oldest : evict the oldest buffered event (default)
+    drop_newest : refuse new events while the buffer is full
+    coalesce    : keep only the latest event per key (e.g. per IP), then
+                  evict the oldest key if still over capacity
+
+The number of events a client lost is reported in the next event it gets.
+publish() is thread-safe (sync FastAPI handlers run in a threadpool) and
+costs nothing when nobody is subscribed.
+"""
+
+import json
+import asyncio
+import threading
+from collections import OrderedDict, deque
+
+MAX_BUFFER = 256
+HEARTBEAT_SECONDS = 15.0
+POLICIES = ("drop_oldest", "drop_newest", "coalesce")
+
+
+class Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_buffer: int, policy: str,
+                 key: str = None, accept=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}', expected one of {POLICIES}")
+        if policy == "coalesce" and not key:
+            raise ValueError("The coalesce policy needs an event key")
+        self.loop = loop
+        self.max_buffer = max_buffer
+        self.policy = policy
+        self.key = key
+        self.accept = accept
+        self.buffer = OrderedDict() if policy == "coalesce" else deque()
+        self.dropped = 0
+        self.delivered = 0
+        self.wakeup = asyncio.Event()
+
+    def _put_many(self, events: list):
+        """Runs on the subscriber's event loop."""
+        for event in events:
+            if self.accept is not None and not self.accept(event):
+                continue
+            if self.policy == "coalesce":
+                event_key = event.get(self.key)
+                if event_key in self.buffer:
+                    self.dropped += 1
+                    del self.buffer[event_key]
+                self.buffer[event_key] = event
+                if len(self.buffer) > self.max_buffer:
+                    self.buffer.popitem(last=False)
+                    self.dropped += 1
+            elif len(self.buffer) >= self.max_buffer:
+                self.dropped += 1
+                if self.policy == "drop_oldest":
+                    self.buffer.popleft()
+                    self.buffer.append(event)
+            else:
+                self.buffer.append(event)
+        if self.buffer:
+            self.wakeup.set()
+
+    def _drain(self) -> list:
+        events = list(self.buffer.values()) if self.policy == "coalesce" else list(self.buffer)
+        self.buffer.clear()
+        self.wakeup.clear()
+        return events
+
+
+class LiveFeed:
+    def __init__(self, event_type: str, max_buffer: int = MAX_BUFFER):
+        self.event_type = event_type
+        self.max_buffer = max_buffer
+        self.published = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def subscribe(self, policy: str = "drop_oldest", max_buffer: int = None,
+                  key: str = None, accept=None) -> Subscriber:
+        """
+        Register a client; must be called from the event loop that will stream to it.
+        max_buffer (default: the feed's) may not exceed the feed's own bound.
+        """
+        if max_buffer is None:
+            max_buffer = self.max_buffer
+        elif not 1 <= max_buffer <= self.max_buffer:
+            raise ValueError(f"max_buffer must be between 1 and {self.max_buffer}, got {max_buffer}")
+        subscriber = Subscriber(asyncio.get_running_loop(), max_buffer, policy, key, accept)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, events: list):
+        """Hand a batch of scored events to every subscriber without waiting for them."""
+        if not self._subscribers or not events:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        self.published += len(events)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber._put_many, events)
+            except RuntimeError:
+                # Event loop already closed: the client is gone
+                self.unsubscribe(subscriber)
+
+    async def stream(self, subscriber: Subscriber, request):
+        """Async generator of SSE frames for one subscriber, ending when the client disconnects."""
+        try:
+            yield f"retry: 3000\n: subscribed to {self.event_type}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    await asyncio.wait_for(subscriber.wakeup.wait(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                events = subscriber._drain()
+                if not events:
+                    continue  # the drop count waits for an event to carry it
+                dropped, subscriber.dropped = subscriber.dropped, 0
+                subscriber.delivered += len(events)
+                frames = []
+                for event in events:
+                    if dropped:
+                        event = {**event, "dropped_before": dropped}
+                        dropped = 0
+                    frames.append(f"event: {self.event_type}\ndata: {json.dumps(event)}\n\n")
+                yield "".join(frames)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> dict:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            "subscribers": len(subscribers),
+            "published": self.published,
+            "buffered": sum(len(s.buffer) for s in subscribers),
+            "dropped_pending": sum(s.dropped for s in subscribers),
+        }
@@ -0,0 +1,246 @@
+"""
+Opt-in sampling profiler for individual scoring requests.
+
+When a slow batch shows up in production, profile exactly that request
+instead of trying to reproduce it offline. A background thread samples the
+stack of the thread running the handler every PROFILE_INTERVAL_MS and the
+collapsed stacks are written, with the endpoint, batch size and model
+version, to a rotating directory (newest PROFILE_KEEP files are kept).
+
+Configured from the environment of the API process:
+
+    TRINETRA_PROFILING=1          allow profiling; requests sent with the
+                                  header "X-Trinetra-Profile: 1" are profiled
+    TRINETRA_PROFILE_SAMPLE=0.01  also profile this fraction of all requests
+    TRINETRA_PROFILE_DIR=...      output directory (default: ./profiles)
+
+When profiling is not enabled, install() adds no middleware and profiled()
+returns the handler unchanged, so there is no per-request cost at all.
+Profiled responses carry the profile file name in X-Trinetra-Profile.
+
+Show the hottest functions of a saved profile:
+    python request_profiler.py profiles/<file>.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import asyncio
+import functools
+import threading
+import contextvars
+from collections import Counter
+from datetime import datetime
+
+PROFILE_INTERVAL_MS = 1.0
+PROFILE_KEEP = 50
+PROFILE_HEADER = "x-trinetra-profile"
+MAX_STACK_DEPTH = 64
+
+_profile_request = contextvars.ContextVar("profile_request", default=None)
+
+
+def file_version(path: str) -> str:
+    """Model version from the artifact itself: file name and modification time."""
+    if not os.path.exists(path):
+        return "unknown"
+    stamp = datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y%m%dT%H%M%S")
+    return f"{os.path.basename(path)}@{stamp}"
+
+
+class StackSampler:
+    """Collapsed-stack sampling of one thread from a background thread."""
+
+    def __init__(self, thread_id: int, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1e3
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.duration_ms = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def _run(self):
+        own_file = __file__
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None and len(names) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                if code.co_filename != own_file:
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+                self.samples += 1
+
+    def __enter__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.duration_ms = (time.perf_counter() - self._start) * 1e3
+        self._stop.set()
+        self._thread.join()
+
+
+class RequestProfiler:
+    def __init__(self, service: str, enabled: bool = False, sample_rate: float = 0.0,
+                 directory: str = "profiles", model_path: str = None,
+                 interval_ms: float = PROFILE_INTERVAL_MS, keep: int = PROFILE_KEEP):
+        self.service = service
+        self.enabled = enabled or sample_rate > 0
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.model_path = model_path
+        self.interval_ms = interval_ms
+        self.keep = keep
+        self.written = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, service: str, model_path: str = None) -> "RequestProfiler":
+        return cls(
+            service,
+            enabled=os.environ.get("TRINETRA_PROFILING", "") not in ("", "0"),
+            sample_rate=float(os.environ.get("TRINETRA_PROFILE_SAMPLE", "0")),
+            directory=os.environ.get("TRINETRA_PROFILE_DIR", "profiles"),
+            model_path=model_path,
+        )
+
+    # --- Wiring ---
+    def install(self, app):
+        """Add the middleware that decides which requests are profiled."""
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+
+        @app.middleware("http")
+        async def profile_trigger(request, call_next):
+            requested = request.headers.get(PROFILE_HEADER, "") not in ("", "0")
+            if not requested and not (self.sample_rate and random.random() < self.sample_rate):
+                return await call_next(request)
+            # Shared dict: the handler (possibly in a worker thread) reports the file back
+            state = {"trigger": "header" if requested else "sample", "file": None}
+            token = _profile_request.set(state)
+            try:
+                response = await call_next(request)
+            finally:
+                _profile_request.reset(token)
+            if state["file"]:
+                response.headers["X-Trinetra-Profile"] = state["file"]
+            return response
+
+    def profiled(self, handler=None, *, model_path: str = None):
+        """
+        Decorate a scoring handler (@profiler.profiled or
+        @profiler.profiled(model_path=...) when it serves another model); its
+        first list argument is taken as the batch (otherwise a batch of one).
+        Async handlers are sampled on the event loop thread, so requests
+        interleaved at their await points can show up in the profile.
+        """
+        if handler is None:
+            return functools.partial(self.profiled, model_path=model_path)
+        if not self.enabled:
+            return handler
+        model_path = model_path or self.model_path
+
+        def start(state):
+            if state is None or state.get("active"):
+                return None
+            state["active"] = True  # nested profiled handlers (predict_single) are not profiled twice
+            return StackSampler(threading.get_ident(), self.interval_ms).__enter__()
+
+        def finish(state, sampler, args, kwargs):
+            sampler.__exit__()
+            batch = next((v for v in list(args) + list(kwargs.values()) if isinstance(v, list)), None)
+            batch_size = len(batch) if batch is not None else 1
+            state["file"] = self._write(handler.__name__, batch_size, model_path, state["trigger"], sampler)
+
+        if asyncio.iscoroutinefunction(handler):
+            @functools.wraps(handler)
+            async def wrapper(*args, **kwargs):
+                state = _profile_request.get()
+                sampler = start(state)
+                if sampler is None:
+                    return await handler(*args, **kwargs)
+                try:
+                    return await handler(*args, **kwargs)
+                finally:
+                    finish(state, sampler, args, kwargs)
+        else:
+            @functools.wraps(handler)
+            def wrapper(*args, **kwargs):
+                state = _profile_request.get()
+                sampler = start(state)
+                if sampler is None:
+                    return handler(*args, **kwargs)
+                try:
+                    return handler(*args, **kwargs)
+                finally:
+                    finish(state, sampler, args, kwargs)
+        return wrapper
+
+    # --- Output ---
+    def _write(self, endpoint: str, batch_size: int, model_path: str, trigger: str,
+               sampler: StackSampler) -> str:
+        started = sampler.started_at
+        name = f"{datetime.fromtimestamp(started).strftime('%Y%m%dT%H%M%S_%f')}_{self.service}_{endpoint}.json"
+        profile = {
+            "service": self.service,
+            "endpoint": endpoint,
+            "batch_size": batch_size,
+            "model_version": file_version(model_path) if model_path else "unknown",
+            "trigger": trigger,
+            "started_at": started,
+            "duration_ms": round(sampler.duration_ms, 3),
+            "interval_ms": self.interval_ms,
+            "samples": sampler.samples,
+            "stacks": dict(sampler.stacks.most_common()),
+        }
+        with self._lock:
+            with open(os.path.join(self.directory, name), "w") as f:
+                json.dump(profile, f)
+            self.written += 1
+            self._rotate()
+        return name
+
+    def _rotate(self):
+        files = sorted(
+            (os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith(".json")),
+            key=os.path.getmtime
+        )
+        for path in files[:-self.keep]:
+            os.remove(path)
+
+
+def summarize(profile: dict, top: int = 15) -> list:
+    """[(function, self samples, total samples)] sorted by self samples."""
+    own, total = Counter(), Counter()
+    for stack, count in profile["stacks"].items():
+        frames = [f.rsplit(":", 1)[0] for f in stack.split(";")]
+        own[frames[-1]] += count
+        for name in set(frames):
+            total[name] += count
+    return [(name, n, total[name]) for name, n in own.most_common(top)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the hottest functions of a request profile")
+    parser.add_argument("profile")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    with open(args.profile) as f:
+        profile = json.load(f)
+    print(f"[*] {profile['service']} {profile['endpoint']}: batch of {profile['batch_size']}, "
+          f"{profile['duration_ms']:.1f} ms, model {profile['model_version']}, {profile['samples']} samples")
+    print(f"{'self %':>7} {'total %':>8}  function")
+    for name, own, total in summarize(profile, args.top):
+        print(f"{100 * own / max(profile['samples'], 1):>7.1f} {100 * total / max(profile['samples'], 1):>8.1f}  {name}")
@@ -0,0 +1,285 @@
+"""
+Fixed-memory streaming sketches.
+
+QuantileSketch is a mergeable relative-error quantile sketch (DDSketch-style
+logarithmic buckets): every quantile it returns is within relative_accuracy of
+the true value, memory is capped at max_bins buckets per sign, and batches are
+added with vectorized NumPy bucketing.
+
+CountMinSketch estimates per-value counts of a categorical stream in a fixed
+depth x width table (estimates never undercount, and overcount by at most
+about 2 * total / width with high probability). HeavyHitters keeps the top-k
+values of the stream on top of one. Values are hashed by their string form
+with a keyless blake2b digest, so sketches saved by one process can be queried
+by another, and a batch only hashes its distinct values.
+
+Reservoir keeps a uniform random sample of k rows of a stream of row blocks
+(Algorithm L): after the first k rows, only the rows that enter the sample cost
+any work, about k * log(n / k) of them over n rows.
+"""
+
+import math
+import hashlib
+from collections import Counter
+import numpy as np
+
+RELATIVE_ACCURACY = 0.01
+MAX_BINS = 2048
+MIN_VALUE = 1e-9
+CMS_WIDTH = 2048
+CMS_DEPTH = 4
+TOP_K = 32
+HASH_CACHE_SIZE = 65536
+
+_hash_cache = {}
+
+
+def _hash(value: str) -> int:
+    h = _hash_cache.get(value)
+    if h is None:
+        if len(_hash_cache) >= HASH_CACHE_SIZE:
+            _hash_cache.clear()
+        h = _hash_cache[value] = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "little")
+    return h
+
+
+def hash_values(values) -> np.ndarray:
+    """Stable uint64 hash of each value's string form."""
+    return np.fromiter((_hash(str(v)) for v in values), dtype=np.uint64, count=len(values))
+
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY, max_bins: int = MAX_BINS,
+                 min_value: float = MIN_VALUE):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+        self.min_value = min_value
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def __len__(self):
+        return self.count
+
+    def add(self, values):
+        """Add a batch of values; NaN and infinite values are ignored."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        near_zero = np.abs(values) < self.min_value
+        self.zero_count += int(near_zero.sum())
+        for store, magnitudes in ((self.positive, values[~near_zero & (values > 0)]),
+                                  (self.negative, -values[~near_zero & (values < 0)])):
+            if len(magnitudes):
+                keys, counts = np.unique(np.ceil(np.log(magnitudes) / self.log_gamma).astype(np.int64),
+                                         return_counts=True)
+                for key, n in zip(keys.tolist(), counts.tolist()):
+                    store[key] = store.get(key, 0) + n
+                self._collapse(store)
+
+    def _collapse(self, store: dict):
+        # Fold the smallest magnitudes together: accuracy is kept for the tails
+        excess = len(store) - self.max_bins
+        if excess > 0:
+            keys = sorted(store)
+            merged = sum(store.pop(k) for k in keys[:excess])
+            store[keys[excess]] += merged
+
+    def merge(self, other: "QuantileSketch"):
+        """Fold another sketch with the same accuracy into this one."""
+        if not math.isclose(self.gamma, other.gamma):
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, n in other_store.items():
+                store[key] = store.get(key, 0) + n
+            self._collapse(store)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _ordered_bins(self):
+        """Bucket representative values in ascending order with their counts."""
+        neg_keys = np.fromiter(self.negative, dtype=np.int64, count=len(self.negative))
+        neg_counts = np.fromiter(self.negative.values(), dtype=np.int64, count=len(self.negative))
+        pos_keys = np.fromiter(self.positive, dtype=np.int64, count=len(self.positive))
+        pos_counts = np.fromiter(self.positive.values(), dtype=np.int64, count=len(self.positive))
+        neg_order = np.argsort(-neg_keys)
+        pos_order = np.argsort(pos_keys)
+        scale = 2 / (self.gamma + 1)
+        values = np.concatenate([-scale * self.gamma ** neg_keys[neg_order].astype(np.float64), [0.0],
+                                 scale * self.gamma ** pos_keys[pos_order].astype(np.float64)])
+        counts = np.concatenate([neg_counts[neg_order], [self.zero_count], pos_counts[pos_order]])
+        return values, np.cumsum(counts)
+
+    def quantiles(self, qs) -> list:
+        """Approximate values at each quantile in qs (NaN when the sketch is empty)."""
+        if self.count == 0:
+            return [float("nan")] * len(qs)
+        values, cumulative = self._ordered_bins()
+        ranks = np.asarray(qs, dtype=np.float64) * (self.count - 1)
+        idx = np.searchsorted(cumulative, ranks, side="right")
+        return np.clip(values[np.minimum(idx, len(values) - 1)], self.min, self.max).tolist()
+
+    def cdf(self, values) -> np.ndarray:
+        """Approximate fraction of added values <= each of values."""
+        values = np.asarray(values, dtype=np.float64)
+        if self.count == 0:
+            return np.full(values.shape, np.nan)
+        bins, cumulative = self._ordered_bins()
+        idx = np.searchsorted(bins, values, side="right")
+        below = np.where(idx > 0, cumulative[np.maximum(idx - 1, 0)], 0)
+        return below / self.count
+
+    def quantile(self, q: float) -> float:
+        return self.quantiles([q])[0]
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else float("nan")
+
+
+class CountMinSketch:
+    def __init__(self, width: int = CMS_WIDTH, depth: int = CMS_DEPTH, seed: int = 0):
+        # Multiply-shift hashing needs a power-of-two width
+        self.width = 1 << max(1, int(width - 1).bit_length())
+        self.depth = depth
+        self.shift = np.uint64(64 - int(math.log2(self.width)))
+        rng = np.random.default_rng(seed)
+        self.multipliers = rng.integers(1, 2**63, size=depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.table = np.zeros((depth, self.width), dtype=np.int64)
+        self.count = 0
+
+    def _columns(self, hashes: np.ndarray) -> np.ndarray:
+        return (hashes[None, :] * self.multipliers[:, None]) >> self.shift
+
+    def add_hashes(self, hashes: np.ndarray, counts: np.ndarray = None):
+        counts = np.ones(len(hashes), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        for row, columns in enumerate(self._columns(hashes)):
+            self.table[row] += np.bincount(columns.astype(np.intp), weights=counts,
+                                           minlength=self.width).astype(np.int64)
+        self.count += int(counts.sum())
+
+    def query_hashes(self, hashes: np.ndarray) -> np.ndarray:
+        if len(hashes) == 0:
+            return np.zeros(0, dtype=np.int64)
+        columns = self._columns(hashes).astype(np.intp)
+        return self.table[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+    def add(self, values):
+        self.add_hashes(hash_values(values))
+
+    def query(self, values) -> np.ndarray:
+        return self.query_hashes(hash_values(values))
+
+    def merge(self, other: "CountMinSketch"):
+        if self.table.shape != other.table.shape or not np.array_equal(self.multipliers, other.multipliers):
+            raise ValueError("Cannot merge count-min sketches with different shapes or seeds")
+        self.table += other.table
+        self.count += other.count
+        return self
+
+
+class HeavyHitters:
+    """Top-k most frequent values of a categorical stream, backed by a count-min sketch."""
+
+    def __init__(self, k: int = TOP_K, width: int = CMS_WIDTH, depth: int = CMS_DEPTH):
+        self.k = k
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates = {}  # hash -> value
+
+    @property
+    def count(self) -> int:
+        return self.sketch.count
+
+    def add(self, values) -> tuple:
+        """Add a batch; returns its distinct hashes and their counts."""
+        batch = Counter(values)
+        if not all(type(v) is str for v in batch):
+            batch = Counter(map(str, values))
+        labels = list(batch)
+        hashes = hash_values(labels)
+        order = np.argsort(hashes)
+        distinct = hashes[order]
+        counts = np.fromiter(batch.values(), dtype=np.int64, count=len(labels))[order]
+        self.sketch.add_hashes(distinct, counts)
+
+        known = np.fromiter(self.candidates, dtype=np.uint64, count=len(self.candidates))
+        pool = np.union1d(known, distinct)
+        estimates = self.sketch.query_hashes(pool)
+        if len(pool) > self.k:
+            pool = pool[np.argpartition(-estimates, self.k - 1)[:self.k]]
+        position = np.searchsorted(distinct, pool)
+        self.candidates = {
+            h: self.candidates[h] if h in self.candidates else labels[order[i]]
+            for h, i in zip(pool.tolist(), position.tolist())
+        }
+        return distinct, counts
+
+    def estimate_hashes(self, hashes: np.ndarray) -> np.ndarray:
+        return self.sketch.query_hashes(np.asarray(hashes, dtype=np.uint64))
+
+    def merge(self, other: "HeavyHitters"):
+        """Fold another heavy-hitters sketch (same width, depth and seed) into this one."""
+        self.sketch.merge(other.sketch)
+        candidates = {**other.candidates, **self.candidates}
+        pool = np.fromiter(candidates, dtype=np.uint64, count=len(candidates))
+        if len(pool) > self.k:
+            pool = pool[np.argpartition(-self.sketch.query_hashes(pool), self.k - 1)[:self.k]]
+        self.candidates = {h: candidates[h] for h in pool.tolist()}
+        return self
+
+    def top(self, k: int = None) -> list:
+        """[(value, estimated count)] in descending order."""
+        hashes = np.fromiter(self.candidates, dtype=np.uint64, count=len(self.candidates))
+        estimates = self.sketch.query_hashes(hashes)
+        order = np.argsort(-estimates, kind="stable")[:k or self.k]
+        return [(self.candidates[int(hashes[i])], int(estimates[i])) for i in order]
+
+
+class Reservoir:
+    def __init__(self, k: int, n_features: int, dtype=np.float32, seed=None):
+        self.k = k
+        self.rows = np.empty((k, n_features), dtype=dtype)
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+        self._w = 1.0
+        self._next = None
+
+    def __len__(self):
+        return min(self.seen, self.k)
+
+    def _skip(self) -> int:
+        """Rows until the next one that enters the sample (1 = the very next)."""
+        self._w *= math.exp(math.log(1.0 - self._rng.random()) / self.k)
+        if self._w >= 1.0:
+            return 1
+        return math.floor(math.log(1.0 - self._rng.random()) / math.log1p(-self._w)) + 1
+
+    def add(self, X: np.ndarray):
+        start, end = self.seen, self.seen + len(X)
+        if start < self.k:
+            take = min(self.k - start, len(X))
+            self.rows[start:start + take] = X[:take]
+            if start + take == self.k:
+                self._next = self.k - 1 + self._skip()
+        while self._next is not None and self._next < end:
+            self.rows[int(self._rng.random() * self.k)] = X[self._next - start]
+            self._next += self._skip()
+        self.seen = end
+
+    def sample(self) -> np.ndarray:
+        return self.rows[:len(self)]
@@ -0,0 +1,251 @@
+"""
+Windowed per-entity activity features.
+
+A WindowFeatures engine follows a few entity fields of the event stream (a
+source IP, a user, an agent, ...) and gives every event, in addition to its
+own fields, how active its entities were just before it:
+
+    <entity>_events_<w>          events of that entity value in the last w
+    <entity>_distinct_dest_<w>   distinct destinations it reached in the last w
+
+for w in 1m / 5m / 60m, the event itself included. Events without a value for
+an entity ('N/A', 'missing', ...) get 0 for its features.
+
+Both kinds of state are fixed in size and updated in O(1) per event:
+
+    counts    one ring of WINDOW_BUCKETS sub-buckets per window, so a window
+              slides in steps of 1/WINDOW_BUCKETS of its length (5s for 1m)
+    distinct  DISTINCT_REGISTERS registers per entity value holding the last
+              time a destination hashed into them; the registers not touched
+              within w give a linear-counting estimate of the distinct
+              destinations in w (exact-ish for small counts, saturates at
+              about m * ln(m), 266 for m = 64)
+
+Entity values are kept in one LRU table per entity field, at most
+MAX_ENTITIES each; an evicted value starts from zero when it comes back.
+
+The same engine serves training and scoring: the offline scripts build a
+fresh one and pass the whole history in time order, the APIs keep one per
+process and fold every scored batch into it (arrival time unless the events
+carry a timestamp), so a freshly started API sees an empty history. peek()
+gives the same features without folding the events in, for endpoints that
+score events another endpoint already counts.
+"""
+
+import math
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from common.sketches import _hash
+
+WINDOWS = {"1m": 60.0, "5m": 300.0, "60m": 3600.0}
+WINDOW_BUCKETS = 12
+DISTINCT_REGISTERS = 64
+MAX_ENTITIES = 4096
+MISSING_VALUES = {"", "N/A", "missing", "-", "nan", "None"}
+
+
+def window_feature_names(entities, distinct=(), windows=WINDOWS) -> list:
+    """Output columns for these entity names, distinct destinations for those in distinct."""
+    names = [f"{entity}_events_{label}" for entity in entities for label in windows]
+    names += [f"{entity}_distinct_dest_{label}" for entity in entities if entity in distinct for label in windows]
+    return names
+
+
+class _EntityState:
+    """Counting rings and distinct-destination registers of one entity value."""
+    __slots__ = ("counts", "heads", "totals", "registers")
+
+    def __init__(self, n_windows: int, registers: int):
+        self.counts = [[0] * WINDOW_BUCKETS for _ in range(n_windows)]
+        self.heads = [None] * n_windows
+        self.totals = [0] * n_windows
+        self.registers = np.full(registers, -np.inf) if registers else None
+
+
+class WindowFeatures:
+    def __init__(self, entities: dict, destination: str = None, distinct=None, windows: dict = WINDOWS,
+                 max_entities: int = MAX_ENTITIES, registers: int = DISTINCT_REGISTERS):
+        """
+        entities maps each feature prefix to the event field holding the entity
+        (e.g. {"src_ip": "src_ip", "agent": "agent_name"}); distinct lists the
+        prefixes that also count distinct values of the destination field
+        (default: all of them when a destination is given).
+        """
+        self.entities = dict(entities)
+        self.destination = destination
+        self.distinct = [] if destination is None else list(self.entities if distinct is None else distinct)
+        self.windows = dict(windows)
+        self.widths = [seconds / WINDOW_BUCKETS for seconds in self.windows.values()]
+        self.max_entities = max_entities
+        self.registers = 1 << max(0, int(registers - 1).bit_length())
+        self.feature_names = window_feature_names(self.entities, self.distinct, self.windows)
+        self.tables = {entity: OrderedDict() for entity in self.entities}
+        self.stats = {"events": 0, "peeked": 0, "late_events": 0, "evicted": 0}
+        self._lock = threading.Lock()
+
+    # --- Per event ---
+    def _state(self, entity: str, value, fold: bool = True) -> _EntityState:
+        table = self.tables[entity]
+        state = table.get(value)
+        if not fold:
+            # Read-only: an unseen value gets a throwaway empty state
+            return state or _EntityState(len(self.widths), self.registers if entity in self.distinct else 0)
+        if state is None:
+            state = table[value] = _EntityState(len(self.widths), self.registers if entity in self.distinct else 0)
+            if len(table) > self.max_entities:
+                table.popitem(last=False)
+                self.stats["evicted"] += 1
+        else:
+            table.move_to_end(value)
+        return state
+
+    def _count(self, state: _EntityState, t: float, fold: bool = True) -> list:
+        """Add one event at time t to every window; returns the window totals."""
+        if not fold:
+            return self._peek_count(state, t)
+        for i, width in enumerate(self.widths):
+            bucket = math.floor(t / width)
+            head = state.heads[i]
+            counts = state.counts[i]
+            if head is None or bucket - head >= WINDOW_BUCKETS:
+                counts[:] = [0] * WINDOW_BUCKETS
+                state.totals[i] = 0
+                state.heads[i] = head = bucket
+            elif bucket > head:
+                for step in range(head + 1, bucket + 1):
+                    state.totals[i] -= counts[step % WINDOW_BUCKETS]
+                    counts[step % WINDOW_BUCKETS] = 0
+                state.heads[i] = head = bucket
+            elif head - bucket >= WINDOW_BUCKETS:
+                continue  # older than the window: nothing left to count it in
+            counts[bucket % WINDOW_BUCKETS] += 1
+            state.totals[i] += 1
+        return state.totals
+
+    def _peek_count(self, state: _EntityState, t: float) -> list:
+        """The totals _count would return for an event at time t, leaving state as it is."""
+        totals = []
+        for i, width in enumerate(self.widths):
+            bucket = math.floor(t / width)
+            head = state.heads[i]
+            if head is None or bucket - head >= WINDOW_BUCKETS:
+                total = 1
+            elif bucket > head:
+                expired = sum(state.counts[i][step % WINDOW_BUCKETS] for step in range(head + 1, bucket + 1))
+                total = state.totals[i] - expired + 1
+            elif head - bucket >= WINDOW_BUCKETS:
+                total = state.totals[i]
+            else:
+                total = state.totals[i] + 1
+            totals.append(total)
+        return totals
+
+    def _distinct(self, state: _EntityState, destination, t: float, fold: bool = True) -> list:
+        """Register the destination at time t; returns the distinct estimate per window."""
+        registers = state.registers if fold else state.registers.copy()
+        if destination is not None:
+            slot = _hash(destination) & (self.registers - 1)
+            registers[slot] = max(registers[slot], t)
+        now = max(t, float(registers.max()))
+        m = self.registers
+        estimates = []
+        for seconds in self.windows.values():
+            empty = m - int(np.count_nonzero(registers > now - seconds))
+            estimates.append(round(m * math.log(m / empty) if empty else m * math.log(m), 1))
+        return estimates
+
+    def update(self, events, timestamps=None) -> np.ndarray:
+        """
+        Fold events (a DataFrame or a list of dicts) into the windows, in time
+        order, and return their features as a float32 (n_events, n_features)
+        array in input order. timestamps are datetimes or epoch seconds per event
+        (None: now); events with no valid timestamp are not counted and get NaN.
+        """
+        return self._features(events, timestamps, fold=True)
+
+    def peek(self, events, timestamps=None) -> np.ndarray:
+        """update()'s features for events, each counted on its own, without folding any of them in."""
+        return self._features(events, timestamps, fold=False)
+
+    def _features(self, events, timestamps, fold: bool) -> np.ndarray:
+        n = len(events)
+        times = _epoch_seconds(timestamps, n)
+        columns = {field: _column(events, field, n) for field in set(self.entities.values())}
+        destinations = _column(events, self.destination, n) if self.destination else None
+        entities = list(self.entities.items())
+        distinct_offset = len(self.entities) * len(self.windows)
+        n_windows = len(self.windows)
+
+        features = np.zeros((n, len(self.feature_names)), dtype=np.float32)
+        features[np.isnan(times)] = np.nan
+        with self._lock:
+            for i in np.argsort(times, kind="stable"):
+                t = times[i]
+                if t != t:
+                    continue  # NaT sorts last
+                destination = None
+                if destinations is not None and not _is_missing(destinations[i]):
+                    destination = str(destinations[i])
+                distinct_column = distinct_offset
+                for e, (entity, field) in enumerate(entities):
+                    value = columns[field][i]
+                    is_distinct = entity in self.distinct
+                    if not _is_missing(value):
+                        state = self._state(entity, str(value), fold)
+                        features[i, e * n_windows:(e + 1) * n_windows] = self._count(state, t, fold)
+                        if is_distinct:
+                            features[i, distinct_column:distinct_column + n_windows] = \
+                                self._distinct(state, destination, t, fold)
+                    if is_distinct:
+                        distinct_column += n_windows
+                self.stats["events" if fold else "peeked"] += 1
+            if fold:
+                self.stats["late_events"] += int(np.count_nonzero(np.diff(times[~np.isnan(times)]) < 0))
+        return features
+
+    def update_frame(self, df: pd.DataFrame, timestamps=None, fold: bool = True) -> pd.DataFrame:
+        """update() (peek() with fold=False) as a DataFrame of the feature columns, indexed like df."""
+        features = self._features(df, timestamps, fold)
+        return pd.DataFrame(features, index=df.index, columns=self.feature_names)
+
+    def report(self) -> dict:
+        """Events seen, entity values tracked per field and evictions."""
+        with self._lock:
+            return {
+                **self.stats,
+                "tracked": {entity: len(table) for entity, table in self.tables.items()},
+                "max_entities": self.max_entities,
+                "windows": list(self.windows),
+                "features": len(self.feature_names),
+            }
+
+
+def _is_missing(value) -> bool:
+    return value is None or value != value or str(value) in MISSING_VALUES
+
+
+def _column(events, field: str, n: int):
+    if isinstance(events, pd.DataFrame):
+        return events[field].to_numpy(dtype=object) if field in events.columns else [None] * n
+    return [event.get(field) for event in events]
+
+
+def _epoch_seconds(timestamps, n: int) -> np.ndarray:
+    if timestamps is None:
+        return np.full(n, time.time())
+    if isinstance(timestamps, (list, tuple)):
+        now = time.time()
+        timestamps = [now if t is None else t for t in timestamps]
+    values = pd.Series(timestamps) if not isinstance(timestamps, pd.Series) else timestamps
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=np.float64, na_value=np.nan)
+    values = pd.to_datetime(values, errors="coerce")
+    if values.dt.tz is not None:
+        values = values.dt.tz_convert(None)
+    seconds = values.to_numpy(dtype="datetime64[ns]").astype(np.int64) / 1e9
+    seconds[values.isna().to_numpy()] = np.nan
+    return seconds
@@ -0,0 +1,302 @@
+"""
+Combined risk + anomaly scoring gateway.
+
+The dashboard scores related data twice: alerts on the SL service
+(/predict_risk/, port 8000) and logs on the UL service (/predict_anomaly/,
+port 8001). Each request is validated, framed and transformed in its own
+process, and each process holds its own copy of the artifacts. This service
+loads both models once and takes one unified event record per event:
+
+    POST /score_events/   [{alert fields..., log fields..., shared fields...}]
+
+The batch is validated once and turned into one DataFrame. The SL view
+(AlertInput's columns) and the UL view (the preprocessor's columns) are both
+column selections of that frame. The risk path (rule cascade, then the
+RandomForest on the alerts the rules leave) and the anomaly path
+(IsolationForest engine) then run on the same batch, on two threads when the
+batch is large enough for the overlap to pay for the hand-off. Each path
+takes its own allocation from the CPU budget. Every event gets both scores.
+
+Both views keep their own activity windows, as the two services do. Drift
+monitoring, the anomaly rollup, explanations and the live feeds stay with the
+per-model services. bench_gateway.py compares this path with the two-call
+one.
+
+Run from ai_backend/ (artifacts are read from SL/ and UL/):
+    python gateway.py
+    python trinetra.py serve gateway
+"""
+
+import os
+import sys
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+import joblib
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel
+
+# --- Paths ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SL_DIR = os.path.join(BASE_DIR, "SL")
+UL_DIR = os.path.join(BASE_DIR, "UL")
+sys.path.extend([SL_DIR, UL_DIR])
+
+from common.cpu_budget import cpu_budget
+from rules import RuleCascade
+from vocabulary import (categorical_dtypes, prepare_features, vocabulary_from_pipeline,
+                        window_features, WINDOW_FEATURES)
+from preprocessor import to_feature_matrix, fitted_window_features, map_logs_for_preprocessor
+from isofor_engine import IsolationForestEngine
+
+RISK_MODEL_PATH = os.path.join(SL_DIR, "random_forest_model.pkl")
+RULES_PATH = os.path.join(SL_DIR, "risk_rules.json")
+ANOMALY_MODEL_PATH = os.path.join(UL_DIR, "isolation_forest.pkl")
+PREPROCESSOR_PATH = os.path.join(UL_DIR, "preprocessor.pkl")
+
+# Below this many events the two paths run one after the other: a thread
+# hand-off costs more than the overlap saves on small batches
+CONCURRENT_MIN_EVENTS = 64
+ANOMALY_THREADS = 4
+
+# Unified event fields -> AlertInput fields (SL view), plus agent_name, from which agent_os is derived
+RISK_FIELDS = {
+    "alert_type_description": "alert_type_description", "severity": "severity", "src_ip": "src_ip",
+    "username": "username", "dest_ip": "dest_ip", "process": "process", "file_name": "file_name",
+    "port": "port", "hour": "logon_hour", "day_of_week": "day_of_week", "agent_os": "agent_os",
+    "agent_name": "agent_name",
+}
+# Unified event fields -> LogEntry fields (UL view); UL marks missing values as 'missing'
+ANOMALY_FIELDS = ["agent_name", "agent_ip", "data_alert_type", "hour", "day_of_week", "sca_score",
+                  "sca_total_checks", "win_system_eventID", "username", "src_ip"]
+ANOMALY_MISSING = {"N/A": "missing"}
+
+app = FastAPI(
+    title="Trinetra Scoring Gateway",
+    description="Risk and anomaly scores for unified event records in one call."
+)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Global state
+risk_model = None
+feature_dtypes = None
+rule_cascade = None
+risk_windows = None
+anomaly_preprocessor = None
+anomaly_engine = None
+anomaly_windows = None
+anomaly_executor = ThreadPoolExecutor(max_workers=ANOMALY_THREADS, thread_name_prefix="gateway-anomaly")
+
+stats_lock = threading.Lock()
+stats = {"requests": 0, "events": 0, "concurrent": 0, "rules_decided": 0,
+         "parse_ms": 0.0, "risk_ms": 0.0, "anomaly_ms": 0.0, "total_ms": 0.0}
+
+
+def load_models():
+    """Load both models, the rule table and the UL preprocessor from their service directories."""
+    global risk_model, feature_dtypes, rule_cascade, risk_windows
+    global anomaly_preprocessor, anomaly_engine, anomaly_windows
+    for path, script in ((RISK_MODEL_PATH, "SL/train_model.py"), (ANOMALY_MODEL_PATH, "UL/train_isofor.py"),
+                         (PREPROCESSOR_PATH, "UL/preprocessor.py")):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"'{path}' not found. Please run {script} first")
+
+    print(f"[*] Loading risk model from '{RISK_MODEL_PATH}'...")
+    risk_model = joblib.load(RISK_MODEL_PATH)
+    risk_model.named_steps["classifier"].n_jobs = None  # workers come from the CPU budget
+    feature_dtypes = categorical_dtypes(vocabulary_from_pipeline(risk_model))
+    rule_cascade = RuleCascade.load(RULES_PATH)
+    risk_windows = window_features()
+
+    print(f"[*] Loading anomaly model from '{ANOMALY_MODEL_PATH}'...")
+    anomaly_preprocessor = joblib.load(PREPROCESSOR_PATH)
+    anomaly_engine = IsolationForestEngine(joblib.load(ANOMALY_MODEL_PATH))
+    anomaly_windows = fitted_window_features(anomaly_preprocessor)
+    print("[+] Models loaded successfully")
+
+
+class EventInput(BaseModel):
+    # Shared by both views
+    agent_name: str = "N/A"
+    src_ip: str = "N/A"
+    username: str = "N/A"
+    hour: int
+    day_of_week: str
+    timestamp: Optional[float] = None  # epoch seconds; default: time of arrival
+    # Alert fields (risk model)
+    alert_type_description: str
+    severity: int
+    dest_ip: str = "N/A"
+    process: str = "N/A"
+    file_name: str = "N/A"
+    port: str = "N/A"
+    agent_os: Optional[str] = None  # default: from agent_name, as in process_clean_data
+    # Log fields (anomaly model)
+    agent_ip: str = "missing"
+    data_alert_type: str = "missing"
+    sca_score: float = 0.0
+    sca_total_checks: int = 0
+    win_system_eventID: int = 0
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "agent_name": "WIN-SRV01",
+                "src_ip": "192.168.1.20",
+                "username": "admin",
+                "hour": 3,
+                "day_of_week": "Monday",
+                "alert_type_description": "Multiple failed RDP login attempts",
+                "severity": 7,
+                "port": "3389",
+                "agent_ip": "10.0.0.2",
+                "data_alert_type": "win",
+                "win_system_eventID": 4625
+            }
+        }
+
+
+def agent_os(agent_names: pd.Series) -> pd.Series:
+    """Windows / Linux / Unknown from the agent name (process_clean_data's rule)."""
+    os_names = pd.Series("Unknown", index=agent_names.index, dtype=object)
+    os_names[agent_names.str.contains("WIN", case=False, na=False)] = "Windows"
+    os_names[agent_names.str.contains("LINUX", case=False, na=False)] = "Linux"
+    return os_names
+
+
+def score_risk(events: List[EventInput], frame: pd.DataFrame, timestamps: list, cascade: bool) -> tuple:
+    """Risk scores (0-1), high-risk flags and the deciding stage per event, as /predict_risk/ computes them."""
+    view = frame[list(RISK_FIELDS)].rename(columns=RISK_FIELDS)
+    view["agent_os"] = view["agent_os"].fillna(agent_os(view["agent_name"]))
+    window_values = risk_windows.update(view, timestamps)
+    if cascade:
+        decisions, ambiguous = rule_cascade.split(events)
+    else:
+        decisions, ambiguous = [None] * len(events), list(range(len(events)))
+
+    predictions = np.zeros(len(events), dtype=bool)
+    risk_scores = np.zeros(len(events))
+    for i, decision in enumerate(decisions):
+        if decision is not None:
+            predictions[i], risk_scores[i] = decision[0], decision[1] / 100
+
+    if ambiguous:
+        model_start = time.perf_counter()
+        input_df = view.iloc[ambiguous].reset_index(drop=True)
+        input_df[WINDOW_FEATURES] = window_values[ambiguous]
+        input_df = prepare_features(input_df, feature_dtypes)
+        with cpu_budget().allocate("gateway_risk"):
+            X = risk_model.named_steps["preprocessor"].transform(input_df)
+            classifier = risk_model.named_steps["classifier"]
+            probabilities = classifier.predict_proba(X)
+        predictions[ambiguous] = classifier.classes_[probabilities.argmax(axis=1)].astype(bool)
+        risk_scores[ambiguous] = probabilities[:, 1]
+        rule_cascade.record_model(len(ambiguous), (time.perf_counter() - model_start) * 1e3)
+    decided_by = ["model" if decision is None else "rules" for decision in decisions]
+    return risk_scores, predictions, decided_by
+
+
+def score_anomaly(frame: pd.DataFrame, timestamps: list) -> tuple:
+    """IsolationForest scores and labels per event, as /predict_anomaly/ computes them."""
+    view = frame[ANOMALY_FIELDS].replace({col: ANOMALY_MISSING for col in ("agent_name", "username", "src_ip")})
+    df_mapped = map_logs_for_preprocessor(view, anomaly_windows, timestamps)
+    X = to_feature_matrix(anomaly_preprocessor.transform(df_mapped))
+    with cpu_budget().allocate("gateway_anomaly"):
+        return anomaly_engine.score(X)
+
+
+def _timed(func, *args) -> tuple:
+    start = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start) * 1e3
+
+
+@app.on_event("startup")
+def startup_event():
+    load_models()
+
+
+@app.post("/score_events/")
+def score_events(events: List[EventInput], cascade: bool = True, concurrent: Optional[bool] = None):
+    """
+    Risk and anomaly scores per event. The two models run on separate threads
+    when concurrent=true, or by default when the batch has at least
+    CONCURRENT_MIN_EVENTS events and the CPU budget has more than one core.
+    """
+    if risk_model is None or anomaly_engine is None:
+        raise HTTPException(status_code=500, detail="Models not loaded. Server startup failed.")
+    try:
+        start = time.perf_counter()
+        frame = pd.DataFrame([event.dict() for event in events])
+        timestamps = frame["timestamp"].tolist()
+        parse_ms = (time.perf_counter() - start) * 1e3
+
+        if concurrent is None:
+            concurrent = len(events) >= CONCURRENT_MIN_EVENTS and cpu_budget().cores > 1
+        if concurrent:
+            anomaly_future = anomaly_executor.submit(_timed, score_anomaly, frame, timestamps)
+            (risk_scores, predictions, decided_by), risk_ms = _timed(score_risk, events, frame, timestamps, cascade)
+            (anomaly_scores, anomaly_labels), anomaly_ms = anomaly_future.result()
+        else:
+            (risk_scores, predictions, decided_by), risk_ms = _timed(score_risk, events, frame, timestamps, cascade)
+            (anomaly_scores, anomaly_labels), anomaly_ms = _timed(score_anomaly, frame, timestamps)
+
+        results = [
+            {
+                "event_index": i,
+                "is_high_risk": bool(predictions[i]),
+                "risk_score": round(risk_scores[i] * 100, 2),
+                "decided_by": decided_by[i],
+                "anomaly_score": float(anomaly_scores[i]),
+                "anomaly_label": int(anomaly_labels[i]),
+            }
+            for i in range(len(events))
+        ]
+        with stats_lock:
+            stats["requests"] += 1
+            stats["events"] += len(events)
+            stats["concurrent"] += int(concurrent)
+            stats["rules_decided"] += decided_by.count("rules")
+            stats["parse_ms"] += parse_ms
+            stats["risk_ms"] += risk_ms
+            stats["anomaly_ms"] += anomaly_ms
+            stats["total_ms"] += (time.perf_counter() - start) * 1e3
+        return results
+
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Scoring failed: {e}")
+
+
+@app.get("/gateway/stats/")
+def gateway_stats():
+    """Requests and events scored, and mean time per request in parsing and in each model path."""
+    with stats_lock:
+        report = dict(stats)
+    for key in ("parse_ms", "risk_ms", "anomaly_ms", "total_ms"):
+        report[f"{key}_mean"] = report[key] / report["requests"] if report["requests"] else 0.0
+    report["cascade"] = rule_cascade.report() if rule_cascade is not None else None
+    return report
+
+
+@app.get("/cpu/stats/")
+def cpu_stats():
+    """CPU budget of this worker: cores in use, and allocations and wait times per call."""
+    return cpu_budget().stats()
+
+
+if __name__ == "__main__":
+    uvicorn.run("gateway:app", host="0.0.0.0", port=8002, reload=True)
@@ -0,0 +1,386 @@
+"""
+End-to-end HTTP load test for the risk scoring (SL) and anomaly (UL) services
+and the combined scoring gateway.
+
+Starts a service locally with uvicorn, replays generated AlertInput / LogEntry
+payloads the way the dashboard sends them (JSON lists, one request per batch)
+at a configurable concurrency, endpoint mix and batch-size mix, then reports
+p50/p95/p99 latency, throughput, error rate and server RSS. Passing several
+--workers values sweeps uvicorn worker counts to find the saturation point.
+
+Examples:
+    python loadtest.py --service ul --concurrency 8 --batch-mix 1:0.5,20:0.4,500:0.1
+    python loadtest.py --service sl --workers 1 2 4 --duration 20
+    python loadtest.py --service sl --url http://localhost:8000   # already running
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+# --- Paths ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_FILE = os.path.join(BASE_DIR, "loadtest_results.csv")
+
+SERVICES = {
+    "sl": {
+        "dir": os.path.join(BASE_DIR, "SL"),
+        "app": "api:app",
+        "port": 8000,
+        "endpoints": {"predict_risk": "/predict_risk/", "predict_single": "/predict_single/"},
+        "default_mix": "predict_risk:0.8,predict_single:0.2",
+    },
+    "ul": {
+        "dir": os.path.join(BASE_DIR, "UL"),
+        "app": "api_ul:app",
+        "port": 8001,
+        "endpoints": {"predict_anomaly": "/predict_anomaly/", "train_anomaly": "/train_anomaly/"},
+        # train_anomaly overwrites UL/isolation_forest.pkl: only in mixes asked for explicitly
+        "default_mix": "predict_anomaly:1",
+    },
+    "gateway": {
+        "dir": BASE_DIR,
+        "app": "gateway:app",
+        "port": 8002,
+        "endpoints": {"score_events": "/score_events/"},
+        "default_mix": "score_events:1",
+    },
+}
+
+STARTUP_TIMEOUT = 120
+RSS_INTERVAL = 0.2
+TRAIN_BATCH = 200
+
+# Value pools mirroring the dashboard's simulated alerts and mock logs
+ALERT_TYPES = ["Multiple failed SSH login attempts", "Malware detected", "Port scan detected",
+               "Privilege escalation attempt", "Suspicious PowerShell execution", "Brute force attack"]
+SEVERITIES = [3, 5, 7, 9]
+USERNAMES = ["admin", "root", "jdoe", "asmith", "svc_backup", "guest", "Unknown"]
+PROCESSES = ["N/A", "sshd", "powershell.exe", "cmd.exe", "nginx", "svchost.exe"]
+PORTS = ["N/A", "22", "80", "443", "3389", "445"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+AGENT_OS = ["Windows", "Linux", "Unknown"]
+AGENT_NAMES = ["WIN-SRV01", "WIN-WS02", "LINUX-WEB", "LINUX-DB"]
+LOG_ALERT_TYPES = ["sca", "win", "vuln", "N/A"]
+EVENT_IDS = [4624, 4625, 4634, 4688, 7036, 0]
+
+
+# --- Payloads ---
+def make_alert(rng: random.Random) -> dict:
+    """One AlertInput as built by SOCmain.tsx."""
+    return {
+        "alert_type_description": rng.choice(ALERT_TYPES),
+        "severity": rng.choice(SEVERITIES),
+        "src_ip": f"192.168.{rng.randint(0, 3)}.{rng.randint(1, 254)}",
+        "username": rng.choice(USERNAMES),
+        "dest_ip": rng.choice(["N/A", f"10.0.0.{rng.randint(1, 20)}"]),
+        "process": rng.choice(PROCESSES),
+        "file_name": "N/A",
+        "port": rng.choice(PORTS),
+        "logon_hour": rng.randint(0, 23),
+        "day_of_week": rng.choice(DAYS),
+        "agent_os": rng.choice(AGENT_OS),
+    }
+
+
+def make_log(rng: random.Random) -> dict:
+    """One LogEntry as built by AnomalyDetector.tsx."""
+    return {
+        "agent_name": rng.choice(AGENT_NAMES),
+        "agent_ip": f"10.0.0.{rng.randint(1, 8)}",
+        "data_alert_type": rng.choice(LOG_ALERT_TYPES),
+        "hour": rng.randint(0, 23),
+        "day_of_week": rng.choice(DAYS),
+        "sca_score": round(rng.uniform(0, 100), 1),
+        "sca_total_checks": rng.randint(0, 300),
+        "win_system_eventID": rng.choice(EVENT_IDS),
+    }
+
+
+def make_event(rng: random.Random) -> dict:
+    """One unified event for the gateway: an alert and the log of the same agent, user and time."""
+    alert, log = make_alert(rng), make_log(rng)
+    alert["agent_os"] = "Windows" if log["agent_name"].startswith("WIN") else "Linux"
+    event = {**alert, **log}
+    event["hour"] = event.pop("logon_hour")
+    return event
+
+
+def split_event(event: dict) -> tuple:
+    """The AlertInput and LogEntry the two-call path sends for one unified event."""
+    alert = {key: event[key] for key in ("alert_type_description", "severity", "src_ip", "username", "dest_ip",
+                                         "process", "file_name", "port", "day_of_week", "agent_os")}
+    alert["logon_hour"] = event["hour"]
+    log = {key: event[key] for key in ("agent_name", "agent_ip", "data_alert_type", "hour", "day_of_week",
+                                       "sca_score", "sca_total_checks", "win_system_eventID", "username", "src_ip")}
+    if event.get("timestamp") is not None:
+        alert["timestamp"] = log["timestamp"] = event["timestamp"]
+    return alert, log
+
+
+PAYLOAD_MAKERS = {
+    "predict_risk": make_alert, "predict_single": make_alert,
+    "predict_anomaly": make_log, "train_anomaly": make_log,
+    "score_events": make_event,
+}
+
+
+def make_payload(endpoint: str, batch_size: int, rng: random.Random):
+    maker = PAYLOAD_MAKERS[endpoint]
+    if endpoint == "predict_single":
+        return maker(rng)
+    return [maker(rng) for _ in range(batch_size)]
+
+
+def parse_mix(spec: str, cast=str) -> tuple:
+    """'a:0.7,b:0.3' -> ([a, b], [0.7, 0.3])."""
+    values, weights = [], []
+    for item in spec.split(","):
+        value, _, weight = item.partition(":")
+        values.append(cast(value.strip()))
+        weights.append(float(weight or 1))
+    return values, weights
+
+
+# --- Service process ---
+def _children(pid: int) -> list:
+    pids = []
+    task_dir = f"/proc/{pid}/task"
+    for tid in os.listdir(task_dir) if os.path.isdir(task_dir) else []:
+        try:
+            with open(os.path.join(task_dir, tid, "children")) as f:
+                pids.extend(int(p) for p in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def process_tree_rss(pid: int) -> int:
+    """Resident set size in bytes of a process and all its descendants (Linux /proc)."""
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+        stack.extend(_children(current))
+    return total
+
+
+class RSSSampler(threading.Thread):
+    """Samples the server's process-tree RSS in the background and keeps the peak."""
+
+    def __init__(self, pid: int, interval: float = RSS_INTERVAL):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak = max(self.peak, process_tree_rss(self.pid))
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> int:
+        self._stop_event.set()
+        if self.ident is not None:  # never started when the run failed before load began
+            self.join()
+        return self.peak
+
+
+def wait_until_ready(base_url: str, timeout: float = STARTUP_TIMEOUT):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/openapi.json", timeout=2):
+                return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.5)
+    raise TimeoutError(f"Service at {base_url} not ready after {timeout}s")
+
+
+def start_service(service: str, workers: int, port: int) -> subprocess.Popen:
+    """Launch the service with uvicorn from its own directory (models load by relative path)."""
+    spec = SERVICES[service]
+    cmd = [sys.executable, "-m", "uvicorn", spec["app"], "--host", "127.0.0.1",
+           "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    print(f"[*] Starting {service.upper()} service with {workers} worker(s) on port {port}...")
+    proc = subprocess.Popen(cmd, cwd=spec["dir"])
+    try:
+        wait_until_ready(f"http://127.0.0.1:{port}")
+    except TimeoutError:
+        stop_service(proc)
+        raise
+    print("[+] Service ready")
+    return proc
+
+
+def stop_service(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+# --- Load generation ---
+def post_json(url: str, payload, timeout: float) -> int:
+    body = json.dumps(payload).encode()
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def prepare_service(service: str, base_url: str, seed: int):
+    """
+    The anomaly service needs a trained model before predictions succeed. It
+    is trained on synthetic logs only when it has none: training saves over
+    the service's isolation_forest.pkl.
+    """
+    if service == "ul":
+        rng = random.Random(seed)
+        if post_json(f"{base_url}/predict_anomaly/", make_payload("predict_anomaly", 1, rng), 120) == 200:
+            return
+        print("[*] No trained anomaly model, training one on synthetic logs...")
+        status = post_json(f"{base_url}/train_anomaly/", make_payload("train_anomaly", TRAIN_BATCH, rng), 120)
+        if status != 200:
+            print(f"[!] Warm-up training returned HTTP {status}")
+
+
+def run_load(service: str, base_url: str, endpoint_mix: str, batch_mix: str, concurrency: int,
+             duration: float, timeout: float = 30.0, seed: int = 42) -> pd.DataFrame:
+    """Closed-loop load: `concurrency` clients send requests back to back for `duration` seconds."""
+    endpoints, endpoint_weights = parse_mix(endpoint_mix)
+    batch_sizes, batch_weights = parse_mix(batch_mix, int)
+    paths = SERVICES[service]["endpoints"]
+    deadline = time.perf_counter() + duration
+
+    def client(client_id: int) -> list:
+        rng = random.Random(seed * 1000 + client_id)
+        records = []
+        while time.perf_counter() < deadline:
+            endpoint = rng.choices(endpoints, endpoint_weights)[0]
+            batch_size = 1 if endpoint == "predict_single" else rng.choices(batch_sizes, batch_weights)[0]
+            payload = make_payload(endpoint, batch_size, rng)
+            start = time.perf_counter()
+            try:
+                status = post_json(base_url + paths[endpoint], payload, timeout)
+            except Exception:
+                status = 0
+            records.append((endpoint, batch_size, status, time.perf_counter() - start))
+        return records
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = pool.map(client, range(concurrency))
+    return pd.DataFrame(
+        [r for records in results for r in records],
+        columns=["endpoint", "batch_size", "status", "latency_s"]
+    )
+
+
+def summarize(records: pd.DataFrame, duration: float) -> dict:
+    if records.empty:
+        return {"requests": 0}
+    ok = records["status"] == 200
+    latency_ms = records["latency_s"] * 1000
+    return {
+        "requests": len(records),
+        "throughput_rps": len(records) / duration,
+        "rows_per_s": records.loc[ok, "batch_size"].sum() / duration,
+        "error_rate": float((~ok).mean()),
+        "p50_ms": latency_ms.quantile(0.50),
+        "p95_ms": latency_ms.quantile(0.95),
+        "p99_ms": latency_ms.quantile(0.99),
+    }
+
+
+def find_saturation(report: pd.DataFrame, min_gain: float = 0.10):
+    """First worker count after which adding workers raises throughput by less than min_gain."""
+    throughput = report["throughput_rps"].tolist()
+    workers = report["workers"].tolist()
+    for i in range(1, len(throughput)):
+        if throughput[i] < throughput[i - 1] * (1 + min_gain):
+            return workers[i - 1]
+    return workers[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Trinetra scoring services")
+    parser.add_argument("--service", choices=list(SERVICES), required=True)
+    parser.add_argument("--url", default=None, help="target an already running service instead of starting one")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1], help="uvicorn worker counts to sweep")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds of load per run")
+    parser.add_argument("--endpoint-mix", default=None, help="e.g. predict_risk:0.8,predict_single:0.2 "
+                        "(train_anomaly replaces the UL service's saved model)")
+    parser.add_argument("--batch-mix", default="1:0.6,10:0.3,100:0.1", help="batch_size:weight,...")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    spec = SERVICES[args.service]
+    endpoint_mix = args.endpoint_mix or spec["default_mix"]
+    port = args.port or spec["port"]
+    worker_counts = [None] if args.url else args.workers
+
+    rows = []
+    for workers in worker_counts:
+        proc = None if args.url else start_service(args.service, workers, port)
+        base_url = args.url.rstrip("/") if args.url else f"http://127.0.0.1:{port}"
+        sampler = RSSSampler(proc.pid) if proc else None
+        try:
+            prepare_service(args.service, base_url, args.seed)
+            if sampler:
+                sampler.start()
+            print(f"[*] {args.concurrency} clients for {args.duration:.0f}s "
+                  f"(endpoints {endpoint_mix}, batches {args.batch_mix})...")
+            records = run_load(args.service, base_url, endpoint_mix, args.batch_mix,
+                               args.concurrency, args.duration, seed=args.seed)
+        finally:
+            peak_rss = sampler.stop() if sampler else None
+            if proc:
+                stop_service(proc)
+
+        row = {"service": args.service, "workers": workers, "concurrency": args.concurrency}
+        row.update(summarize(records, args.duration))
+        row["peak_rss_mib"] = peak_rss / 2**20 if peak_rss else None
+        rows.append(row)
+        for endpoint, group in records.groupby("endpoint"):
+            stats = summarize(group, args.duration)
+            print(f"    {endpoint:<16} {stats['requests']:>6} req  p50 {stats['p50_ms']:.1f} ms  "
+                  f"p99 {stats['p99_ms']:.1f} ms  errors {stats['error_rate']:.1%}")
+
+    report = pd.DataFrame(rows)
+    report.to_csv(args.out, index=False)
+    print("\n=== Load test results ===")
+    with pd.option_context("display.width", 200, "display.max_columns", None,
+                           "display.float_format", "{:.2f}".format):
+        print(report.to_string(index=False))
+    if len(report) > 1:
+        print(f"[+] Throughput saturates at {find_saturation(report)} worker(s)")
+    print(f"[+] Results saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
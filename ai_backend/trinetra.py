@@ -0,0 +1,151 @@
+"""
+Unified command line for the Trinetra AI backend.
+
+Every subcommand imports only what it needs, when it runs: `trinetra --help`
+and argument errors never touch pandas / sklearn / matplotlib, and each job
+pays only for its own dependencies. Scripts keep their own options, which are
+passed through after the subcommand.
+
+Examples:
+    python trinetra.py clean
+    python trinetra.py preprocess
+    python trinetra.py train isofor --no-plots
+    python trinetra.py evaluate all --detectors isolation_forest dbscan
+    python trinetra.py generate load --rows 1000000
+    python trinetra.py serve ul --workers 2
+    python trinetra.py serve gateway
+    python trinetra.py --profile-imports train risk
+"""
+
+import os
+import re
+import sys
+import time
+import runpy
+import argparse
+import subprocess
+
+# --- Paths ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SL_DIR = os.path.join(BASE_DIR, "SL")
+UL_DIR = os.path.join(BASE_DIR, "UL")
+
+# subcommand -> target -> (service directory, script)
+SCRIPTS = {
+    "clean": {"risk": (SL_DIR, "process_clean_data.py")},
+    "preprocess": {"logs": (UL_DIR, "preprocessor.py")},
+    "train": {
+        "risk": (SL_DIR, "train_model.py"),
+        "isofor": (UL_DIR, "train_isofor.py"),
+        "svm": (UL_DIR, "train_svm.py"),
+        "dbscan": (UL_DIR, "train_dbscan.py"),
+        "ensemble": (UL_DIR, "ensemble.py"),
+    },
+    "evaluate": {
+        "isofor": (UL_DIR, "evaluate_isofor.py"),
+        "svm": (UL_DIR, "evaluate_svm.py"),
+        "dbscan": (UL_DIR, "evaluate_dbscan.py"),
+        "all": (UL_DIR, "evaluate_all.py"),
+    },
+    "generate": {
+        "synthetic": (UL_DIR, "generate_synthetic.py"),
+        "load": (UL_DIR, "generate_load.py"),
+    },
+}
+
+SERVICES = {
+    "sl": (SL_DIR, "api:app", 8000),
+    "ul": (UL_DIR, "api_ul:app", 8001),
+    "gateway": (BASE_DIR, "gateway:app", 8002),
+}
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+TOP_IMPORTS = 15
+
+
+def run_script(directory: str, script: str, args: list):
+    """Run a backend script as __main__ from its own directory (SL scripts use relative paths)."""
+    os.chdir(directory)
+    sys.path.insert(0, directory)
+    sys.argv = [script] + args
+    runpy.run_path(os.path.join(directory, script), run_name="__main__")
+
+
+def serve(service: str, host: str, port: int, workers: int, reload: bool):
+    import uvicorn
+
+    directory, app, default_port = SERVICES[service]
+    os.chdir(directory)
+    sys.path.insert(0, directory)
+    uvicorn.run(app, host=host, port=port or default_port, workers=workers, reload=reload, app_dir=directory)
+
+
+def profile_imports(argv: list):
+    """Re-run the command under `-X importtime` and summarise the slowest top-level imports."""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", os.path.abspath(__file__)] + argv,
+                          stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - start
+
+    imports, other = [], []
+    for line in proc.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append((int(cumulative_us), int(self_us), len(indent) // 2, name))
+        elif not line.startswith("import time:"):
+            other.append(line)
+    if other:
+        print("\n".join(other), file=sys.stderr)
+
+    top_level = sorted((i for i in imports if i[2] == 0), reverse=True)
+    total_ms = sum(i[0] for i in top_level) / 1e3
+    print(f"\n=== Import profile: {' '.join(argv)} ===")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative, self_time, _, name in top_level[:TOP_IMPORTS]:
+        print(f"{cumulative / 1e3:>14.1f} {self_time / 1e3:>9.1f}  {name}")
+    print(f"[+] {len(imports)} modules imported in {total_ms:.0f} ms of {wall * 1e3:.0f} ms wall time")
+    return proc.returncode
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="trinetra", description="Trinetra AI backend command line")
+    parser.add_argument("--profile-imports", action="store_true",
+                        help="report import times of the command instead of only running it")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for command, targets in SCRIPTS.items():
+        sub = commands.add_parser(command, help=f"{command} ({', '.join(targets)})")
+        if len(targets) == 1:
+            sub.set_defaults(target=next(iter(targets)))
+        else:
+            sub.add_argument("target", choices=list(targets))
+
+    sub = commands.add_parser("serve", help="serve a scoring API with uvicorn (sl, ul, gateway)")
+    sub.add_argument("service", choices=list(SERVICES))
+    sub.add_argument("--host", default="0.0.0.0")
+    sub.add_argument("--port", type=int, default=None)
+    sub.add_argument("--workers", type=int, default=1)
+    sub.add_argument("--reload", action="store_true")
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args, passthrough = parser.parse_known_args(argv)
+
+    if args.profile_imports:
+        sys.exit(profile_imports([a for a in argv if a != "--profile-imports"]))
+
+    if args.command == "serve":
+        if passthrough:
+            parser.error(f"unrecognized arguments: {' '.join(passthrough)}")
+        serve(args.service, args.host, args.port, args.workers, args.reload)
+    else:
+        directory, script = SCRIPTS[args.command][args.target]
+        run_script(directory, script, passthrough)
+
+
+if __name__ == "__main__":
+    main()